@@ -1,14 +1,266 @@
-from dash import Dash, html, dcc, Input, Output, dash_table
+from dash import Dash, html, dcc, Input, Output, State, Patch, dash_table, no_update
+from flask import Response, g, jsonify, request, send_file
+import contextvars
+import fcntl
+import hmac
 import io
+import itertools
+import json
+import logging
+import numpy as np
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime
 from dash.dash_table.Format import Format, Group, Scheme, Symbol
 import uuid
+import bisect
+import os
+import threading
+import time
+import hashlib
+import tempfile
+import operator
+import re
+import sys
+import urllib.error
+import urllib.request
+from urllib.parse import urlencode
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field, replace
+from functools import cached_property
+import pyarrow as pa
+import pyarrow.feather as feather
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+from openpyxl.utils import get_column_letter
+
+# URL da exportação CSV do Google Sheets (SHEET_URL permite apontar para o servidor_planilha.py local)
+sheet_url = os.environ.get('SHEET_URL', "https://docs.google.com/spreadsheets/d/19G1wYQUda-zjrtUMaKnksVhhnIujHr1UezcV5Z9IMAg/export?format=csv&gid=0")
+
+# Tempo (em segundos) em que os dados carregados ficam válidos no cache do servidor
+CACHE_TTL_SEGUNDOS = float(os.environ.get('CACHE_TTL_SEGUNDOS', '60'))
+
+# Intervalo (em segundos) entre as buscas da planilha feitas em segundo plano
+INTERVALO_ATUALIZACAO_SEGUNDOS = float(os.environ.get('INTERVALO_ATUALIZACAO_SEGUNDOS', '60'))
+
+# Tempo máximo de espera pelo download da planilha
+TIMEOUT_DOWNLOAD_SEGUNDOS = float(os.environ.get('TIMEOUT_DOWNLOAD_SEGUNDOS', '30'))
+
+# Quantos conjuntos de alterações entre versões consecutivas ficam guardados
+HISTORICO_ALTERACOES = 20
+
+# Limites do cache de figuras já serializadas (compartilhado entre sessões)
+CACHE_FIGURAS_ENTRADAS = int(os.environ.get('CACHE_FIGURAS_ENTRADAS', '256'))
+CACHE_FIGURAS_MB = float(os.environ.get('CACHE_FIGURAS_MB', '32'))
+
+# Limites do cache de linhas filtradas (compartilhado entre sessões e callbacks)
+CACHE_VISOES_ENTRADAS = int(os.environ.get('CACHE_VISOES_ENTRADAS', '32'))
+CACHE_VISOES_MB = float(os.environ.get('CACHE_VISOES_MB', '128'))
+
+# Limites do cache das tabelas montadas (registros de todas as páginas de uma combinação de filtros)
+CACHE_TABELAS_ENTRADAS = int(os.environ.get('CACHE_TABELAS_ENTRADAS', '8'))
+CACHE_TABELAS_MB = float(os.environ.get('CACHE_TABELAS_MB', '128'))
+
+# Cópia local do último snapshot bom: servida na partida do servidor e quando a planilha está inacessível
+DIRETORIO_CACHE = os.environ.get('DIRETORIO_CACHE', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache_dados'))
+ARQUIVO_SNAPSHOT = os.path.join(DIRETORIO_CACHE, 'snapshot.arrow')
+
+# Com vários workers, só um (eleito por trava de arquivo) busca a planilha; os demais leem
+# o snapshot que ele grava e verificam a cada tantos segundos se há uma geração nova.
+# Desligado por padrão; o gunicorn.conf.py o liga para os workers do servidor
+DADOS_COMPARTILHADOS = os.environ.get('DADOS_COMPARTILHADOS', '0') == '1'
+INTERVALO_LEITURA_COMPARTILHADA_SEGUNDOS = float(os.environ.get('INTERVALO_LEITURA_COMPARTILHADA_SEGUNDOS', '2'))
+
+# Intervalos (em ms) com que o navegador verifica se há uma nova versão dos dados
+INTERVALO_VERIFICACAO_MS = 60*1000
+INTERVALO_VERIFICACAO_INICIAL_MS = 2*1000
+
+# Linhas por página da tabela de contas (paginada no servidor)
+TAMANHO_PAGINA_TABELA = 100
+
+# Quantas execuções da carga dos dados (com as etapas medidas) ficam disponíveis em /admin/carga
+HISTORICO_EXECUCOES = int(os.environ.get('HISTORICO_EXECUCOES', '50'))
+
+# Token exigido pelas rotas /admin (cabeçalho X-Admin-Token ou ?token=); sem ele, só acessos locais
+TOKEN_ADMIN = os.environ.get('TOKEN_ADMIN')
+
+# Logs em texto com campos chave=valor; os mesmos campos seguem em `registro` para handlers estruturados.
+# Só o logger do dashboard é configurado: importar o módulo (gunicorn, testes, benchmarks) não mexe no
+# logger raiz de quem o importa
+logger = logging.getLogger('dashboard')
+if not logger.handlers:
+    _handler_log = logging.StreamHandler()
+    _handler_log.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+    logger.addHandler(_handler_log)
+    logger.setLevel(os.environ.get('NIVEL_LOG', 'INFO'))
+    logger.propagate = False
 
-# URL do Google Sheets
-sheet_url = "https://docs.google.com/spreadsheets/d/19G1wYQUda-zjrtUMaKnksVhhnIujHr1UezcV5Z9IMAg/export?format=csv&gid=0"
+# ----------------------------
+# Métricas (expostas em /metrics no formato texto do Prometheus)
+# ----------------------------
+# Limites dos histogramas de duração (segundos) e de tamanho (bytes)
+LIMITES_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+LIMITES_BYTES = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+class Metricas:
+    """Contadores e histogramas com rótulos, mantidos em memória no processo.
+
+    Registrar uma observação é só uma busca em dicionário e um bisect sob um
+    lock; o texto do Prometheus é montado apenas quando /metrics é lido. Com
+    vários workers, cada processo expõe as próprias métricas.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._definicoes = {}  # nome -> (tipo, ajuda, limites)
+        self._valores = {}  # nome -> {rótulos: valor ou [contagens por limite..., soma]}
+        self._coletores = []  # funções chamadas na leitura, que devolvem métricas calculadas na hora
+
+    def declarar(self, nome, tipo, ajuda, limites=None):
+        self._definicoes[nome] = (tipo, ajuda, limites)
+        self._valores[nome] = {}
+
+    def incrementar(self, nome, valor=1, **rotulos):
+        chave = tuple(sorted(rotulos.items()))
+        with self._lock:
+            serie = self._valores[nome]
+            serie[chave] = serie.get(chave, 0) + valor
+
+    def observar(self, nome, valor, **rotulos):
+        limites = self._definicoes[nome][2]
+        chave = tuple(sorted(rotulos.items()))
+        with self._lock:
+            serie = self._valores[nome]
+            contagens = serie.get(chave)
+            if contagens is None:
+                contagens = serie[chave] = [0] * (len(limites) + 2)  # limites, +Inf e soma
+            contagens[bisect.bisect_left(limites, valor)] += 1
+            contagens[-1] += valor
+
+    def coletor(self, funcao):
+        """Registra `funcao()`, que devolve [(nome, tipo, ajuda, [(rótulos, valor), ...]), ...] a cada leitura."""
+        self._coletores.append(funcao)
+        return funcao
+
+    def valor(self, nome, **rotulos):
+        """Valor de um contador (ou [contagens..., soma] de um histograma); 0 se não houver."""
+        with self._lock:
+            return self._valores[nome].get(tuple(sorted(rotulos.items())), 0)
+
+    def texto(self):
+        """Todas as métricas no formato de exposição em texto do Prometheus (versão 0.0.4)."""
+        linhas = []
+        with self._lock:
+            valores = {nome: dict(serie) for nome, serie in self._valores.items()}
+        for nome, (tipo, ajuda, limites) in self._definicoes.items():
+            linhas += [f"# HELP {nome} {ajuda}", f"# TYPE {nome} {tipo}"]
+            for chave, valor in sorted(valores[nome].items()):
+                if tipo != 'histogram':
+                    linhas.append(f"{nome}{formatar_rotulos(chave)} {valor}")
+                    continue
+                acumulado = 0
+                for limite, contagem in zip(limites + ('+Inf',), valor):
+                    acumulado += contagem
+                    linhas.append(f"{nome}_bucket{formatar_rotulos(chave + (('le', str(limite)),))} {acumulado}")
+                linhas.append(f"{nome}_sum{formatar_rotulos(chave)} {valor[-1]}")
+                linhas.append(f"{nome}_count{formatar_rotulos(chave)} {acumulado}")
+        for coletor in self._coletores:
+            for nome, tipo, ajuda, amostras in coletor():
+                linhas += [f"# HELP {nome} {ajuda}", f"# TYPE {nome} {tipo}"]
+                linhas += [f"{nome}{formatar_rotulos(tuple(sorted(rotulos.items())))} {valor}"
+                           for rotulos, valor in amostras]
+        return "\n".join(linhas) + "\n"
+
+def formatar_rotulos(pares):
+    """Rótulos no formato {a="1",b="2"} (vazio se não houver), com aspas e barras escapadas."""
+    if not pares:
+        return ''
+    escapados = (str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, valor in pares)
+    return '{' + ','.join(f'{nome}="{valor}"' for (nome, _), valor in zip(pares, escapados)) + '}'
+
+metricas = Metricas()
+metricas.declarar('dashboard_callback_chamadas_total', 'counter', 'Chamadas de callbacks do Dash.')
+metricas.declarar('dashboard_callback_erros_total', 'counter', 'Chamadas de callbacks que terminaram em erro (HTTP 5xx).')
+metricas.declarar('dashboard_callback_duracao_segundos', 'histogram',
+                  'Duração das chamadas de callbacks, do recebimento à resposta.', LIMITES_SEGUNDOS)
+metricas.declarar('dashboard_callback_requisicao_bytes', 'histogram',
+                  'Tamanho do corpo enviado pelo navegador a cada callback.', LIMITES_BYTES)
+metricas.declarar('dashboard_callback_resposta_bytes', 'histogram',
+                  'Tamanho da resposta de cada callback.', LIMITES_BYTES)
+metricas.declarar('dashboard_etapa_duracao_segundos', 'histogram',
+                  'Duração das etapas da carga dos dados.', LIMITES_SEGUNDOS)
+metricas.declarar('dashboard_etapa_erros_total', 'counter', 'Etapas da carga dos dados que levantaram exceção.')
+metricas.declarar('dashboard_csv_linhas_descartadas_total', 'counter',
+                  'Linhas do CSV da planilha descartadas por terem mais colunas que o cabeçalho.')
+
+# ----------------------------
+# Rastreamento da carga dos dados
+# ----------------------------
+execucao_atual = contextvars.ContextVar('execucao_atual', default=None)
+execucoes_carga = deque(maxlen=HISTORICO_EXECUCOES)  # execuções mais recentes, da mais antiga para a mais nova
+lock_execucoes = threading.Lock()
+
+def formatar_campos(campos):
+    """Campos de um registro de log no formato chave=valor."""
+    return ' '.join(f"{chave}={valor}" for chave, valor in campos.items() if valor is not None)
+
+@contextmanager
+def medir_etapa(etapa, **detalhes):
+    """Mede uma etapa da carga dos dados.
+
+    A duração vai para as métricas (e as falhas são contadas), a etapa é
+    registrada num log estruturado e, se houver uma execução em curso (ver
+    execucao_carga), entra na lista de etapas dela. O dicionário devolvido
+    recebe os detalhes da etapa, como linhas e bytes processados.
+    """
+    inicio = time.perf_counter()
+    erro = None
+    try:
+        yield detalhes
+    except Exception as e:
+        erro = f"{type(e).__name__}: {e}"
+        metricas.incrementar('dashboard_etapa_erros_total', etapa=etapa)
+        raise
+    finally:
+        duracao = time.perf_counter() - inicio
+        metricas.observar('dashboard_etapa_duracao_segundos', duracao, etapa=etapa)
+        registro = {'etapa': etapa, 'duracao_ms': round(duracao * 1000, 2), **detalhes, 'erro': erro}
+        execucao = execucao_atual.get()
+        if execucao is not None:
+            execucao['etapas'].append(registro)
+        logger.log(logging.WARNING if erro else logging.INFO, formatar_campos(registro), extra={'registro': registro})
+
+@contextmanager
+def execucao_carga(origem):
+    """Agrupa as etapas medidas durante uma atualização dos dados numa execução.
+
+    Ao final, a execução (com as etapas, a duração e o resultado preenchido
+    por quem a conduz) é guardada em execucoes_carga, que mantém as últimas
+    HISTORICO_EXECUCOES. Execuções sem nenhuma etapa (um leitor do snapshot
+    compartilhado que não encontrou geração nova) não são guardadas.
+    """
+    execucao = {'inicio': datetime.now().isoformat(timespec='milliseconds'), 'origem': origem,
+                'resultado': None, 'etapas': []}
+    token = execucao_atual.set(execucao)
+    inicio = time.perf_counter()
+    try:
+        yield execucao
+    finally:
+        execucao_atual.reset(token)
+        execucao['duracao_ms'] = round((time.perf_counter() - inicio) * 1000, 2)
+        if execucao['etapas']:
+            with lock_execucoes:
+                execucoes_carga.append(execucao)
+            resumo = {k: v for k, v in execucao.items() if k != 'etapas'}
+            logger.info('carga %s', formatar_campos(resumo), extra={'registro': resumo})
+
+def historico_execucoes():
+    """Execuções guardadas, da mais recente para a mais antiga."""
+    with lock_execucoes:
+        return list(reversed(execucoes_carga))
 
 app = Dash(__name__)
 
@@ -99,6 +351,12 @@ app.layout = html.Div([
         'width': '100%'
     }),
 
+    # De quando são os dados exibidos e o que mudou na planilha desde a atualização anterior
+    html.Div(id='dados-de', style={'textAlign': 'right', 'fontSize': '12px', 'color': '#666',
+                                   'marginTop': '-24px'}),
+    html.Div(id='indicador-alteracoes', style={'textAlign': 'right', 'fontSize': '12px', 'color': '#666',
+                                               'marginBottom': '12px'}),
+
     # KPIs principais
     html.Div([
         html.Div([
@@ -350,9 +608,15 @@ app.layout = html.Div([
                     'color': 'black'
                 }
             ],
-            page_action='none',
-            sort_action='native',
-            filter_action='native',
+            # Paginação, ordenação e filtro feitos no servidor: só a página visível vai ao navegador
+            page_action='custom',
+            page_current=0,
+            page_size=TAMANHO_PAGINA_TABELA,
+            page_count=1,
+            sort_action='custom',
+            sort_by=[],
+            filter_action='custom',
+            filter_query='',
             fixed_rows={'headers': True}
         )
     ], style={'marginBottom': '30px'}),
@@ -390,7 +654,7 @@ app.layout = html.Div([
 
     dcc.Interval(
         id='intervalo-atualizacao',
-        interval=60*1000,
+        interval=INTERVALO_VERIFICACAO_MS,
         n_intervals=0
     ),
     
@@ -400,6 +664,12 @@ app.layout = html.Div([
     # Store para armazenar o ID da sessão do usuário
     dcc.Store(id='session-id', storage_type='session'),
 
+    # O que o navegador está exibindo (versão dos dados e filtros) na tabela e nos gráficos,
+    # para que uma atualização dos dados envie só o que mudou. Ficam em memória: ao
+    # recarregar a página os componentes voltam vazios e tudo é enviado de novo.
+    dcc.Store(id='estado-tabela'),
+    dcc.Store(id='estado-graficos'),
+
     # Botões de impressão e exportação
     html.Div([
         html.Button('Exportar para Excel', id='btn-export-excel', n_clicks=0,
@@ -414,7 +684,7 @@ app.layout = html.Div([
         html.Div(id='print-output', style={'display': 'none'}),
         html.Div(id='print-table-output', style={'display': 'none'}),
         html.Div(id='export-excel-output', style={'display': 'none'}),
-        dcc.Download(id='download-excel')
+        dcc.Store(id='url-exportacao-excel')
     ], style={'textAlign': 'right', 'marginTop': '20px'})
     ], id='main-content', style={
         'width': '100%', 
@@ -428,117 +698,1322 @@ app.layout = html.Div([
 # ----------------------------
 # Funções utilitárias
 # ----------------------------
-def format_brl(valor):
-    """Formata número float em R$ com vírgula como decimal."""
+def format_brl(valor, centavos=False):
+    """Formata número float em R$ com vírgula como decimal.
+
+    Com centavos=True, `valor` é um inteiro em centavos (colunas *_centavos)
+    e a formatação é feita com aritmética inteira, sem arredondamento.
+    """
     try:
+        if centavos:
+            valor = int(valor)
+            reais, resto = divmod(abs(valor), 100)
+            sinal = '-' if valor < 0 else ''
+            return f"R$ {sinal}{reais:,}".replace(',', '.') + f",{resto:02d}"
         return f"R$ {float(valor):,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
     except:
         return "R$ 0,00"
 
-def carregar_dados():
-    """Carrega e processa os dados das contas a pagar."""
+def converter_brl_centavos(serie):
+    """Converte textos como 'R$ 1.234,56' em centavos exatos (int64), de forma vetorizada.
+
+    Os textos viram uma matriz de códigos de caracteres e os dígitos são
+    acumulados coluna a coluna, em uma única passada, sem regex por valor.
+    Como na conversão anterior, só dígitos, vírgula e sinal de menos contam
+    ('.' e 'R$' são ignorados); valores vazios ou inválidos viram 0.
+    """
+    texto = np.asarray(serie.fillna('').astype(str).to_numpy(), dtype='U')
+    if len(texto) == 0 or texto.itemsize == 0:
+        return pd.Series(0, index=serie.index, dtype='int64')
+    # Uma linha por posição de caractere; caracteres não ASCII viram 255 (ignorados)
+    codigos = texto.view(np.uint32).reshape(len(texto), -1)
+    chars = np.ascontiguousarray(np.minimum(codigos, 255).astype(np.uint8).T)
+    largura = chars.shape[0]
+
+    digito = (chars >= 48) & (chars <= 57)
+    virgula = chars == 44
+    menos = chars == 45
+    posicoes = np.arange(largura)[:, None]
+
+    # Posição da vírgula decimal (ou além do fim, se não houver)
+    pos_virgula = np.where(virgula.any(axis=0), virgula.argmax(axis=0), largura)
+    casas = (digito & (posicoes > pos_virgula)).sum(axis=0)
+
+    valor = np.zeros(len(texto), dtype=np.int64)
+    for j in range(largura):
+        valor = np.where(digito[j], valor * 10 + (chars[j] - 48), valor)
+
+    # Ajustar para duas casas decimais (arredondando a terceira, se existir)
+    centavos = valor * np.where(casas == 0, 100, np.where(casas == 1, 10, 1))
+    excesso = casas > 2
+    if excesso.any():
+        divisor = 10 ** (casas[excesso] - 2)
+        centavos[excesso] = (valor[excesso] + divisor // 2) // divisor
+
+    # Válido: no máximo uma vírgula, pelo menos um dígito e o '-' só antes de tudo
+    primeiro = np.where(digito | virgula, posicoes, largura).min(axis=0)
+    pos_menos = np.where(menos.any(axis=0), menos.argmax(axis=0), -1)
+    valido = (
+        (virgula.sum(axis=0) <= 1)
+        & digito.any(axis=0)
+        & (menos.sum(axis=0) <= 1)
+        & (pos_menos < primeiro)
+    )
+    centavos = np.where(pos_menos >= 0, -centavos, centavos)
+    return pd.Series(np.where(valido, centavos, 0), index=serie.index, dtype='int64')
+
+# Colunas da planilha, todas lidas como texto: valores monetários e datas vêm
+# formatados em pt-BR e são convertidos nas etapas seguintes do carregamento
+COLUNAS_PLANILHA = [
+    'Nome Fantasia Filial', 'Nome Fantasia Agente', 'Prorrogado', 'Tipo Doc.', 'Número Doc.',
+    'AP', 'Retenção IR', 'Líquido', 'Saldo em Aberto', 'Complemento'
+]
+ESQUEMA_CSV = {coluna: str for coluna in COLUNAS_PLANILHA}
+COLUNAS_MONETARIAS = ['Retenção IR', 'Líquido', 'Saldo em Aberto']
+COLUNAS_CATEGORICAS = ['Nome Fantasia Filial', 'Nome Fantasia Agente', 'Tipo Doc.', 'Mes', 'Data_fmt', 'Complemento']
+
+class IndiceFiltros:
+    """Índice invertido dos filtros da tela, montado uma vez por snapshot.
+
+    Para cada dimensão (tipo de documento, fornecedor e mês) guarda, por
+    valor, a lista ordenada das posições das linhas; para o status guarda
+    os mapas de bits de 'aberto' e 'liquidado'. Uma combinação de filtros
+    parte da menor lista e confere os demais critérios só nessas posições,
+    sem copiar nem varrer o DataFrame inteiro.
+    """
+
+    DIMENSOES = {'tipo_doc': 'Tipo Doc.', 'fornecedor': 'Nome Fantasia Agente', 'mes': 'Mes'}
+
+    def __init__(self, df):
+        self.total = len(df)
+        self._dimensoes = {}
+        for coluna in self.DIMENSOES.values():
+            if coluna not in df.columns:
+                continue
+            serie = df[coluna] if isinstance(df[coluna].dtype, pd.CategoricalDtype) else df[coluna].astype('category')
+            codigos = serie.cat.codes.to_numpy()
+            # Ordenar as posições pelo código (+1 para que "sem valor", -1, fique em primeiro)
+            deslocados = codigos.astype(np.int64) + 1
+            ordem = np.argsort(deslocados, kind='stable').astype(np.int32 if self.total < 2**31 else np.int64)
+            limites = np.concatenate([[0], np.cumsum(np.bincount(deslocados, minlength=len(serie.cat.categories) + 1))])
+            self._dimensoes[coluna] = (serie.cat.categories, codigos, ordem, limites)
+
+        self._status = {}
+        if 'Saldo em Aberto_centavos' in df.columns:
+            saldo = df['Saldo em Aberto_centavos'].to_numpy()
+            for status, bits in (('aberto', saldo > 0), ('liquidado', saldo == 0)):
+                self._status[status] = (np.flatnonzero(bits), bits)
+
+    def posicoes(self, tipo_doc=None, status=None, fornecedor=None, mes=None):
+        """Posições (ordenadas) das linhas que atendem aos filtros; None quando não há filtro."""
+        criterios = []
+        for nome, valor in (('tipo_doc', tipo_doc), ('fornecedor', fornecedor), ('mes', mes)):
+            coluna = self.DIMENSOES[nome]
+            if not valor or valor == 'todos' or coluna not in self._dimensoes:
+                continue
+            categorias, codigos, ordem, limites = self._dimensoes[coluna]
+            if valor not in categorias:
+                return np.empty(0, dtype=np.int64)
+            k = categorias.get_loc(valor)
+            criterios.append((ordem[limites[k + 1]:limites[k + 2]], codigos, k))
+
+        if status in self._status:
+            lista, bits = self._status[status]
+            criterios.append((lista, bits, True))
+
+        if not criterios:
+            return None
+        criterios.sort(key=lambda criterio: len(criterio[0]))
+        posicoes = criterios[0][0]
+        for _, valores, esperado in criterios[1:]:
+            posicoes = posicoes[valores[posicoes] == esperado]
+        return posicoes
+
+
+class VisaoFiltrada:
+    """Linhas selecionadas por um filtro; o DataFrame só é montado quando `df` é acessado.
+
+    Sem filtros, `df` é o próprio DataFrame do snapshot (compartilhado, não deve ser alterado).
+    """
+
+    def __init__(self, base, posicoes):
+        self._base = base
+        self.posicoes = posicoes
+
+    def __len__(self):
+        return len(self._base) if self.posicoes is None else len(self.posicoes)
+
+    @cached_property
+    def df(self):
+        if self.posicoes is None:
+            return self._base
+        return self._base.take(self.posicoes)
+
+
+class CuboKPI:
+    """Agregados dos cartões de KPI, materializados uma vez por snapshot.
+
+    Cada célula corresponde a uma combinação presente de mês, tipo de
+    documento, fornecedor e status (liquidado, aberto ou saldo negativo) e
+    guarda as somas em centavos de Líquido, do saldo em aberto e do valor
+    liquidado, além das contagens de documentos e de vencidos em aberto.
+    As células ficam ordenadas por mês, então uma consulta percorre só as
+    células do mês pedido, independentemente do número de linhas da planilha.
+    """
+
+    MEDIDAS = ('liquido', 'aberto', 'liquidado', 'documentos', 'vencidos')
+    STATUS = {'liquidado': 0, 'aberto': 1}
+    COLUNAS = ('Mes', 'Tipo Doc.', 'Nome Fantasia Agente', 'Líquido_centavos', 'Saldo em Aberto_centavos')
+
+    def __init__(self, df):
+        if df.empty or any(coluna not in df.columns for coluna in self.COLUNAS):
+            self._categorias = {coluna: pd.Index([]) for coluna in self.COLUNAS[:3]}
+            self._celulas = {coluna: np.empty(0, dtype=np.int64) for coluna in self.COLUNAS[:3] + ('status',)}
+            self._medidas = {medida: np.empty(0, dtype=np.int64) for medida in self.MEDIDAS}
+            self._limites_mes = np.zeros(1, dtype=np.int64)
+            return
+
+        self._categorias = {}
+        chaves = {}
+        for coluna in self.COLUNAS[:3]:
+            serie = df[coluna] if isinstance(df[coluna].dtype, pd.CategoricalDtype) else df[coluna].astype('category')
+            self._categorias[coluna] = serie.cat.categories
+            chaves[coluna] = serie.cat.codes.to_numpy().astype(np.int64)
+
+        liquido = df['Líquido_centavos'].to_numpy()
+        saldo = df['Saldo em Aberto_centavos'].to_numpy()
+        chaves['status'] = np.where(saldo == 0, 0, np.where(saldo > 0, 1, 2))
+        aberto = saldo > 0
+        vencido = df['Vencido'].to_numpy(dtype=bool, na_value=False) if 'Vencido' in df.columns else np.zeros(len(df), dtype=bool)
+
+        linhas = pd.DataFrame({
+            **chaves,
+            'liquido': liquido,
+            'aberto': np.where(aberto, saldo, 0),
+            'liquidado': np.where(saldo == 0, liquido, 0),
+            'documentos': np.ones(len(df), dtype=np.int64),
+            'vencidos': (vencido & aberto).astype(np.int64),
+        })
+        # groupby ordena pelas chaves (mês primeiro) e soma em int64, sem arredondamento
+        celulas = linhas.groupby(list(chaves), sort=True).sum().reset_index()
+
+        self._celulas = {coluna: celulas[coluna].to_numpy() for coluna in chaves}
+        self._medidas = {medida: celulas[medida].to_numpy() for medida in self.MEDIDAS}
+        # Fatia de células de cada mês (o código -1, sem data, fica antes do primeiro mês)
+        self._limites_mes = np.searchsorted(
+            self._celulas['Mes'], np.arange(-1, len(self._categorias['Mes']) + 1), side='left'
+        )
+
+    def __len__(self):
+        return len(self._celulas['status'])
+
+    def _codigo(self, coluna, valor):
+        """Código do valor na dimensão; None sem filtro e -2 para valor inexistente."""
+        if not valor or valor == 'todos':
+            return None
+        categorias = self._categorias[coluna]
+        return categorias.get_loc(valor) if valor in categorias else -2
+
+    def _selecionar(self, tipo_doc, status, fornecedor, mes):
+        """Fatia e máscara das células que atendem aos filtros (máscara None = todas)."""
+        codigo_mes = self._codigo('Mes', mes)
+        if codigo_mes == -2:
+            return slice(0, 0), None
+        if codigo_mes is None:
+            fatia = slice(0, len(self))
+        else:
+            fatia = slice(self._limites_mes[codigo_mes + 1], self._limites_mes[codigo_mes + 2])
+
+        mascara = None
+        for coluna, valor in (('Tipo Doc.', tipo_doc), ('Nome Fantasia Agente', fornecedor)):
+            codigo = self._codigo(coluna, valor)
+            if codigo is None:
+                continue
+            atende = self._celulas[coluna][fatia] == codigo
+            mascara = atende if mascara is None else mascara & atende
+        if status in self.STATUS:
+            atende = self._celulas['status'][fatia] == self.STATUS[status]
+            mascara = atende if mascara is None else mascara & atende
+        return fatia, mascara
+
+    def consultar(self, tipo_doc=None, status=None, fornecedor=None, mes=None):
+        """Totais (em centavos) e contagens das linhas que atendem aos mesmos filtros de filtrar_dataframe."""
+        fatia, mascara = self._selecionar(tipo_doc, status, fornecedor, mes)
+        totais = {}
+        for medida in self.MEDIDAS:
+            valores = self._medidas[medida][fatia]
+            totais[medida] = int(valores.sum() if mascara is None else valores[mascara].sum())
+        return totais
+
+    def meses_em_aberto_antes(self, mes_limite):
+        """Meses anteriores a `mes_limite` ('AAAA-MM') com documentos em aberto, e quantos documentos são."""
+        categorias = self._categorias['Mes']
+        if len(categorias) == 0:
+            return [], 0
+        anteriores = np.asarray(categorias.astype(str)) < mes_limite
+        fim = self._limites_mes[-1]
+        codigos = self._celulas['Mes'][:fim]
+        selecionadas = (codigos >= 0) & anteriores[np.maximum(codigos, 0)] & (self._celulas['status'][:fim] == 1)
+        meses = sorted(categorias[np.unique(codigos[selecionadas])].astype(str))
+        return meses, int(self._medidas['documentos'][:fim][selecionadas].sum())
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    """Um conjunto de dados carregado, identificado por uma versão curta.
+
+    Guarda também os validadores HTTP e o hash do CSV de origem, usados para
+    detectar que a planilha não mudou no próximo carregamento, o índice de
+    filtros e o cubo de KPIs, montados junto com o snapshot (fora das
+    threads dos callbacks).
+    """
+    versao: str
+    df: pd.DataFrame
+    carregado_em: datetime
+    hash_conteudo: str = None
+    etag: str = None
+    last_modified: str = None
+    origem: str = 'planilha'  # 'planilha' ou 'disco' (restaurado da cópia local)
+    verificado_em: datetime = None  # última confirmação de que a planilha não mudou
+    geracao: int = None  # geração do arquivo compartilhado de onde foi lido
+    indice: IndiceFiltros = field(default=None, repr=False, compare=False)
+    cubo: CuboKPI = field(default=None, repr=False, compare=False)
+
+    def __post_init__(self):
+        if self.indice is None:
+            object.__setattr__(self, 'indice', IndiceFiltros(self.df))
+        if self.cubo is None:
+            object.__setattr__(self, 'cubo', CuboKPI(self.df))
+
+    def filtrar(self, tipo_doc=None, status=None, fornecedor=None, mes=None):
+        """Aplica os filtros da tela usando o índice; retorna uma VisaoFiltrada."""
+        return VisaoFiltrada(self.df, self.indice.posicoes(tipo_doc, status, fornecedor, mes))
+
+    @cached_property
+    def documentos(self):
+        """Hashes de chave e de valores de cada linha, usados para comparar versões (calculados uma vez)."""
+        return identificar_documentos(self.df)
+
+def baixar_planilha(url, etag=None, last_modified=None):
+    """Baixa o CSV da planilha com requisição condicional.
+
+    Retorna (conteudo, etag, last_modified). O conteúdo é None quando o
+    servidor responde 304, ou seja, quando nada mudou desde o último download.
+    """
+    cabecalhos = {}
+    if etag:
+        cabecalhos['If-None-Match'] = etag
+    if last_modified:
+        cabecalhos['If-Modified-Since'] = last_modified
+    requisicao = urllib.request.Request(url, headers=cabecalhos)
+    try:
+        with urllib.request.urlopen(requisicao, timeout=TIMEOUT_DOWNLOAD_SEGUNDOS) as resposta:
+            return resposta.read(), resposta.headers.get('ETag'), resposta.headers.get('Last-Modified')
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            return None, etag, last_modified
+        raise
+
+def marcar_vencidos(df, hoje):
+    """Cria a coluna 'Vencido' comparando o vencimento com a data de referência."""
+    if 'Prorrogado' in df.columns:
+        df['Vencido'] = df['Prorrogado'] < pd.Timestamp(hoje)
+
+def compactar_dataframe(df):
+    """Converte as dimensões de baixa cardinalidade para o tipo 'category'.
+
+    Cada valor distinto fica guardado uma única vez e as linhas passam a
+    referenciá-lo por um código inteiro, o que reduz a memória e permite
+    filtrar comparando códigos em vez de textos.
+    """
+    for col in COLUNAS_CATEGORICAS:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+
+def relatorio_memoria(df):
+    """Uso de memória por coluna do snapshot, do maior para o menor."""
+    uso = df.memory_usage(deep=True, index=False)
+    return pd.DataFrame({
+        'coluna': uso.index,
+        'tipo': [str(df[col].dtype) for col in uso.index],
+        'bytes': uso.to_numpy(),
+    }).sort_values('bytes', ascending=False, ignore_index=True)
+
+def normalizar_datas(df, coluna='Prorrogado'):
+    """Converte as datas 'dd/mm/aaaa' e calcula, uma vez por snapshot, as colunas derivadas.
+
+    Cada texto de data distinto é interpretado uma única vez, com formato
+    explícito; só os que não seguem o formato passam pela leitura tolerante
+    (dayfirst). A partir das datas distintas são geradas:
+    'Mes' ('YYYY-MM'), 'Mes_Period', 'Mes_Num', 'Data_fmt' ('dd/mm/aaaa')
+    e 'Dia_Ord' (dias desde 1970-01-01, -1 quando não há data).
+    Os callbacks usam essas colunas e nunca voltam a interpretar datas.
+    """
+    codigos, unicos = pd.factorize(df[coluna])
+    textos = pd.Series(unicos, dtype=object)
+    datas = pd.to_datetime(textos, format='%d/%m/%Y', errors='coerce')
+    fora_do_formato = datas.isna() & textos.notna()
+    if fora_do_formato.any():
+        datas[fora_do_formato] = pd.to_datetime(textos[fora_do_formato], dayfirst=True, errors='coerce')
+
+    # Derivados calculados sobre as datas distintas (a última posição representa "sem data")
+    datas = pd.DatetimeIndex(datas).append(pd.DatetimeIndex([pd.NaT]))
+    periodos = datas.to_period('M')
+    dias = datas.to_numpy(dtype='datetime64[D]')
+    dia_ord = np.where(np.isnat(dias), -1, dias.astype(np.int64))
+    derivados = {
+        coluna: datas,
+        'Mes': periodos.astype(str),
+        'Mes_Period': periodos,
+        'Mes_Num': datas.month,
+        'Data_fmt': datas.strftime('%d/%m/%Y'),
+        'Dia_Ord': dia_ord,
+    }
+    for nome, valores in derivados.items():
+        df[nome] = pd.Series(valores.take(codigos) if hasattr(valores, 'take') else valores[codigos],
+                             index=df.index)
+
+def ler_csv(conteudo):
+    """Lê o CSV com o parser C e esquema explícito, bem mais rápido que o engine Python.
+
+    Devolve (DataFrame, linhas descartadas). O parser C não sabe contar as
+    linhas que pula, então qualquer problema (linha com colunas a mais, aspas
+    desbalanceadas) faz a leitura ser refeita com o parser tolerante, que
+    descarta e conta as linhas inválidas.
+    """
     try:
-        # Leitura robusta do CSV com tratamento de linhas inconsistentes
         df = pd.read_csv(
-            sheet_url,
-            skiprows=3,           # Ignora as 3 primeiras linhas
-            on_bad_lines='skip',  # Pula linhas com problemas
-            engine='python',      # Usa o engine Python para melhor tratamento de erros
-            encoding='utf-8',     # Especifica encoding
-            sep=','               # Especifica separador
+            io.BytesIO(conteudo),
+            skiprows=3,             # Ignora as 3 primeiras linhas
+            on_bad_lines='error',   # Linhas com problemas: ver ler_csv_tolerante
+            engine='c',
+            encoding='utf-8',
+            sep=',',
+            dtype=ESQUEMA_CSV
         )
-        
+    except pd.errors.ParserError as e:
+        logger.warning("Parser rápido falhou (%s); usando o parser tolerante", e)
+        return ler_csv_tolerante(conteudo)
+    return df, 0
+
+def ler_csv_tolerante(conteudo):
+    """Leitura robusta do CSV com o engine Python; devolve (DataFrame, linhas descartadas).
+
+    Linhas com mais colunas que o cabeçalho são descartadas, contadas no log
+    e na métrica dashboard_csv_linhas_descartadas_total: elas ficam fora dos
+    totais dos KPIs.
+    """
+    descartadas = []
+
+    def descartar(campos):
+        descartadas.append(campos)
+        return None
+
+    df = pd.read_csv(
+        io.BytesIO(conteudo),
+        skiprows=3,               # Ignora as 3 primeiras linhas
+        on_bad_lines=descartar,   # Pula (e conta) linhas com problemas
+        engine='python',          # Usa o engine Python para melhor tratamento de erros
+        encoding='utf-8',         # Especifica encoding
+        sep=',',                  # Especifica separador
+        dtype=ESQUEMA_CSV
+    )
+    if descartadas:
+        metricas.incrementar('dashboard_csv_linhas_descartadas_total', len(descartadas))
+        logger.warning("%d linha(s) do CSV descartada(s) por terem colunas a mais; a primeira: %s",
+                       len(descartadas), descartadas[0])
+    return df, len(descartadas)
+
+def processar_csv(conteudo):
+    """Interpreta o CSV baixado da planilha e aplica limpeza e normalização.
+
+    Cada fase é uma etapa medida (ver medir_etapa): leitura do CSV, corte no
+    'Total Geral', conversão de identificadores e valores, e derivação das
+    colunas de data, vencimento e categorias.
+    """
+    try:
+        with medir_etapa('leitura_csv', bytes=len(conteudo)) as etapa:
+            df, descartadas = ler_csv(conteudo)
+            etapa.update(linhas=len(df), colunas=len(df.columns), descartadas=descartadas)
+
         # Verificar se o DataFrame foi carregado corretamente
         if df.empty:
-            print("Aviso: DataFrame está vazio após o carregamento")
+            logger.warning("DataFrame está vazio após o carregamento")
             return pd.DataFrame()
-        
-        print(f"Dados carregados com sucesso: {len(df)} linhas, {len(df.columns)} colunas")
-        print(f"Colunas disponíveis: {list(df.columns)}")
+        logger.debug("Colunas disponíveis: %s", list(df.columns))
 
         # Filtrar dados: remover linhas a partir de "Total Geral" (inclusive)
-        if not df.empty and len(df.columns) > 0:
-            primeira_coluna = df.columns[0]
-            df[primeira_coluna] = df[primeira_coluna].astype(str)
-            
-            # Encontrar a primeira ocorrência de "Total Geral" (case insensitive)
-            total_geral_mask = df[primeira_coluna].str.contains('Total Geral', case=False, na=False)
-            total_geral_indices = df[total_geral_mask].index.tolist()
-            
-            if total_geral_indices:
-                # Pegar o primeiro índice onde aparece "Total Geral"
-                primeiro_total_geral = total_geral_indices[0]
-                # Filtrar o DataFrame para manter apenas as linhas antes de "Total Geral"
-                df = df.iloc[:primeiro_total_geral].copy()
-                print(f"Filtrado: removidas {len(df) - primeiro_total_geral} linhas a partir de 'Total Geral'")
-                print(f"Dados após filtro: {len(df)} linhas")
-
-        # Limpeza e normalização
-        if 'Tipo Doc.' in df.columns:
-            df['Tipo Doc.'] = df['Tipo Doc.'].astype(str).str.strip()
-
-        # Conversão robusta de valores monetários
-        for col in ['Retenção IR', 'Líquido', 'Saldo em Aberto']:
-            if col in df.columns:
-                df[col] = (
-                    df[col]
-                    .astype(str)
-                    .str.replace(r'[^\d,-]', '', regex=True)
-                    .str.replace('.', '', regex=False)
-                    .str.replace(',', '.', regex=False)
-                    .replace('', '0')
-                )
-                df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
-
-        # Conversão robusta de datas
-        if 'Prorrogado' in df.columns:
-            df['Prorrogado'] = pd.to_datetime(
-                df['Prorrogado'],
-                dayfirst=True,
-                errors='coerce'
-            )
-            
-            # Criar coluna de mês no formato 'YYYY-MM'
-            df['Mes'] = df['Prorrogado'].dt.to_period('M').astype(str)
-            
-            # Criar coluna de mês numérico para comparações
-            df['Mes_Num'] = df['Prorrogado'].dt.month
-
-        # Verificar contas vencidas
-        hoje = datetime.now().date()
-        if 'Prorrogado' in df.columns:
-            df['Vencido'] = df['Prorrogado'].dt.date < hoje
+        with medir_etapa('corte_total_geral', linhas=len(df)) as etapa:
+            if not df.empty and len(df.columns) > 0:
+                primeira_coluna = df.columns[0]
+                df[primeira_coluna] = df[primeira_coluna].astype(str)
+
+                # Encontrar a primeira ocorrência de "Total Geral" (case insensitive)
+                total_geral_mask = df[primeira_coluna].str.contains('Total Geral', case=False, na=False)
+                total_geral_indices = df[total_geral_mask].index.tolist()
+
+                if total_geral_indices:
+                    # Pegar o primeiro índice onde aparece "Total Geral"
+                    primeiro_total_geral = total_geral_indices[0]
+                    # Filtrar o DataFrame para manter apenas as linhas antes de "Total Geral"
+                    etapa['removidas'] = len(df) - primeiro_total_geral
+                    df = df.iloc[:primeiro_total_geral].copy()
+            etapa['linhas'] = len(df)
+
+        with medir_etapa('conversao', linhas=len(df)):
+            # Identificadores são lidos como texto; usar inteiros quando todos forem numéricos
+            for col in ['Número Doc.', 'AP']:
+                if col in df.columns:
+                    valores = pd.to_numeric(df[col], errors='coerce')
+                    if valores.notna().all() and (valores % 1 == 0).all():
+                        df[col] = valores.astype('int64')
+
+            # Limpeza e normalização
+            if 'Tipo Doc.' in df.columns:
+                df['Tipo Doc.'] = df['Tipo Doc.'].astype(str).str.strip()
+
+            # Valores monetários em centavos exatos (usados nas somas) e em reais (exibição)
+            for col in COLUNAS_MONETARIAS:
+                if col in df.columns:
+                    df[f'{col}_centavos'] = converter_brl_centavos(df[col])
+                    df[col] = df[f'{col}_centavos'] / 100
+
+        with medir_etapa('derivacao', linhas=len(df)) as etapa:
+            # Datas e colunas derivadas (mês, período, texto de exibição, dia)
+            if 'Prorrogado' in df.columns:
+                normalizar_datas(df)
+
+            # Verificar contas vencidas
+            marcar_vencidos(df, datetime.now().date())
+
+            # Dimensões de baixa cardinalidade como categorias (códigos inteiros)
+            etapa['bytes_antes'] = int(relatorio_memoria(df)['bytes'].sum())
+            compactar_dataframe(df)
+            memoria = relatorio_memoria(df)
+            etapa['bytes'] = int(memoria['bytes'].sum())
+            etapa['maiores_colunas'] = ','.join(f"{linha.coluna}:{linha.bytes}" for linha in memoria.head(3).itertuples())
 
         return df
 
     except pd.errors.ParserError as e:
-        print(f"Erro de parsing CSV: {e}")
-        print("Tentando carregar com configurações alternativas...")
+        logger.warning("Erro de parsing CSV (%s); tentando carregar com configurações alternativas", e)
         
         # Tentativa alternativa com configurações mais flexíveis
         try:
             df = pd.read_csv(
-                sheet_url,
+                io.BytesIO(conteudo),
                 on_bad_lines='skip',
                 engine='python',
                 encoding='utf-8',
                 sep=',',
                 quotechar='"',
-                skipinitialspace=True,
-                error_bad_lines=False,
-                warn_bad_lines=True
+                skipinitialspace=True
             )
-            print(f"Carregamento alternativo bem-sucedido: {len(df)} linhas")
+            logger.info("Carregamento alternativo bem-sucedido: %d linhas", len(df))
             return df
         except Exception as e2:
-            print(f"Falha no carregamento alternativo: {e2}")
+            logger.error("Falha no carregamento alternativo: %s", e2)
             return pd.DataFrame()
-            
+
     except Exception as e:
-        print(f"Erro geral ao carregar dados: {e}")
-        print(f"Tipo do erro: {type(e).__name__}")
+        logger.exception("Erro geral ao processar os dados (%s): %s", type(e).__name__, e)
         return pd.DataFrame()
 
+def carregar_dados(anterior=None):
+    """Carrega e processa os dados das contas a pagar.
+
+    Recebe o snapshot atual (se houver) e o reaproveita quando a planilha não
+    mudou: o download é condicional (ETag/Last-Modified) e, quando o servidor
+    não oferece esses cabeçalhos, o hash do conteúdo evita reprocessar um CSV
+    idêntico. A versão inclui o dia para que 'Vencido' seja refeito à meia-noite.
+    """
+    hoje = datetime.now().date()
+    try:
+        with medir_etapa('download') as etapa:
+            conteudo, etag, last_modified = baixar_planilha(
+                sheet_url,
+                etag=anterior.etag if anterior else None,
+                last_modified=anterior.last_modified if anterior else None
+            )
+            etapa.update(bytes=len(conteudo) if conteudo is not None else 0, nao_modificado=conteudo is None)
+    except Exception as e:
+        logger.error("Erro ao baixar a planilha (%s): %s", type(e).__name__, e)
+        return Snapshot(versao='vazio', df=pd.DataFrame(), carregado_em=datetime.now())
+
+    if conteudo is not None:
+        with medir_etapa('hash', bytes=len(conteudo)):
+            hash_conteudo = hashlib.sha256(conteudo).hexdigest()
+    else:
+        hash_conteudo = anterior.hash_conteudo
+    versao = f"{hash_conteudo[:16]}-{hoje:%Y%m%d}"
+
+    if anterior is not None and hash_conteudo == anterior.hash_conteudo:
+        logger.info("Planilha sem alterações desde o último carregamento")
+        if anterior.versao == versao:
+            return replace(anterior, etag=etag, last_modified=last_modified,
+                           origem='planilha', verificado_em=datetime.now())
+        # Mesmo conteúdo em outro dia: apenas recalcular as contas vencidas
+        df = anterior.df.copy()
+        marcar_vencidos(df, hoje)
+        return Snapshot(versao=versao, df=df, carregado_em=datetime.now(), hash_conteudo=hash_conteudo,
+                        etag=etag, last_modified=last_modified)
+
+    df = processar_csv(conteudo)
+    if df.empty:
+        # Sem validadores, para que a próxima tentativa baixe e processe de novo
+        return Snapshot(versao='vazio', df=df, carregado_em=datetime.now())
+    with medir_etapa('indexacao', linhas=len(df)):
+        return Snapshot(versao=versao, df=df, carregado_em=datetime.now(), hash_conteudo=hash_conteudo,
+                        etag=etag, last_modified=last_modified)
+
+# ----------------------------
+# Snapshot em disco
+# ----------------------------
+CHAVE_METADADOS_SNAPSHOT = b'dashboard_snapshot'
+
+def gravar_atomicamente(caminho, escrever):
+    """Grava um arquivo com `escrever(arquivo)` de forma atômica.
+
+    O conteúdo vai para um arquivo temporário no mesmo diretório, que depois
+    é renomeado por cima do anterior: um leitor nunca vê um arquivo pela
+    metade, e quem já mapeou a versão antiga continua lendo-a intacta.
+    """
+    diretorio = os.path.dirname(caminho)
+    os.makedirs(diretorio, exist_ok=True)
+    descritor, temporario = tempfile.mkstemp(dir=diretorio, prefix='.snapshot-', suffix='.tmp')
+    try:
+        with os.fdopen(descritor, 'wb') as arquivo:
+            escrever(arquivo)
+            arquivo.flush()
+            os.fsync(arquivo.fileno())
+        os.replace(temporario, caminho)
+    except BaseException:
+        if os.path.exists(temporario):
+            os.unlink(temporario)
+        raise
+
+def salvar_snapshot(snapshot, caminho=ARQUIVO_SNAPSHOT, geracao=None):
+    """Grava o snapshot num arquivo Arrow (Feather v2 sem compressão, que pode ser mapeado em memória).
+
+    Todas as linhas vão num único bloco, para que cada coluna seja contígua
+    no arquivo e possa ser lida sem cópia por tabela_para_dataframe.
+    """
+    metadados = {
+        'geracao': geracao,
+        'versao': snapshot.versao,
+        'carregado_em': snapshot.carregado_em.isoformat(),
+        'verificado_em': snapshot.verificado_em.isoformat() if snapshot.verificado_em else None,
+        'hash_conteudo': snapshot.hash_conteudo,
+        'etag': snapshot.etag,
+        'last_modified': snapshot.last_modified,
+    }
+    tabela = pa.Table.from_pandas(snapshot.df, preserve_index=False)
+    tabela = tabela.replace_schema_metadata({
+        **(tabela.schema.metadata or {}),
+        CHAVE_METADADOS_SNAPSHOT: json.dumps(metadados).encode('utf-8'),
+    })
+    gravar_atomicamente(caminho, lambda arquivo: feather.write_feather(
+        tabela, arquivo, compression='uncompressed', chunksize=max(len(tabela), 1)))
+
+def tabela_para_dataframe(tabela):
+    """Converte uma tabela Arrow em DataFrame reaproveitando a memória das colunas sempre que possível.
+
+    Colunas numéricas e de data sem nulos viram arrays NumPy que apontam para
+    os buffers da tabela (num arquivo mapeado, as páginas do próprio arquivo);
+    nas categóricas, só os códigos são aproveitados e o dicionário é lido. O
+    resto (booleanos, textos, colunas com nulos) passa pela conversão padrão.
+    Equivale a `tabela.to_pandas()`, mas sem duplicar o arquivo em cada processo.
+    """
+    colunas = {}
+    for nome, coluna in zip(tabela.column_names, tabela.columns):
+        if coluna.num_chunks != 1:
+            colunas[nome] = coluna.to_pandas()
+            continue
+        valores = coluna.chunk(0)
+        if pa.types.is_dictionary(valores.type):
+            indices = valores.indices.fill_null(-1) if valores.null_count else valores.indices
+            colunas[nome] = pd.Categorical.from_codes(indices.to_numpy(zero_copy_only=True),
+                                                      categories=valores.dictionary.to_pandas(),
+                                                      ordered=valores.type.ordered)
+        elif valores.null_count == 0 and (pa.types.is_integer(valores.type) or pa.types.is_floating(valores.type)
+                                          or pa.types.is_timestamp(valores.type)):
+            colunas[nome] = valores.to_numpy(zero_copy_only=True)
+        else:
+            colunas[nome] = coluna.to_pandas()
+    return pd.DataFrame(colunas, copy=False)
+
+def ler_snapshot(caminho=ARQUIVO_SNAPSHOT):
+    """Lê o snapshot gravado por salvar_snapshot mapeando o arquivo em memória; None se ele não existir.
+
+    As colunas numéricas sem nulos continuam apontando para as páginas do
+    arquivo, que o sistema operacional compartilha entre todos os processos
+    que o mapeiam. Se o arquivo for de outro dia, as contas vencidas são
+    recalculadas e a versão passa a ser a de hoje, como faria carregar_dados.
+    """
+    if not os.path.exists(caminho):
+        return None
+    tabela = pa.ipc.open_file(pa.memory_map(caminho)).read_all()
+    metadados = json.loads(tabela.schema.metadata[CHAVE_METADADOS_SNAPSHOT])
+    df = tabela_para_dataframe(tabela)
+
+    versao = metadados['versao']
+    hoje = datetime.now().date()
+    if metadados['hash_conteudo'] and not versao.endswith(f"-{hoje:%Y%m%d}"):
+        marcar_vencidos(df, hoje)
+        versao = f"{metadados['hash_conteudo'][:16]}-{hoje:%Y%m%d}"
+
+    verificado_em = metadados.get('verificado_em')
+    return Snapshot(
+        versao=versao, df=df,
+        carregado_em=datetime.fromisoformat(metadados['carregado_em']),
+        hash_conteudo=metadados['hash_conteudo'],
+        etag=metadados['etag'],
+        last_modified=metadados['last_modified'],
+        origem='disco',
+        verificado_em=datetime.fromisoformat(verificado_em) if verificado_em else None,
+        geracao=metadados.get('geracao'),
+    )
+
+def salvar_estado_compartilhado(caminho, geracao, verificado_em, ultima_falha):
+    """Grava o estado que o worker atualizador publica aos demais a cada busca da planilha."""
+    estado = {
+        'geracao': geracao,
+        'verificado_em': verificado_em.isoformat() if verificado_em else None,
+        'ultima_falha': ultima_falha.isoformat() if ultima_falha else None,
+    }
+    gravar_atomicamente(caminho, lambda arquivo: arquivo.write(json.dumps(estado).encode('utf-8')))
+
+def ler_estado_compartilhado(caminho):
+    """Lê o estado gravado por salvar_estado_compartilhado; None se ainda não existir."""
+    try:
+        with open(caminho, encoding='utf-8') as arquivo:
+            estado = json.load(arquivo)
+    except FileNotFoundError:
+        return None
+    for chave in ('verificado_em', 'ultima_falha'):
+        if estado.get(chave):
+            estado[chave] = datetime.fromisoformat(estado[chave])
+    return estado
+
+# ----------------------------
+# Alterações entre snapshots
+# ----------------------------
+# Um documento é identificado pela filial, número e AP; repetições da mesma
+# chave são distinguidas pela ordem de ocorrência na planilha.
+COLUNAS_CHAVE_DOCUMENTO = ['Nome Fantasia Filial', 'Número Doc.', 'AP']
+COLUNAS_VALOR_DOCUMENTO = ['Nome Fantasia Agente', 'Prorrogado', 'Tipo Doc.', 'Retenção IR_centavos',
+                           'Líquido_centavos', 'Saldo em Aberto_centavos', 'Complemento']
+
+# Colunas guardadas de cada documento alterado (antes e depois, no caso dos atualizados)
+COLUNAS_RESUMO_ALTERACAO = ['Nome Fantasia Filial', 'Nome Fantasia Agente', 'Número Doc.', 'AP',
+                            'Prorrogado', 'Líquido_centavos', 'Saldo em Aberto_centavos']
+
+@dataclass(frozen=True)
+class Alteracoes:
+    """Documentos inseridos, atualizados e removidos entre duas versões dos dados.
+
+    Cada DataFrame traz a posição da linha (`posicao`, no snapshot novo; no
+    antigo para os removidos) e as colunas de COLUNAS_RESUMO_ALTERACAO; os
+    atualizados trazem também os valores anteriores, com sufixo '_antes'.
+    """
+    versao_anterior: str
+    versao: str
+    calculado_em: datetime
+    inseridos: pd.DataFrame
+    atualizados: pd.DataFrame
+    removidos: pd.DataFrame
+
+    @property
+    def pagos(self):
+        """Atualizados cujo saldo em aberto foi zerado."""
+        a = self.atualizados
+        return a[(a['Saldo em Aberto_centavos_antes'] > 0) & (a['Saldo em Aberto_centavos'] == 0)]
+
+    @property
+    def reprogramados(self):
+        """Atualizados cuja data de vencimento mudou."""
+        a = self.atualizados
+        return a[a['Prorrogado_antes'].ne(a['Prorrogado']) & ~(a['Prorrogado_antes'].isna() & a['Prorrogado'].isna())]
+
+    @property
+    def vazia(self):
+        return self.inseridos.empty and self.atualizados.empty and self.removidos.empty
+
+    def resumo(self):
+        """Contagens por tipo de alteração."""
+        return {
+            'inseridos': len(self.inseridos),
+            'atualizados': len(self.atualizados),
+            'removidos': len(self.removidos),
+            'pagos': len(self.pagos),
+            'reprogramados': len(self.reprogramados),
+        }
+
+def identificar_documentos(df):
+    """Hash da chave de cada linha (com o número da ocorrência) e hash das colunas de valor."""
+    chave = pd.util.hash_pandas_object(df[COLUNAS_CHAVE_DOCUMENTO], index=False).to_numpy()
+    ocorrencia = pd.Series(chave).groupby(chave).cumcount().to_numpy()
+    colunas_valor = [c for c in COLUNAS_VALOR_DOCUMENTO if c in df.columns]
+    valor = pd.util.hash_pandas_object(df[colunas_valor], index=False).to_numpy()
+    return pd.DataFrame({'chave': chave, 'ocorrencia': ocorrencia, 'valor': valor})
+
+def calcular_alteracoes(anterior, atual):
+    """Compara dois snapshots documento a documento; None se algum deles não tiver as colunas da chave."""
+    colunas = COLUNAS_CHAVE_DOCUMENTO + ['Prorrogado', 'Líquido_centavos', 'Saldo em Aberto_centavos']
+    if any(c not in snapshot.df.columns for snapshot in (anterior, atual) for c in colunas):
+        return None
+
+    antes = anterior.documentos.assign(posicao=np.arange(len(anterior.df)))
+    depois = atual.documentos.assign(posicao=np.arange(len(atual.df)))
+    pares = depois.merge(antes, on=['chave', 'ocorrencia'], how='outer', suffixes=('', '_antes'), indicator=True)
+
+    def resumo(df, posicoes):
+        linhas = df.take(posicoes)[[c for c in COLUNAS_RESUMO_ALTERACAO if c in df.columns]].reset_index(drop=True)
+        linhas.insert(0, 'posicao', posicoes)
+        return linhas
+
+    inseridos = pares.loc[pares['_merge'] == 'left_only', 'posicao'].astype(np.int64).to_numpy()
+    removidos = pares.loc[pares['_merge'] == 'right_only', 'posicao_antes'].astype(np.int64).to_numpy()
+    mudaram = pares[(pares['_merge'] == 'both') & (pares['valor'] != pares['valor_antes'])]
+
+    atualizados = resumo(atual.df, mudaram['posicao'].astype(np.int64).to_numpy())
+    valores_antes = resumo(anterior.df, mudaram['posicao_antes'].astype(np.int64).to_numpy())
+    for coluna in ['Prorrogado', 'Líquido_centavos', 'Saldo em Aberto_centavos']:
+        atualizados[f'{coluna}_antes'] = valores_antes[coluna].to_numpy()
+
+    return Alteracoes(
+        versao_anterior=anterior.versao,
+        versao=atual.versao,
+        calculado_em=datetime.now(),
+        inseridos=resumo(atual.df, np.sort(inseridos)),
+        atualizados=atualizados,
+        removidos=resumo(anterior.df, np.sort(removidos)),
+    )
+
+# ----------------------------
+# Cache de dados no servidor
+# ----------------------------
+class CacheDados:
+    """Mantém um único snapshot dos dados por processo, compartilhado entre sessões e callbacks.
+
+    Uma thread em segundo plano busca a planilha a cada `intervalo` segundos e
+    troca o snapshot de forma atômica. Os callbacks nunca esperam pela rede:
+    recebem sempre o último snapshot bom, mesmo durante uma atualização ou
+    depois de uma falha (stale-while-revalidate). Atualizações concorrentes
+    compartilham um único download. As últimas versões ficam retidas para que
+    tokens recém-enviados ao navegador continuem resolvendo para os mesmos dados.
+
+    A cada versão nova, o atualizador compara os documentos com a versão
+    anterior e guarda o conjunto de alterações num histórico limitado.
+
+    Com `arquivo`, cada versão nova também é gravada em disco; na partida,
+    restaurar() publica essa cópia antes do primeiro download, e ela continua
+    sendo servida enquanto a planilha estiver inacessível.
+
+    Com `compartilhado`, vários processos usam o mesmo `arquivo`: o primeiro
+    que obtém a trava (fcntl.flock) vira o atualizador e é o único a buscar a
+    planilha; a cada versão nova ele grava o snapshot com a geração seguinte.
+    Os demais só acompanham o arquivo de estado e, quando a geração muda,
+    mapeiam o snapshot novo em vez de baixar e processar a planilha de novo.
+    Se o atualizador morrer, a trava é liberada e outro processo assume.
+    """
+
+    def __init__(self, carregador, ttl=CACHE_TTL_SEGUNDOS, intervalo=INTERVALO_ATUALIZACAO_SEGUNDOS,
+                 versoes_retidas=3, segundo_plano=True, historico=HISTORICO_ALTERACOES, arquivo=None,
+                 compartilhado=False, intervalo_leitura=INTERVALO_LEITURA_COMPARTILHADA_SEGUNDOS):
+        self._carregador = carregador
+        self.ttl = ttl
+        self.intervalo = intervalo
+        self._versoes_retidas = versoes_retidas
+        self._segundo_plano = segundo_plano
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._recentes = OrderedDict()  # versao -> Snapshot
+        self._alteracoes = deque(maxlen=historico)  # Alteracoes, da mais antiga para a mais nova
+        self._ao_publicar = []  # funções chamadas com as versões retidas a cada versão nova
+        self._arquivo = arquivo
+        self._compartilhado = compartilhado and arquivo is not None
+        self.intervalo_leitura = intervalo_leitura
+        self._trava = None  # descritor da trava de atualizador, enquanto este processo for o eleito
+        self._geracao = 0  # geração do arquivo compartilhado já publicada
+        self.ultima_falha = None  # datetime da última atualização que falhou, se a mais recente falhou
+        self._verificado_em = 0.0
+        self._em_andamento = None  # threading.Event da atualização em curso
+        self._atualizador = None
+        self._parar = threading.Event()
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.sem_alteracao = 0
+        self.falhas = 0
+
+    def _valido(self):
+        return self._snapshot is not None and time.monotonic() - self._verificado_em < self.ttl
+
+    def _vazio(self):
+        return Snapshot(versao='vazio', df=pd.DataFrame(), carregado_em=datetime.now())
+
+    def _publicar(self, snapshot):
+        atual = self._snapshot
+        self._snapshot = snapshot
+        if atual is not None and atual.versao == snapshot.versao:
+            # Conteúdo idêntico: a versão não muda e nada precisa ser recalculado
+            self.sem_alteracao += 1
+            self._recentes[snapshot.versao] = snapshot
+            return snapshot
+        self._recentes[snapshot.versao] = snapshot
+        self._recentes.move_to_end(snapshot.versao)
+        while len(self._recentes) > self._versoes_retidas:
+            self._recentes.popitem(last=False)
+        return snapshot
+
+    def atualizar(self):
+        """Busca a planilha e publica o resultado; chamadas simultâneas esperam o mesmo download."""
+        with self._lock:
+            evento = self._em_andamento
+            lider = evento is None
+            if lider:
+                evento = self._em_andamento = threading.Event()
+
+        if not lider:
+            evento.wait()
+            return self.atual()
+
+        try:
+            atualizador = self._eleger()
+            with execucao_carga('planilha' if atualizador else 'arquivo_compartilhado') as execucao:
+                return self._atualizar(atualizador, execucao)
+        finally:
+            with self._lock:
+                self._em_andamento = None
+            evento.set()
+
+    def _atualizar(self, atualizador, execucao):
+        """Uma atualização (já como líder): carrega, compara, publica e grava; anota o resultado na execução."""
+        try:
+            snapshot = self._carregador(self._snapshot) if atualizador else self._acompanhar()
+        except Exception as e:
+            logger.exception("Erro ao atualizar os dados: %s", e)
+            snapshot = None
+        # Alterações em relação à versão publicada, calculadas fora do lock
+        # (só a atualização em curso publica, então `anterior` não muda até lá)
+        anterior = self._snapshot
+        alteracoes = None
+        if (snapshot is not None and anterior is not None and snapshot.versao != anterior.versao
+                and not snapshot.df.empty and not anterior.df.empty):
+            try:
+                with medir_etapa('alteracoes') as etapa:
+                    alteracoes = calcular_alteracoes(anterior, snapshot)
+                    etapa.update(inseridos=len(alteracoes.inseridos), atualizados=len(alteracoes.atualizados),
+                                 removidos=len(alteracoes.removidos))
+            except Exception as e:
+                logger.error("Erro ao comparar as versões dos dados: %s", e)
+        with self._lock:
+            self.refreshes += 1
+            self._verificado_em = time.monotonic()
+            falhou = snapshot is None or (snapshot.df.empty and anterior is not None and not anterior.df.empty)
+            if falhou:
+                # Falha na atualização: continuar servindo o último snapshot bom
+                self.falhas += 1
+                self.ultima_falha = datetime.now()
+                if anterior is not None:
+                    logger.warning("Mantendo os dados carregados em %s", anterior.carregado_em)
+            else:
+                self.ultima_falha = None
+                self._publicar(snapshot)
+                if alteracoes is not None:
+                    self._alteracoes.append(alteracoes)
+                    logger.info("Alterações desde a versão anterior: %s", alteracoes.resumo())
+            resultado = self._snapshot if self._snapshot is not None else self._vazio()
+            retidas = tuple(self._recentes)
+
+        nova_versao = not falhou and (anterior is None or anterior.versao != snapshot.versao)
+        execucao.update(resultado='falha' if falhou else 'nova_versao' if nova_versao else 'sem_alteracao',
+                        versao=resultado.versao, linhas=len(resultado.df))
+        if nova_versao:
+            self._notificar(retidas)
+
+        if atualizador:
+            self._gravar(snapshot, anterior, falhou)
+        return resultado
+
+    def _eleger(self):
+        """Indica se este processo busca a planilha; no modo compartilhado, tenta obter a trava."""
+        if not self._compartilhado or self._trava is not None:
+            return True
+        os.makedirs(os.path.dirname(self._arquivo), exist_ok=True)
+        descritor = os.open(self._arquivo + '.lock', os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(descritor, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(descritor)
+            return False
+        self._trava = descritor
+        estado = ler_estado_compartilhado(self._arquivo + '.estado')
+        if estado is not None:
+            self._geracao = max(self._geracao, estado['geracao'])
+        logger.info("Processo %d eleito para atualizar os dados compartilhados", os.getpid())
+        return True
+
+    def _gravar(self, snapshot, anterior, falhou):
+        """Grava a cópia em disco (versão nova) e, no modo compartilhado, o estado para os demais."""
+        if not self._arquivo:
+            return
+        try:
+            if not falhou and not snapshot.df.empty and (anterior is None or anterior.versao != snapshot.versao):
+                self._geracao += 1
+                with medir_etapa('gravacao_disco', linhas=len(snapshot.df)) as etapa:
+                    salvar_snapshot(snapshot, self._arquivo, geracao=self._geracao)
+                    etapa.update(bytes=os.path.getsize(self._arquivo), geracao=self._geracao)
+            if self._compartilhado:
+                atual = self.atual()
+                salvar_estado_compartilhado(self._arquivo + '.estado', self._geracao,
+                                            atual.verificado_em or atual.carregado_em, self.ultima_falha)
+        except Exception as e:
+            logger.error("Erro ao gravar a cópia local dos dados: %s", e)
+
+    def _acompanhar(self):
+        """Snapshot publicado pelo processo atualizador (mapeado do arquivo quando a geração muda)."""
+        estado = ler_estado_compartilhado(self._arquivo + '.estado')
+        if estado is None:
+            # O atualizador ainda não terminou a primeira busca
+            return self._snapshot if self._snapshot is not None else self._vazio()
+        if estado['geracao'] != self._geracao:
+            with medir_etapa('leitura_compartilhada') as etapa:
+                snapshot = ler_snapshot(self._arquivo)
+                etapa.update(linhas=len(snapshot.df), geracao=snapshot.geracao)
+            self._geracao = snapshot.geracao
+            return replace(snapshot, origem='planilha', verificado_em=estado['verificado_em'])
+        if estado['ultima_falha'] is not None:
+            return None
+        if self._snapshot is None:
+            return self._vazio()
+        if self._snapshot.verificado_em != estado['verificado_em']:
+            return replace(self._snapshot, origem='planilha', verificado_em=estado['verificado_em'])
+        return self._snapshot
+
+    def restaurar(self):
+        """Publica a cópia em disco, se existir e ainda não houver dados; ela é tratada como vencida."""
+        if not self._arquivo or self._snapshot is not None:
+            return None
+        try:
+            snapshot = ler_snapshot(self._arquivo)
+        except Exception as e:
+            logger.error("Erro ao ler a cópia local dos dados: %s", e)
+            return None
+        if snapshot is None:
+            return None
+        with self._lock:
+            if self._snapshot is not None:
+                return None
+            self._publicar(snapshot)
+            self._geracao = snapshot.geracao or 0
+            retidas = tuple(self._recentes)
+        self._notificar(retidas)
+        logger.info("Servindo a cópia local dos dados de %s até o primeiro download", snapshot.carregado_em)
+        return snapshot
+
+    def ao_publicar(self, funcao):
+        """Registra `funcao(versoes_retidas)`, chamada (fora do lock) sempre que uma versão nova é publicada."""
+        self._ao_publicar.append(funcao)
+        return funcao
+
+    def _notificar(self, retidas):
+        for funcao in self._ao_publicar:
+            try:
+                funcao(retidas)
+            except Exception as e:
+                logger.error("Erro ao notificar a nova versão dos dados: %s", e)
+
+    def atual(self):
+        """Último snapshot publicado (ou um snapshot vazio antes da primeira carga)."""
+        with self._lock:
+            return self._snapshot if self._snapshot is not None else self._vazio()
+
+    def obter(self):
+        """Retorna o último snapshot disponível sem esperar pela rede.
+
+        Se ele estiver vencido e nenhuma atualização estiver em curso, dispara
+        uma em segundo plano e devolve os dados atuais mesmo assim.
+        """
+        with self._lock:
+            self._garantir_atualizador()
+            snapshot = self._snapshot
+            if self._valido():
+                self.hits += 1
+                return snapshot
+            self.misses += 1
+            revalidar = self._em_andamento is None
+
+        if revalidar:
+            threading.Thread(target=self.atualizar, name='revalidar-dados', daemon=True).start()
+        return snapshot if snapshot is not None else self._vazio()
+
+    def resolver(self, versao):
+        """Retorna o snapshot da versão informada (ou o atual, se ela não estiver mais retida)."""
+        with self._lock:
+            snapshot = self._recentes.get(versao)
+        return snapshot if snapshot is not None else self.obter()
+
+    def alteracoes(self, versao=None):
+        """Alterações que levaram à `versao` (por padrão, à atual); None se não houver registro."""
+        with self._lock:
+            if versao is None:
+                versao = self._snapshot.versao if self._snapshot is not None else None
+            for alteracoes in reversed(self._alteracoes):
+                if alteracoes.versao == versao:
+                    return alteracoes
+        return None
+
+    def historico_alteracoes(self):
+        """Conjuntos de alterações guardados, do mais antigo ao mais novo."""
+        with self._lock:
+            return list(self._alteracoes)
+
+    def retida(self, versao):
+        """Indica se a versão ainda está entre as retidas em memória."""
+        with self._lock:
+            return versao in self._recentes
+
+    def iniciar(self):
+        """Publica a cópia em disco (ver restaurar) e inicia a atualização periódica em segundo plano."""
+        self.restaurar()
+        with self._lock:
+            self._iniciar_atualizador()
+
+    def _garantir_atualizador(self):
+        # Iniciada no primeiro uso, já dentro do processo do worker
+        if self._segundo_plano:
+            self._iniciar_atualizador()
+
+    def _iniciar_atualizador(self):
+        if self._atualizador is None:
+            self._atualizador = threading.Thread(target=self._executar_atualizador,
+                                                 name='atualizador-dados', daemon=True)
+            self._atualizador.start()
+
+    def _executar_atualizador(self):
+        while not self._parar.is_set():
+            self.atualizar()
+            # Quem não busca a planilha só confere a geração do arquivo, o que é barato
+            self._parar.wait(self.intervalo if self._trava is not None or not self._compartilhado
+                             else self.intervalo_leitura)
+
+    def parar(self):
+        """Interrompe a atualização periódica em segundo plano e libera a trava de atualizador."""
+        self._parar.set()
+        with self._lock:
+            if self._trava is not None:
+                os.close(self._trava)
+                self._trava = None
+
+    def invalidar(self):
+        """Marca os dados como vencidos; o próximo acesso dispara uma atualização."""
+        with self._lock:
+            self._verificado_em = 0.0
+
+    def estatisticas(self):
+        """Contadores de acertos, faltas, atualizações e falhas do cache."""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'refreshes': self.refreshes,
+                'sem_alteracao': self.sem_alteracao,
+                'falhas': self.falhas,
+                'ultima_falha': self.ultima_falha,
+                'papel': 'atualizador' if self._trava is not None or not self._compartilhado else 'leitor',
+                'geracao': self._geracao,
+                'ttl': self.ttl,
+                'intervalo': self.intervalo,
+                'versao': self._snapshot.versao if self._snapshot is not None else None,
+                'idade_segundos': time.monotonic() - self._verificado_em if self._snapshot is not None else None,
+            }
+
+
+class CacheLRU:
+    """Cache LRU limitado pelo número de entradas e pelo tamanho total dos valores.
+
+    As chaves começam pela versão dos dados, de modo que uma versão nova
+    nunca reaproveita resultados da anterior; manter_versoes() descarta as
+    entradas das versões que não estão mais retidas. Guarda contadores de
+    acertos e faltas para acompanhar a taxa de acerto.
+
+    Pedidos simultâneos da mesma chave ausente compartilham um único cálculo
+    (single-flight): o primeiro calcula e os demais esperam pelo resultado.
+    """
+
+    def __init__(self, max_entradas=256, max_bytes=32*1024*1024, tamanho=len):
+        self.max_entradas = max_entradas
+        self.max_bytes = max_bytes
+        self._tamanho = tamanho
+        self._lock = threading.Lock()
+        self._itens = OrderedDict()  # chave -> (valor, tamanho)
+        self._bytes = 0
+        self._em_andamento = {}  # chave -> cálculo em curso: {'evento', 'valor', 'ok'}
+        self.hits = 0
+        self.misses = 0
+        self.coalescidos = 0
+        self.remocoes = 0
+
+    def obter(self, chave, calcular):
+        """Valor guardado para `chave`; se não houver, calcula com `calcular()` e guarda.
+
+        Se a mesma chave já está sendo calculada, espera por esse cálculo em
+        vez de repeti-lo (e recalcula só se ele tiver falhado).
+        """
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is not None:
+                self._itens.move_to_end(chave)
+                self.hits += 1
+                return item[0]
+            calculo = self._em_andamento.get(chave)
+            lider = calculo is None
+            if lider:
+                calculo = self._em_andamento[chave] = {'evento': threading.Event(), 'valor': None, 'ok': False}
+                self.misses += 1
+            else:
+                self.coalescidos += 1
+
+        if not lider:
+            calculo['evento'].wait()
+            return calculo['valor'] if calculo['ok'] else calcular()
+
+        try:
+            calculo['valor'] = calcular()
+            calculo['ok'] = True
+            self.guardar(chave, calculo['valor'])
+            return calculo['valor']
+        finally:
+            with self._lock:
+                del self._em_andamento[chave]
+            calculo['evento'].set()
+
+    def guardar(self, chave, valor):
+        """Guarda o valor, removendo os menos usados recentemente até caber nos limites."""
+        tamanho = self._tamanho(valor)
+        if tamanho > self.max_bytes:
+            return
+        with self._lock:
+            anterior = self._itens.pop(chave, None)
+            if anterior is not None:
+                self._bytes -= anterior[1]
+            self._itens[chave] = (valor, tamanho)
+            self._bytes += tamanho
+            while len(self._itens) > self.max_entradas or self._bytes > self.max_bytes:
+                _, (_, removido) = self._itens.popitem(last=False)
+                self._bytes -= removido
+                self.remocoes += 1
+
+    def manter_versoes(self, versoes):
+        """Descarta as entradas cuja versão (primeiro elemento da chave) não está em `versoes`."""
+        with self._lock:
+            for chave in [chave for chave in self._itens if chave[0] not in versoes]:
+                self._bytes -= self._itens.pop(chave)[1]
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+            self._bytes = 0
+
+    def __len__(self):
+        return len(self._itens)
+
+    def estatisticas(self):
+        """Entradas, tamanho ocupado, acertos, faltas, pedidos coalescidos, remoções e taxa de acerto.
+
+        Pedidos coalescidos (que esperaram um cálculo em curso) contam como acertos na taxa.
+        """
+        with self._lock:
+            consultas = self.hits + self.coalescidos + self.misses
+            return {
+                'entradas': len(self._itens),
+                'bytes': self._bytes,
+                'max_entradas': self.max_entradas,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalescidos': self.coalescidos,
+                'remocoes': self.remocoes,
+                'taxa_acerto': (self.hits + self.coalescidos) / consultas if consultas else None,
+            }
+
+
+def tamanho_figuras(figuras):
+    """Tamanho (em bytes) de uma tupla de figuras serializadas em JSON."""
+    return sum(len(figura) for figura in figuras)
+
+def tamanho_dataframe(df):
+    """Memória (em bytes) ocupada pelas colunas do DataFrame, sem percorrer textos."""
+    return int(df.memory_usage(index=True, deep=False).sum())
+
+def tamanho_tabela(tabela, amostra=64):
+    """Tamanho estimado (em bytes) de uma tabela montada, a partir de uma amostra dos registros."""
+    _, registros, blocos = tabela
+    if not registros:
+        return sys.getsizeof(registros)
+    passo = max(1, len(registros) // amostra)
+    amostrados = registros[::passo]
+    por_registro = sum(sys.getsizeof(registro) + sum(sys.getsizeof(valor) for valor in registro.values())
+                       for registro in amostrados) / len(amostrados)
+    return int(sys.getsizeof(registros) + len(registros) * por_registro + sys.getsizeof(blocos or []))
+
+
+# Instância única por worker (o gunicorn importa o módulo uma vez por processo). Importar o
+# módulo não lê a cópia em disco nem inicia a atualização periódica: isso fica com
+# iniciar_dados(), chamado pelos pontos de entrada do servidor
+cache_dados = CacheDados(carregar_dados, segundo_plano=False, arquivo=ARQUIVO_SNAPSHOT,
+                         compartilhado=DADOS_COMPARTILHADOS)
+
+def iniciar_dados():
+    """Partida do servidor: serve a cópia em disco, se houver, e passa a atualizar os dados em segundo plano.
+
+    Chamada em cada worker (post_worker_init do gunicorn.conf.py) e ao rodar o app direto.
+    """
+    cache_dados.iniciar()
+
+# Figuras já serializadas, compartilhadas entre sessões; as de versões que deixam de ser retidas são descartadas
+cache_figuras = CacheLRU(max_entradas=CACHE_FIGURAS_ENTRADAS, max_bytes=int(CACHE_FIGURAS_MB * 1024 * 1024),
+                         tamanho=tamanho_figuras)
+cache_dados.ao_publicar(cache_figuras.manter_versoes)
+
+# Linhas filtradas por combinação de filtros, compartilhadas entre sessões e callbacks
+cache_visoes = CacheLRU(max_entradas=CACHE_VISOES_ENTRADAS, max_bytes=int(CACHE_VISOES_MB * 1024 * 1024),
+                        tamanho=tamanho_dataframe)
+cache_dados.ao_publicar(cache_visoes.manter_versoes)
+
+# Tabelas inteiras (todas as páginas) por combinação de filtros, ordenação e filtro da tabela
+cache_tabelas = CacheLRU(max_entradas=CACHE_TABELAS_ENTRADAS, max_bytes=int(CACHE_TABELAS_MB * 1024 * 1024),
+                         tamanho=tamanho_tabela)
+cache_dados.ao_publicar(cache_tabelas.manter_versoes)
+
+
+def obter_snapshot(versao):
+    """Resolve o token guardado em store-dados para o snapshot em memória."""
+    if not versao:
+        return cache_dados._vazio()
+    return cache_dados.resolver(versao)
+
+def linhas_filtradas(snapshot, tipo_doc, status, fornecedor, mes):
+    """DataFrame com as linhas do snapshot que atendem aos filtros, compartilhado via cache_visoes.
+
+    Callbacks e sessões que pedem a mesma combinação (inclusive ao mesmo
+    tempo) recebem o mesmo DataFrame, que não deve ser alterado. Sem
+    filtros, é o próprio DataFrame do snapshot e nada é guardado.
+    """
+    visao = snapshot.filtrar(tipo_doc, status, fornecedor, mes)
+    if visao.posicoes is None:
+        return visao.df
+    return cache_visoes.obter((snapshot.versao, tipo_doc, status, fornecedor, mes), lambda: visao.df)
+
+def obter_df(versao):
+    """Resolve o token guardado em store-dados para o DataFrame já tipado em memória.
+
+    O DataFrame é compartilhado entre callbacks e não deve ser alterado.
+    """
+    return obter_snapshot(versao).df
+
 # ----------------------------
 # Callbacks
 # ----------------------------
@@ -556,12 +2031,76 @@ def inicializar_session_id(session_data):
 
 @app.callback(
     Output('store-dados', 'data'),
+    Output('intervalo-atualizacao', 'interval'),
+    Input('intervalo-atualizacao', 'n_intervals'),
+    State('store-dados', 'data'),
+    State('intervalo-atualizacao', 'interval')
+)
+def atualizar_store(n, versao_atual=None, intervalo_atual=None):
+    """Verifica se a versão dos dados mudou; quem busca a planilha é o atualizador em segundo plano."""
+    versao = cache_dados.obter().versao
+
+    # Enquanto a primeira carga não termina, verificar com mais frequência
+    intervalo = INTERVALO_VERIFICACAO_INICIAL_MS if versao == 'vazio' else INTERVALO_VERIFICACAO_MS
+    if intervalo == intervalo_atual:
+        intervalo = no_update
+
+    if versao == versao_atual:
+        # Dados inalterados: não disparar os callbacks que dependem do store
+        return no_update, intervalo
+    return versao, intervalo
+
+@app.callback(
+    Output('dados-de', 'children'),
+    Input('store-dados', 'data'),
     Input('intervalo-atualizacao', 'n_intervals')
 )
-def atualizar_store(n):
-    """Carrega os dados do Google Sheet e armazena em um dcc.Store."""
-    df = carregar_dados()
-    return df.to_json(date_format='iso', orient='split')
+def atualizar_dados_de(versao, n):
+    """Mostra de quando são os dados exibidos e avisa quando a planilha não pôde ser atualizada."""
+    snapshot = obter_snapshot(versao)
+    if snapshot.df.empty:
+        return ''
+    momento = snapshot.verificado_em or snapshot.carregado_em
+    texto = f"Dados de {momento:%d/%m/%Y %H:%M}"
+    if cache_dados.ultima_falha is not None:
+        return html.Span(f"{texto} — planilha inacessível, exibindo a última cópia disponível",
+                         style={'color': '#dc3545', 'fontWeight': 'bold'})
+    if snapshot.origem == 'disco':
+        texto += " (cópia local; atualizando)"
+    return texto
+
+@app.callback(
+    Output('indicador-alteracoes', 'children'),
+    Input('store-dados', 'data')
+)
+def atualizar_indicador_alteracoes(versao):
+    """Resume o que mudou nos documentos desde a atualização anterior dos dados."""
+    alteracoes = cache_dados.alteracoes(versao) if versao else None
+    if alteracoes is None:
+        return ''
+    if alteracoes.vazia:
+        return "Sem alterações nos documentos desde a última atualização"
+
+    pagos, reprogramados = alteracoes.pagos, alteracoes.reprogramados
+    outros = len(alteracoes.atualizados) - len(pagos.index.union(reprogramados.index))
+    contagens = [
+        (len(alteracoes.inseridos), 'novo(s)'),
+        (len(pagos), 'pago(s)'),
+        (len(reprogramados), 'reprogramado(s)'),
+        (outros, 'alterado(s)'),
+        (len(alteracoes.removidos), 'removido(s)'),
+    ]
+    texto = ', '.join(f"{n} {rotulo}" for n, rotulo in contagens if n)
+
+    # Dica com os primeiros documentos de cada tipo
+    detalhes = []
+    for rotulo, linhas in (('Novo', alteracoes.inseridos), ('Pago', pagos),
+                           ('Reprogramado', reprogramados), ('Removido', alteracoes.removidos)):
+        for _, linha in linhas.head(5).iterrows():
+            detalhes.append(f"{rotulo}: {linha['Nome Fantasia Agente']} - Doc. {linha['Número Doc.']} / AP {linha['AP']}")
+
+    return html.Span(f"Desde a última atualização ({alteracoes.calculado_em:%H:%M}): {texto}",
+                     title='\n'.join(detalhes))
 
 @app.callback(
     Output('dropdown-tipo-doc', 'options'),
@@ -569,8 +2108,8 @@ def atualizar_store(n):
     Output('dropdown-mes', 'options'),
     Input('store-dados', 'data')
 )
-def atualizar_opcoes(json_data):
-    df = pd.read_json(io.StringIO(json_data), orient='split') if json_data else pd.DataFrame()
+def atualizar_opcoes(versao):
+    df = obter_df(versao)
 
     if df.empty:
         return [], [], []
@@ -604,13 +2143,22 @@ def atualizar_opcoes(json_data):
 
     return tipos_doc, fornecedores, meses_opt
 
+def mascara_igual(serie, valor):
+    """Máscara booleana de `serie == valor`, comparando códigos inteiros em colunas categóricas."""
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        categorias = serie.cat.categories
+        if valor not in categorias:
+            return np.zeros(len(serie), dtype=bool)
+        return serie.cat.codes.to_numpy() == categorias.get_loc(valor)
+    return (serie == valor).to_numpy()
+
 def filtrar_dataframe(df, tipo_doc, status, fornecedor, mes):
     """Função auxiliar para aplicar filtros ao DataFrame."""
     df_filtrado = df.copy()
 
     # Aplicar filtros
     if tipo_doc and tipo_doc != 'todos' and 'Tipo Doc.' in df_filtrado.columns:
-        df_filtrado = df_filtrado[df_filtrado['Tipo Doc.'] == tipo_doc]
+        df_filtrado = df_filtrado[mascara_igual(df_filtrado['Tipo Doc.'], tipo_doc)]
 
     if status and status != 'todos' and 'Saldo em Aberto' in df_filtrado.columns:
         if status == 'aberto':
@@ -619,92 +2167,47 @@ def filtrar_dataframe(df, tipo_doc, status, fornecedor, mes):
             df_filtrado = df_filtrado[df_filtrado['Saldo em Aberto'] == 0]
 
     if fornecedor and fornecedor != 'todos' and 'Nome Fantasia Agente' in df_filtrado.columns:
-        df_filtrado = df_filtrado[df_filtrado['Nome Fantasia Agente'] == fornecedor]
+        df_filtrado = df_filtrado[mascara_igual(df_filtrado['Nome Fantasia Agente'], fornecedor)]
 
     if mes and mes != 'todos' and 'Mes' in df_filtrado.columns:
-        df_filtrado = df_filtrado[df_filtrado['Mes'] == mes]
+        df_filtrado = df_filtrado[mascara_igual(df_filtrado['Mes'], mes)]
     
     return df_filtrado
 
-@app.callback(
-    Output('total-liquidado', 'children'),
-    Output('total-aberto', 'children'),
-    Output('contas-vencidas', 'children'),
-    Output('total-geral', 'children'),
-    Input('dropdown-tipo-doc', 'value'),
-    Input('dropdown-status', 'value'),
-    Input('dropdown-fornecedor', 'value'),
-    Input('dropdown-mes', 'value'),
-    Input('store-dados', 'data')
-)
-def atualizar_kpis(tipo_doc, status, fornecedor, mes, json_data):
-    df = pd.read_json(io.StringIO(json_data), orient='split') if json_data else pd.DataFrame()
-
-    if df.empty or 'Mes' not in df.columns:
-        return "R$ 0,00", "R$ 0,00", "0", "R$ 0,00"
+MESES_PT = ['Janeiro', 'Fevereiro', 'Março', 'Abril', 'Maio', 'Junho', 'Julho', 'Agosto', 'Setembro', 'Outubro', 'Novembro', 'Dezembro']
 
-    # Se nenhum mês foi selecionado, usar o mês corrente
-    mes_selecionado = mes if mes and mes != 'todos' else datetime.now().strftime("%Y-%m")
+# Resultado dos cartões quando não há dados carregados
+CARTOES_VAZIOS = ("R$ 0,00", "R$ 0,00", "0", "R$ 0,00", '', '', '', '', 'R$ 0,00')
 
-    df_filtrado = filtrar_dataframe(df, tipo_doc, status, fornecedor, mes_selecionado)
-
-    # Cálculo dos KPIs
-    total_aberto = 0
-    total_liquidado = 0
-    total_geral = 0
-    contas_vencidas = 0
-
-    if 'Líquido' in df_filtrado.columns:
-        total_geral = df_filtrado['Líquido'].sum()
-        
-        if 'Saldo em Aberto' in df_filtrado.columns:
-            # Total Liquidado (Saldo em Aberto == 0)
-            total_liquidado = df_filtrado.loc[df_filtrado['Saldo em Aberto'] == 0, 'Líquido'].sum()
-            
-            # Total em Aberto
-            total_aberto = df_filtrado.loc[df_filtrado['Saldo em Aberto'] > 0, 'Saldo em Aberto'].sum()
-            
-            # Contas vencidas
-            if 'Vencido' in df_filtrado.columns:
-                contas_vencidas = len(df_filtrado[(df_filtrado['Vencido'] == True) & 
-                                                (df_filtrado['Saldo em Aberto'] > 0)])
-
-    return (
-        format_brl(total_liquidado),
-        format_brl(total_aberto),
-        str(contas_vencidas),
-        format_brl(total_geral)
-    )
-
-
-@app.callback(
-    Output('total-geral-delta', 'children'),
-    Input('dropdown-mes', 'value'),
-    Input('dropdown-tipo-doc', 'value'),
-    Input('dropdown-status', 'value'),
-    Input('dropdown-fornecedor', 'value'),
-    Input('store-dados', 'data')
-)
-def atualizar_total_geral_delta(mes, tipo_doc, status, fornecedor, json_data):
-    """Calcula variação percentual do Total Geral entre mês selecionado e mês anterior."""
-    df = pd.read_json(io.StringIO(json_data), orient='split') if json_data else pd.DataFrame()
-    if df.empty or 'Prorrogado' not in df.columns or 'Líquido' not in df.columns:
-        return ''
+def nome_mes_pt(mes_sel):
+    """Nome do mês ('AAAA-MM') em português."""
+    try:
+        return MESES_PT[pd.to_datetime(mes_sel).month - 1]
+    except Exception:
+        return pd.to_datetime(mes_sel).strftime('%B') if mes_sel else ''
 
-    # Determinar mês selecionado e mês anterior
+def calcular_kpis(snapshot, tipo_doc, status, fornecedor, mes):
+    """Calcula, numa única passada pelo cubo do snapshot, todos os valores dos cartões de KPI."""
+    # Se nenhum mês foi selecionado, usar o mês corrente
     mes_sel = mes if mes and mes != 'todos' else datetime.now().strftime('%Y-%m')
-    mes_dt = pd.to_datetime(mes_sel)
-    mes_anterior = (mes_dt - pd.DateOffset(months=1)).strftime('%Y-%m')
-
-    df['Mes'] = pd.to_datetime(df['Prorrogado']).dt.to_period('M').astype(str)
-
-    df_fil_sel = filtrar_dataframe(df, tipo_doc, status, fornecedor, mes_sel)
-    df_fil_ant = filtrar_dataframe(df, tipo_doc, status, fornecedor, mes_anterior)
-
-    total_sel = df_fil_sel['Líquido'].sum() if not df_fil_sel.empty and 'Líquido' in df_fil_sel.columns else 0
-    total_ant = df_fil_ant['Líquido'].sum() if not df_fil_ant.empty and 'Líquido' in df_fil_ant.columns else 0
-
-    # Calcular variação percentual
+    mes_anterior = (pd.to_datetime(mes_sel) - pd.DateOffset(months=1)).strftime('%Y-%m')
+    cubo = snapshot.cubo
+
+    totais = cubo.consultar(tipo_doc, status, fornecedor, mes_sel)
+    meses_vencidos, vencidos_anteriores = cubo.meses_em_aberto_antes(datetime.now().strftime('%Y-%m'))
+    return {
+        'mes_sel': mes_sel,
+        **totais,
+        'liquido_anterior': cubo.consultar(tipo_doc, status, fornecedor, mes_anterior)['liquido'],
+        # Saldo em aberto dos documentos PREV e PREVPDC do mês (sem os demais filtros)
+        'prev_prevpdc': sum(cubo.consultar(tipo, 'aberto', None, mes_sel)['aberto'] for tipo in ('PREV', 'PREVPDC')),
+        'vencidos_anteriores': vencidos_anteriores,
+        'meses_vencidos': meses_vencidos,
+    }
+
+def bloco_total_geral_delta(kpis):
+    """Variação percentual do Total Geral entre o mês selecionado e o mês anterior."""
+    total_sel, total_ant = kpis['liquido'], kpis['liquido_anterior']
     if total_ant == 0:
         if total_sel == 0:
             perc = 0
@@ -718,15 +2221,8 @@ def atualizar_total_geral_delta(mes, tipo_doc, status, fornecedor, json_data):
     color = 'red' if perc >= 0 else 'green'
     perc_str = f"{abs(perc):.1f}%"
 
-    # Nome do mês em português
-    meses_pt = ['Janeiro', 'Fevereiro', 'Março', 'Abril', 'Maio', 'Junho', 'Julho', 'Agosto', 'Setembro', 'Outubro', 'Novembro', 'Dezembro']
-    try:
-        mes_nome_pt = meses_pt[mes_dt.month - 1]
-    except Exception:
-        mes_nome_pt = pd.to_datetime(mes_sel).strftime('%B')
-
-    texto = html.Div([
-        html.Div(f"Mês Atual: {mes_nome_pt}", style={'fontSize': '12px', 'color': '#666'}),
+    return html.Div([
+        html.Div(f"Mês Atual: {nome_mes_pt(kpis['mes_sel'])}", style={'fontSize': '12px', 'color': '#666'}),
         html.Div([
             html.Span(arrow, style={'color': color, 'marginRight': '6px', 'fontSize': '14px'}),
             html.Span(perc_str, style={'fontWeight': '700', 'marginRight': '8px'}),
@@ -734,74 +2230,9 @@ def atualizar_total_geral_delta(mes, tipo_doc, status, fornecedor, json_data):
         ], style={'display': 'flex', 'justifyContent': 'center', 'alignItems': 'center', 'gap': '6px', 'marginTop': '6px'})
     ], style={'textAlign': 'center'})
 
-    return texto
-
-
-@app.callback(
-    Output('download-excel', 'data'),
-    Input('btn-export-excel', 'n_clicks'),
-    Input('tabela-contas', 'data'),
-    Input('dropdown-tipo-doc', 'value'),
-    Input('dropdown-status', 'value'),
-    Input('dropdown-fornecedor', 'value'),
-    Input('dropdown-mes', 'value'),
-    prevent_initial_call=True
-)
-def exportar_para_excel(n_clicks, dados_tabela, tipo_doc, status, fornecedor, mes):
-    """Exporta os dados da tabela filtrada para um arquivo Excel."""
-    if n_clicks is None or n_clicks == 0 or not dados_tabela:
-        return None
-    
-    # Criar DataFrame a partir dos dados da tabela
-    df_export = pd.DataFrame(dados_tabela)
-    
-    # Gerar nome do arquivo com data e hora atual
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filtros = []
-    if tipo_doc and tipo_doc != 'todos':
-        filtros.append(f"tipo_{tipo_doc}")
-    if status and status != 'todos':
-        filtros.append(f"status_{status}")
-    if fornecedor and fornecedor != 'todos':
-        filtros.append("fornecedor_filtrado")
-    if mes and mes != 'todos':
-        filtros.append(f"mes_{mes}")
-    
-    filtros_str = "_".join(filtros) if filtros else "completo"
-    filename = f"contas_a_pagar_{filtros_str}_{timestamp}.xlsx"
-    
-    # Criar arquivo Excel em memória usando pandas diretamente
-    output = io.BytesIO()
-    df_export.to_excel(output, sheet_name='Contas a Pagar', index=False)
-    
-    # Preparar para download
-    output.seek(0)
-    data = output.getvalue()
-    
-    return dcc.send_bytes(data, filename=filename)
-
-@app.callback(
-    Output('total-aberto-delta', 'children'),
-    Input('dropdown-mes', 'value'),
-    Input('dropdown-tipo-doc', 'value'),
-    Input('dropdown-status', 'value'),
-    Input('dropdown-fornecedor', 'value'),
-    Input('store-dados', 'data')
-)
-def atualizar_total_aberto_percent(mes, tipo_doc, status, fornecedor, json_data):
-    """Calcula o percentual do que está em aberto sobre o total (Líquido) no mês selecionado."""
-    df = pd.read_json(io.StringIO(json_data), orient='split') if json_data else pd.DataFrame()
-    if df.empty or 'Prorrogado' not in df.columns or 'Líquido' not in df.columns or 'Saldo em Aberto' not in df.columns:
-        return ''
-
-    mes_sel = mes if mes and mes != 'todos' else datetime.now().strftime('%Y-%m')
-    df['Mes'] = pd.to_datetime(df['Prorrogado']).dt.to_period('M').astype(str)
-
-    df_fil = filtrar_dataframe(df, tipo_doc, status, fornecedor, mes_sel)
-
-    total_geral = df_fil['Líquido'].sum() if not df_fil.empty else 0
-    total_aberto = df_fil.loc[df_fil['Saldo em Aberto'] > 0, 'Saldo em Aberto'].sum() if not df_fil.empty else 0
-
+def bloco_total_aberto_percent(kpis):
+    """Percentual do que está em aberto sobre o total (Líquido) no mês selecionado."""
+    total_geral, total_aberto = kpis['liquido'], kpis['aberto']
     if total_geral == 0:
         perc = 0
     else:
@@ -820,17 +2251,9 @@ def atualizar_total_aberto_percent(mes, tipo_doc, status, fornecedor, json_data)
     else:
         icon = '💰'
 
-    # Nome do mês em português, similar ao cartão Total Geral
-    meses_pt = ['Janeiro', 'Fevereiro', 'Março', 'Abril', 'Maio', 'Junho', 'Julho', 'Agosto', 'Setembro', 'Outubro', 'Novembro', 'Dezembro']
-    try:
-        mes_dt = pd.to_datetime(mes_sel)
-        mes_nome_pt = meses_pt[mes_dt.month - 1]
-    except Exception:
-        mes_nome_pt = pd.to_datetime(mes_sel).strftime('%B') if mes_sel else ''
-
     # Exibir o mês e, abaixo, o ícone seguido do percentual com rótulo ao lado
-    bloco = html.Div([
-        html.Div(f"Mês Atual: {mes_nome_pt}", style={'fontSize': '12px', 'color': '#666', 'marginBottom': '6px'}),
+    return html.Div([
+        html.Div(f"Mês Atual: {nome_mes_pt(kpis['mes_sel'])}", style={'fontSize': '12px', 'color': '#666', 'marginBottom': '6px'}),
         html.Div([
             html.Span(icon, style={'marginRight': '8px', 'fontSize': '14px'}),
             html.Span(perc_str, style={'fontWeight': '700', 'color': '#dc3545', 'marginRight': '8px'}),
@@ -838,31 +2261,9 @@ def atualizar_total_aberto_percent(mes, tipo_doc, status, fornecedor, json_data)
         ], style={'display': 'flex', 'justifyContent': 'center', 'alignItems': 'center', 'gap': '6px'})
     ], style={'textAlign': 'center'})
 
-    return bloco
-
-
-@app.callback(
-    Output('total-liquidado-delta', 'children'),
-    Input('dropdown-mes', 'value'),
-    Input('dropdown-tipo-doc', 'value'),
-    Input('dropdown-status', 'value'),
-    Input('dropdown-fornecedor', 'value'),
-    Input('store-dados', 'data')
-)
-def atualizar_total_liquidado_percent(mes, tipo_doc, status, fornecedor, json_data):
-    """Calcula o percentual liquidado (Total Liquidado / Total Geral) para o mês selecionado."""
-    df = pd.read_json(io.StringIO(json_data), orient='split') if json_data else pd.DataFrame()
-    if df.empty or 'Prorrogado' not in df.columns or 'Líquido' not in df.columns or 'Saldo em Aberto' not in df.columns:
-        return ''
-
-    mes_sel = mes if mes and mes != 'todos' else datetime.now().strftime('%Y-%m')
-    df['Mes'] = pd.to_datetime(df['Prorrogado']).dt.to_period('M').astype(str)
-
-    df_fil = filtrar_dataframe(df, tipo_doc, status, fornecedor, mes_sel)
-
-    total_geral = df_fil['Líquido'].sum() if not df_fil.empty else 0
-    total_liquidado = df_fil.loc[df_fil['Saldo em Aberto'] == 0, 'Líquido'].sum() if not df_fil.empty else 0
-
+def bloco_total_liquidado_percent(kpis):
+    """Percentual liquidado (Total Liquidado / Total Geral) para o mês selecionado."""
+    total_geral, total_liquidado = kpis['liquido'], kpis['liquidado']
     if total_geral == 0:
         # Se não há contas no período, considera-se 100% liquidado (nenhuma pendência)
         perc = 100
@@ -881,16 +2282,8 @@ def atualizar_total_liquidado_percent(mes, tipo_doc, status, fornecedor, json_da
     else:  # perc == 100
         icon = '🏆'  # Perfeito
 
-    # Nome do mês em português
-    meses_pt = ['Janeiro', 'Fevereiro', 'Março', 'Abril', 'Maio', 'Junho', 'Julho', 'Agosto', 'Setembro', 'Outubro', 'Novembro', 'Dezembro']
-    try:
-        mes_dt = pd.to_datetime(mes_sel)
-        mes_nome_pt = meses_pt[mes_dt.month - 1]
-    except Exception:
-        mes_nome_pt = pd.to_datetime(mes_sel).strftime('%B') if mes_sel else ''
-
-    bloco = html.Div([
-        html.Div(f"Mês Atual: {mes_nome_pt}", style={'fontSize': '12px', 'color': '#666', 'marginBottom': '6px'}),
+    return html.Div([
+        html.Div(f"Mês Atual: {nome_mes_pt(kpis['mes_sel'])}", style={'fontSize': '12px', 'color': '#666', 'marginBottom': '6px'}),
         html.Div([
             html.Span(icon, style={'marginRight': '8px', 'fontSize': '14px'}),
             html.Span(perc_str, style={'fontWeight': '700', 'color': '#28a745', 'marginRight': '8px'}),
@@ -898,127 +2291,713 @@ def atualizar_total_liquidado_percent(mes, tipo_doc, status, fornecedor, json_da
         ], style={'display': 'flex', 'justifyContent': 'center', 'alignItems': 'center', 'gap': '6px'})
     ], style={'textAlign': 'center'})
 
-    return bloco
-
-
-@app.callback(
-    Output('contas-vencidas-delta', 'children'),
-    Input('store-dados', 'data'),
-    Input('dropdown-mes', 'value')
-)
-def atualizar_contas_vencidas_delta(json_data, mes):
-    """Exibe o número de documentos vencidos de meses anteriores."""
-    df = pd.read_json(io.StringIO(json_data), orient='split') if json_data else pd.DataFrame()
-    if df.empty or 'Prorrogado' not in df.columns or 'Saldo em Aberto' not in df.columns:
-        return ''
-
-    # Garante que 'Prorrogado' é datetime
-    df['Prorrogado'] = pd.to_datetime(df['Prorrogado'], errors='coerce')
-
-    # Define o primeiro dia do mês atual
-    hoje = datetime.now()
-    primeiro_dia_mes_atual = hoje.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-
-    # Filtra documentos de meses anteriores que ainda estão em aberto
-    df_vencidos_anterior = df[
-        (df['Prorrogado'] < primeiro_dia_mes_atual) &
-        (df['Saldo em Aberto'] > 0)
-    ]
-    
-    num_vencidos_anterior = len(df_vencidos_anterior)
+def bloco_contas_vencidas_delta(kpis):
+    """Número de documentos vencidos de meses anteriores."""
+    num_vencidos_anterior = kpis['vencidos_anteriores']
     tooltip_text = ''
 
     if num_vencidos_anterior > 0:
         icon = '⚠️'
         text = f"{num_vencidos_anterior} - Vencido(s) em Meses Anteriores"
         color = "#ff6207"  # Laranja
-        
-        # Get the months of the overdue documents
-        meses_vencidos = df_vencidos_anterior['Prorrogado'].dt.strftime('%Y-%m').unique()
-        tooltip_text = 'Meses com docs vencidos: ' + ', '.join(sorted(meses_vencidos))
+        tooltip_text = 'Meses com docs vencidos: ' + ', '.join(kpis['meses_vencidos'])
     else:
         icon = '✅'
         text = "Nenhum doc vencido em meses ant."
         color = '#28a745'  # Verde
-        
-    # Determinar o nome do mês selecionado
-    mes_sel = mes if mes and mes != 'todos' else datetime.now().strftime('%Y-%m')
-    meses_pt = ['Janeiro', 'Fevereiro', 'Março', 'Abril', 'Maio', 'Junho', 'Julho', 'Agosto', 'Setembro', 'Outubro', 'Novembro', 'Dezembro']
-    try:
-        mes_dt = pd.to_datetime(mes_sel)
-        mes_nome_pt = meses_pt[mes_dt.month - 1]
-    except Exception:
-        mes_nome_pt = pd.to_datetime(mes_sel).strftime('%B') if mes_sel else ''
 
-    bloco = html.Div([
-        html.Div(f"Mês Atual: {mes_nome_pt}", style={'fontSize': '12px', 'color': '#666', 'marginBottom': '6px'}),
+    return html.Div([
+        html.Div(f"Mês Atual: {nome_mes_pt(kpis['mes_sel'])}", style={'fontSize': '12px', 'color': '#666', 'marginBottom': '6px'}),
         html.Div([
             html.Span(icon, style={'marginRight': '8px', 'fontSize': '14px'}),
             html.Span(text, style={'fontWeight': '700', 'color': color}, title=tooltip_text)
         ], style={'display': 'flex', 'justifyContent': 'center', 'alignItems': 'center', 'gap': '6px'})
     ], style={'textAlign': 'center'})
 
-    return bloco
-
 @app.callback(
+    Output('total-liquidado', 'children'),
+    Output('total-aberto', 'children'),
+    Output('contas-vencidas', 'children'),
+    Output('total-geral', 'children'),
+    Output('total-geral-delta', 'children'),
+    Output('total-aberto-delta', 'children'),
+    Output('total-liquidado-delta', 'children'),
+    Output('contas-vencidas-delta', 'children'),
     Output('card-prev-prevpdc', 'children'),
+    Input('dropdown-tipo-doc', 'value'),
+    Input('dropdown-status', 'value'),
+    Input('dropdown-fornecedor', 'value'),
     Input('dropdown-mes', 'value'),
     Input('store-dados', 'data')
 )
-def atualizar_card_prev_prevpdc(mes, json_data):
-    """Calcula o valor total dos documentos PREV e PREVPDC que estão em aberto no mês atual."""
-    df = pd.read_json(io.StringIO(json_data), orient='split') if json_data else pd.DataFrame()
-    if df.empty or 'Tipo Doc.' not in df.columns or 'Saldo em Aberto' not in df.columns or 'Prorrogado' not in df.columns:
-        return 'R$ 0,00'
-
-    # Usar o mês atual se nenhum mês foi selecionado
-    mes_atual = mes if mes and mes != 'todos' else datetime.now().strftime('%Y-%m')
-    
-    # Converter a coluna de data para datetime se necessário
-    df['Prorrogado'] = pd.to_datetime(df['Prorrogado'], errors='coerce')
-    df['Mes'] = df['Prorrogado'].dt.to_period('M').astype(str)
-    
-    # Filtrar por mês atual
-    df_mes_atual = df[df['Mes'] == mes_atual]
-    
-    # Filtrar apenas documentos PREV e PREVPDC que estão em aberto
-    df_prev_prevpdc = df_mes_atual[
-        (df_mes_atual['Tipo Doc.'].isin(['PREV', 'PREVPDC'])) & 
-        (df_mes_atual['Saldo em Aberto'] > 0)
-    ]
-    
-    # Calcular o total
-    total = df_prev_prevpdc['Saldo em Aberto'].sum() if not df_prev_prevpdc.empty else 0
+def atualizar_cards_kpi(tipo_doc, status, fornecedor, mes, versao):
+    """Atualiza todos os cartões de KPI e seus indicadores de uma só vez.
+
+    A duração de cada chamada aparece em /metrics, no histograma
+    dashboard_callback_duracao_segundos{callback="atualizar_cards_kpi"}.
+    """
+    snapshot = obter_snapshot(versao)
+    df = snapshot.df
+
+    if df.empty or 'Mes' not in df.columns:
+        return CARTOES_VAZIOS
+
+    kpis = calcular_kpis(snapshot, tipo_doc, status, fornecedor, mes)
+    resultado = (
+        format_brl(kpis['liquidado'], centavos=True),
+        format_brl(kpis['aberto'], centavos=True),
+        str(kpis['vencidos']),
+        format_brl(kpis['liquido'], centavos=True),
+        bloco_total_geral_delta(kpis),
+        bloco_total_aberto_percent(kpis),
+        bloco_total_liquidado_percent(kpis),
+        bloco_contas_vencidas_delta(kpis),
+        format_brl(kpis['prev_prevpdc'], centavos=True),
+    )
+
+    return resultado
+
+@app.callback(
+    Output('url-exportacao-excel', 'data'),
+    Input('btn-export-excel', 'n_clicks'),
+    State('dropdown-tipo-doc', 'value'),
+    State('dropdown-status', 'value'),
+    State('dropdown-fornecedor', 'value'),
+    State('dropdown-mes', 'value'),
+    State('dropdown-agrupamento', 'value'),
+    State('tabela-contas', 'sort_by'),
+    State('tabela-contas', 'filter_query'),
+    State('store-dados', 'data'),
+    prevent_initial_call=True
+)
+def exportar_para_excel(n_clicks, tipo_doc, status, fornecedor, mes, agrupamento, sort_by, filter_query, versao):
+    """Endereço de /exportar/excel com os filtros, a ordenação e a versão da tabela exibida.
+
+    Só o clique dispara a exportação (o resto é lido como State); o navegador
+    então baixa o arquivo desse endereço (ver o callback no cliente e
+    baixar_excel). O número do clique vai junto para que cada clique gere um
+    endereço novo.
+    """
+    if n_clicks is None or n_clicks == 0:
+        return None
+    parametros = {'tipo_doc': tipo_doc, 'status': status, 'fornecedor': fornecedor, 'mes': mes,
+                  'agrupamento': agrupamento, 'ordem': json.dumps(sort_by or []), 'filtro': filter_query or '',
+                  'versao': versao, 'clique': n_clicks}
+    return app.get_relative_path('/exportar/excel') + '?' + urlencode(
+        {chave: valor for chave, valor in parametros.items() if valor is not None})
+
+def preparar_exportacao(tipo_doc, status, fornecedor, mes, agrupamento, sort_by, filter_query, versao):
+    """(colunas, registros, agrupado, nome do arquivo) da tabela filtrada, com todas as páginas; None se vazia.
+
+    As linhas são remontadas no servidor a partir do snapshot, sem depender do
+    que está carregado no navegador, e os registros são gerados em blocos (ver
+    registros_exportacao), sem passar por cache_tabelas.
+    """
+    snapshot = obter_snapshot(versao)
+    if snapshot.df.empty or 'Mes' not in snapshot.df.columns:
+        return None
+    mes_selecionado = mes if mes and mes != 'todos' else datetime.now().strftime("%Y-%m")
+    df_filtrado = aplicar_filtro_tabela(linhas_filtradas(snapshot, tipo_doc, status, fornecedor, mes_selecionado),
+                                        filter_query or '')
+    nomes, registros = registros_exportacao(df_filtrado, agrupamento, list(ordem_tabela(sort_by)))
+    primeiro = next(registros, None)
+    if primeiro is None:
+        return None
+    registros = itertools.chain([primeiro], registros)
+
+    # Gerar nome do arquivo com data e hora atual
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    filtros = []
+    if tipo_doc and tipo_doc != 'todos':
+        filtros.append(f"tipo_{tipo_doc}")
+    if status and status != 'todos':
+        filtros.append(f"status_{status}")
+    if fornecedor and fornecedor != 'todos':
+        filtros.append("fornecedor_filtrado")
+    if mes and mes != 'todos':
+        filtros.append(f"mes_{mes}")
     
-    return format_brl(total)
+    filtros_str = "_".join(filtros) if filtros else "completo"
+    filename = f"contas_a_pagar_{filtros_str}_{timestamp}.xlsx"
+
+    return nomes, registros, visao_agrupada(df_filtrado, agrupamento), filename
+
+# Lançamentos por bloco na geração dos registros exportados
+LINHAS_BLOCO_EXPORTACAO = 20_000
+
+def visao_agrupada(df_filtrado, agrupamento):
+    """Se montar_tabela agrupa as linhas (com cabeçalhos e subtotais) ou mostra só os lançamentos."""
+    return 'Prorrogado' in df_filtrado.columns and (
+        agrupamento == 'diario' or (agrupamento == 'dia_filial' and 'Nome Fantasia Filial' in df_filtrado.columns))
+
+def registros_exportacao(df_filtrado, agrupamento, ordem=None, linhas_por_bloco=LINHAS_BLOCO_EXPORTACAO):
+    """Colunas e um gerador com os mesmos registros de montar_tabela, produzidos em blocos.
+
+    Nas visões agrupadas cada bloco reúne dias inteiros (em ordem de
+    vencimento), que geram exatamente os registros que teriam na tabela
+    completa; na visão simples, as linhas já ordenadas são convertidas em
+    fatias. Só um bloco de registros existe em memória por vez.
+    """
+    if not visao_agrupada(df_filtrado, agrupamento):
+        df_tabela = ordenar_tabela_simples(df_filtrado, ordem)
+        fatias = (df_tabela.iloc[inicio:inicio + linhas_por_bloco]
+                  for inicio in range(0, len(df_tabela), linhas_por_bloco))
+        return list(df_tabela.columns), (registro for fatia in fatias for registro in registros_tabela(fatia))
+
+    ordenado = df_filtrado.sort_values('Prorrogado', kind='stable')
+    dias = ordenado['Dia_Ord'].to_numpy()
+    inicios_dia = np.flatnonzero(np.r_[True, dias[1:] != dias[:-1]]) if len(dias) else np.array([], dtype=int)
+    # Cada corte cai no primeiro início de dia a partir de cada múltiplo de linhas_por_bloco
+    posicoes = np.searchsorted(inicios_dia, np.arange(linhas_por_bloco, len(ordenado), linhas_por_bloco))
+    cortes = np.unique(np.r_[0, inicios_dia[posicoes[posicoes < len(inicios_dia)]], len(ordenado)]).tolist()
+
+    def gerar():
+        for inicio, fim in zip(cortes, cortes[1:]):
+            yield from montar_tabela(ordenado.iloc[inicio:fim], agrupamento, ordem)[1]
+    return COLUNAS_TABELA, gerar()
+
+# Formatos e larguras das colunas no arquivo exportado
+FORMATO_DATA_EXCEL = 'DD/MM/YYYY'
+FORMATO_MOEDA_EXCEL = '"R$" #,##0.00'
+COLUNAS_MOEDA_EXCEL = ('Líquido', 'Saldo em Aberto')
+LARGURAS_EXCEL = {'Data': 40, 'Nome Fantasia Agente': 32, 'Tipo Doc.': 10, 'Número Doc.': 12, 'AP': 10,
+                  'Líquido': 16, 'Saldo em Aberto': 16, 'Complemento': 30}
+PADRAO_DATA_BR = re.compile(r'\d{2}/\d{2}/\d{4}$')
+
+def escrever_excel(nomes, registros, destino, agrupado=False):
+    """Grava os registros da tabela de contas num .xlsx com o openpyxl em modo write-only.
+
+    Cada linha é serializada assim que é anexada, então a memória não cresce
+    com o número de linhas; o arquivo compactado vai sendo gravado em
+    `destino` (um arquivo temporário, na rota de exportação). Datas e valores
+    vão como células tipadas, com formato de data e de moeda. Com `agrupado`
+    (ver visao_agrupada), as linhas de cabeçalho e subtotal saem em negrito:
+    nessas visões todo lançamento traz a data do seu dia, então são as linhas
+    sem uma data na coluna 'Data'. Sem agrupamento, todas são lançamentos.
+    """
+    livro = Workbook(write_only=True)
+    planilha = livro.create_sheet('Contas a Pagar')
+    planilha.freeze_panes = 'A2'
+    for numero, nome in enumerate(nomes, start=1):
+        planilha.column_dimensions[get_column_letter(numero)].width = LARGURAS_EXCEL.get(nome, 14)
+
+    negrito = Font(bold=True)
+
+    def celula(formato=None, destaque=False):
+        nova = WriteOnlyCell(planilha)
+        if formato:
+            nova.number_format = formato
+        if destaque:
+            nova.font = negrito
+        return nova
+
+    cabecalho = [celula(destaque=True) for _ in nomes]
+    for nova, nome in zip(cabecalho, nomes):
+        nova.value = nome
+    planilha.append(cabecalho)
+
+    # As mesmas células são reaproveitadas em todas as linhas: no modo
+    # write-only o conteúdo é gravado no momento do append
+    moeda = [FORMATO_MOEDA_EXCEL if nome in COLUNAS_MOEDA_EXCEL else None for nome in nomes]
+    lancamento = [celula(FORMATO_DATA_EXCEL if nome == 'Data' else formato) for nome, formato in zip(nomes, moeda)]
+    agrupamento = [celula(formato, destaque=True) for formato in moeda]
+    posicao_data = nomes.index('Data') if 'Data' in nomes else None
+
+    datas = {}  # texto dd/mm/aaaa -> date (poucas datas distintas para muitas linhas)
+    for registro in registros:
+        data = None
+        if posicao_data is not None:
+            texto = registro.get('Data')
+            data = datas.get(texto)
+            if data is None and isinstance(texto, str) and PADRAO_DATA_BR.match(texto):
+                data = datas[texto] = datetime.strptime(texto, '%d/%m/%Y').date()
+        linha = agrupamento if agrupado and data is None and posicao_data is not None else lancamento
+        for nova, nome in zip(linha, nomes):
+            valor = registro.get(nome)
+            nova.value = None if valor == '' else valor
+        if data is not None:
+            linha[posicao_data].value = data
+        planilha.append(linha)
+
+    livro.save(destino)
+
+# Colunas exibidas na tabela de contas, na ordem da tela
+COLUNAS_TABELA = ['Data', 'Nome Fantasia Agente', 'Tipo Doc.', 'Número Doc.', 'AP', 'Líquido', 'Saldo em Aberto', 'Complemento']
+
+# Textos que não devem aparecer na tabela (restos de conversões de valores ausentes)
+TEXTOS_VAZIOS = {'None', 'nan', 'NaN', 'NaT'}
+
+# dicionário simples de abreviações para nomes longos de filial
+ABREVIACOES_FILIAL = {
+    'ALTIPLANO ENGENHARIA LTDA': 'ALTIPLANO',
+    'ATP SERVIÇO EM ACESSO POR CORDAS E TREINAMENTOS LTDA': 'ATP'
+}
+
+def colunas_tabela(nomes):
+    """Definição das colunas da tabela, com formato de moeda nas colunas de valor."""
+    columns = [{"name": i, "id": i} for i in nomes]
+
+    money_cols = ['Líquido', 'Saldo em Aberto']
+    for col in columns:
+        if col['id'] in money_cols:
+            col['type'] = 'numeric'
+            col['format'] = Format(
+                scheme=Scheme.fixed,
+                precision=2,
+                group=Group.yes,
+                group_delimiter='.',
+                decimal_delimiter=',',
+                symbol=Symbol.yes,
+                symbol_prefix='R$ '
+            )
+    return columns
+
+def registros_tabela(df_tabela):
+    """Converte o DataFrame da tabela nos registros exibidos, sem valores ausentes visíveis."""
+    if 'Tipo Doc.' in df_tabela.columns:
+        df_tabela['Tipo Doc.'] = df_tabela['Tipo Doc.'].astype(str).str.strip()
+
+    # Remover valores None/NaN que aparecem como 'None' na tabela: usar string vazia
+    # (colunas categóricas viram texto antes, pois '' não é uma de suas categorias)
+    categoricas = df_tabela.select_dtypes('category').columns
+    df_tabela = df_tabela.astype({col: object for col in categoricas}).fillna('')
+    # Alguns valores já foram convertidos para a string 'None' em etapas anteriores;
+    # substituir essas strings indesejadas por string vazia para não aparecerem na UI.
+    df_tabela = df_tabela.replace({texto: '' for texto in TEXTOS_VAZIOS})
+
+    return df_tabela.to_dict('records')
+
+def valores_celula(serie, aparar=False):
+    """Valores de uma coluna como aparecem na tabela: ausentes e TEXTOS_VAZIOS viram ''."""
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        # Converte só as categorias e expande pelos códigos (-1, ausente, cai no '' final)
+        tabela = np.array(valores_celula(pd.Series(serie.cat.categories), aparar) + [''], dtype=object)
+        return tabela[serie.cat.codes.to_numpy()].tolist()
+
+    valores = serie.to_numpy(dtype=object, na_value='')
+    if aparar:
+        valores = np.array([str(valor).strip() if valor != '' else valor for valor in valores], dtype=object)
+    if not pd.api.types.is_numeric_dtype(serie.dtype):
+        valores[pd.Series(valores, dtype=object).isin(TEXTOS_VAZIOS).to_numpy()] = ''
+    return valores.tolist()
+
+def montar_registros_dia_filial(df, ordem=None):
+    """Registros da visão "Agrupado por Dia e Filial", montados numa única passada.
+
+    Para cada dia (em ordem de vencimento) e cada filial do dia: uma linha de
+    cabeçalho, os lançamentos (do maior para o menor Líquido, ou na `ordem`
+    pedida, uma lista de pares (coluna, crescente)) e o total da filial; ao
+    fim do dia, a linha 'TOTAL DIA' (que inclui lançamentos sem filial). Os
+    totais saem de somas por segmento sobre os centavos.
+    """
+    colunas_ordem, crescente = zip(*(ordem or [('Líquido', False)]))
+    ordenado = df.sort_values(['Prorrogado', 'Nome Fantasia Filial', *colunas_ordem],
+                              ascending=[True, True, *crescente])
+    ordenado = ordenado[ordenado['Data_fmt'].notna().to_numpy()]
+    if ordenado.empty:
+        return []
+
+    # Segmentos contíguos de (dia, filial); a ordenação garante que cada um é um bloco
+    dias, _ = pd.factorize(ordenado['Data_fmt'])
+    filiais, nomes_filiais = pd.factorize(ordenado['Nome Fantasia Filial'])
+    muda_dia = np.r_[True, dias[1:] != dias[:-1]]
+    inicios = np.flatnonzero(muda_dia | np.r_[True, filiais[1:] != filiais[:-1]])
+    fins = np.r_[inicios[1:], len(ordenado)]
+    inicios_dia = np.flatnonzero(muda_dia)
+
+    liquido = ordenado['Líquido_centavos'].to_numpy()
+    saldo = ordenado['Saldo em Aberto_centavos'].to_numpy()
+    liquido_segmento = (np.add.reduceat(liquido, inicios) / 100).tolist()
+    saldo_segmento = (np.add.reduceat(saldo, inicios) / 100).tolist()
+    liquido_dia = (np.add.reduceat(liquido, inicios_dia) / 100).tolist()
+    saldo_dia = (np.add.reduceat(saldo, inicios_dia) / 100).tolist()
+
+    lancamentos = registros_lancamentos(ordenado)
+
+    vazio = dict.fromkeys(COLUNAS_TABELA, '')
+    exibicao = [ABREVIACOES_FILIAL.get(filial.strip().upper(), filial) for filial in nomes_filiais]
+    registros = []
+    dia_atual = 0
+    for k, (inicio, fim) in enumerate(zip(inicios.tolist(), fins.tolist())):
+        data_str = lancamentos[inicio]['Data']
+        if filiais[inicio] >= 0:
+            filial_display = exibicao[filiais[inicio]]
+            registros.append({**vazio, 'Data': f"Data: {data_str} - Filial: {filial_display}"})
+            registros.extend(lancamentos[inicio:fim])
+            registros.append({**vazio, 'Data': f"Total {data_str} - {filial_display}",
+                              'Líquido': liquido_segmento[k], 'Saldo em Aberto': saldo_segmento[k]})
+
+        # Último segmento do dia: total de todas as filiais
+        if fim == len(ordenado) or muda_dia[fim]:
+            registros.append({**vazio, 'Data': f"TOTAL DIA: {data_str}",
+                              'Líquido': liquido_dia[dia_atual], 'Saldo em Aberto': saldo_dia[dia_atual]})
+            dia_atual += 1
+    return registros
+
+def montar_registros_diario(df, ordem=None):
+    """Registros da visão "Agrupado por Dia", montados numa única passada.
+
+    Para cada dia (em ordem de vencimento): uma linha 'Data: ...', os
+    lançamentos (do maior para o menor Líquido, ou na `ordem` pedida) e o
+    'Total do dia'. Lançamentos sem data ficam de fora, como na visão por
+    dia e filial.
+    """
+    colunas_ordem, crescente = zip(*(ordem or [('Líquido', False)]))
+    ordenado = df.sort_values(['Prorrogado', *colunas_ordem], ascending=[True, *crescente])
+    ordenado = ordenado[ordenado['Data_fmt'].notna().to_numpy()]
+    if ordenado.empty:
+        return []
+
+    dias, _ = pd.factorize(ordenado['Data_fmt'])
+    inicios = np.flatnonzero(np.r_[True, dias[1:] != dias[:-1]])
+    fins = np.r_[inicios[1:], len(ordenado)]
+    liquido_dia = (np.add.reduceat(ordenado['Líquido_centavos'].to_numpy(), inicios) / 100).tolist()
+    saldo_dia = (np.add.reduceat(ordenado['Saldo em Aberto_centavos'].to_numpy(), inicios) / 100).tolist()
+    lancamentos = registros_lancamentos(ordenado)
+
+    vazio = dict.fromkeys(COLUNAS_TABELA, '')
+    registros = []
+    for k, (inicio, fim) in enumerate(zip(inicios.tolist(), fins.tolist())):
+        data_str = lancamentos[inicio]['Data']
+        registros.append({**vazio, 'Data': f"Data: {data_str}"})
+        registros.extend(lancamentos[inicio:fim])
+        registros.append({**vazio, 'Data': f"Total do dia {data_str}",
+                          'Líquido': liquido_dia[k], 'Saldo em Aberto': saldo_dia[k]})
+    return registros
+
+def registros_lancamentos(ordenado):
+    """Lançamentos já no formato de registro da tabela, na ordem de `ordenado`."""
+    colunas = {
+        'Data': ordenado['Data_fmt'].astype(object).tolist(),
+        'Nome Fantasia Agente': valores_celula(ordenado['Nome Fantasia Agente']),
+        'Tipo Doc.': valores_celula(ordenado['Tipo Doc.'], aparar=True),
+        'Número Doc.': valores_celula(ordenado['Número Doc.']),
+        'AP': valores_celula(ordenado['AP']),
+        'Líquido': valores_celula(ordenado['Líquido']),
+        'Saldo em Aberto': valores_celula(ordenado['Saldo em Aberto']),
+        'Complemento': valores_celula(ordenado['Complemento']),
+    }
+    return [dict(zip(COLUNAS_TABELA, linha)) for linha in zip(*(colunas[c] for c in COLUNAS_TABELA))]
+
+# Colunas do DataFrame usadas ao filtrar e ordenar cada coluna exibida (a data ordena cronologicamente)
+COLUNAS_FILTRO = {'Data': 'Data_fmt'}
+COLUNAS_ORDENACAO = {'Data': 'Prorrogado'}
+
+OPERADORES_FILTRO = {
+    '=': operator.eq, 'eq': operator.eq, '!=': operator.ne, 'ne': operator.ne,
+    '<': operator.lt, 'lt': operator.lt, '<=': operator.le, 'le': operator.le,
+    '>': operator.gt, 'gt': operator.gt, '>=': operator.ge, 'ge': operator.ge,
+}
+
+# Uma condição do filter_query da DataTable, ex.: '{Tipo Doc.} s= NF' ou '{Líquido} > 1000'
+PADRAO_FILTRO = re.compile(
+    r'^\{(?P<coluna>[^}]+)\}\s+(?P<caixa>[si]?)'
+    r'(?P<operador>contains|datestartswith|eq|ne|lt|le|gt|ge|!=|<=|>=|=|<|>)\s+(?P<valor>.+)$'
+)
+
+def aplicar_filtro_tabela(df, filtro):
+    """Aplica o filter_query da tabela às linhas do DataFrame; condições não reconhecidas são ignoradas."""
+    if not filtro:
+        return df
+    mascara = np.ones(len(df), dtype=bool)
+    for parte in filtro.split(' && '):
+        condicao = PADRAO_FILTRO.match(parte.strip())
+        if not condicao:
+            continue
+        coluna = COLUNAS_FILTRO.get(condicao['coluna'], condicao['coluna'])
+        if coluna not in df.columns:
+            continue
+        valor = condicao['valor'].strip()
+        if len(valor) > 1 and valor[0] == valor[-1] and valor[0] in '"\'`':
+            valor = valor[1:-1]
+        operador = condicao['operador']
+        serie = df[coluna]
+
+        if pd.api.types.is_numeric_dtype(serie.dtype) and operador in OPERADORES_FILTRO:
+            numero = pd.to_numeric(valor.replace(',', '.'), errors='coerce')
+            if pd.isna(numero):
+                mascara[:] = False
+                continue
+            resultado = OPERADORES_FILTRO[operador](serie.to_numpy(), numero)
+        else:
+            texto = serie.astype(object).fillna('').astype(str)
+            if condicao['caixa'] == 'i':
+                texto, valor = texto.str.lower(), valor.lower()
+            if operador == 'contains':
+                resultado = texto.str.contains(valor, regex=False)
+            elif operador == 'datestartswith':
+                resultado = texto.str.startswith(valor)
+            else:
+                resultado = OPERADORES_FILTRO[operador](texto, valor)
+        mascara &= np.asarray(resultado, dtype=bool)
+    return df[mascara]
+
+def montar_tabela(df_filtrado, agrupamento, ordem=None):
+    """Colunas e registros completos da tabela para o agrupamento escolhido.
+
+    `ordem` é uma lista de pares (coluna, crescente) vinda da ordenação da
+    tabela; nas visões agrupadas ela ordena os lançamentos dentro de cada
+    bloco, sem mudar a ordem dos dias e filiais.
+    """
+    # Visões agrupadas: registros montados direto no formato final, sem passar por um DataFrame intermediário
+    if agrupamento == 'diario' and 'Prorrogado' in df_filtrado.columns:
+        return COLUNAS_TABELA, montar_registros_diario(df_filtrado, ordem)
+    if agrupamento == 'dia_filial' and 'Prorrogado' in df_filtrado.columns and 'Nome Fantasia Filial' in df_filtrado.columns:
+        return COLUNAS_TABELA, montar_registros_dia_filial(df_filtrado, ordem)
+
+    df_tabela = ordenar_tabela_simples(df_filtrado, ordem)
+    return list(df_tabela.columns), registros_tabela(df_tabela)
+
+def ordenar_tabela_simples(df_filtrado, ordem=None):
+    """Colunas exibidas da visão sem agrupamento, já ordenadas (por padrão, maior Líquido primeiro)."""
+    colunas_exibir = ['Data_fmt', 'Nome Fantasia Agente', 'Tipo Doc.', 'Número Doc.', 'AP', 'Líquido', 'Saldo em Aberto', 'Complemento']
+    colunas_disponiveis = [col for col in colunas_exibir if col in df_filtrado.columns]
+    if ordem:
+        colunas_ordem, crescente = zip(*ordem)
+        df_tabela = df_filtrado.sort_values(list(colunas_ordem), ascending=list(crescente), kind='stable')[colunas_disponiveis]
+    else:
+        df_tabela = df_filtrado[colunas_disponiveis].copy()
+
+        # Ordenar decrescente pela coluna 'Líquido' se existir
+        if 'Líquido' in df_tabela.columns:
+            df_tabela = df_tabela.sort_values('Líquido', ascending=False)
+
+    return df_tabela.rename(columns={'Data_fmt': 'Data'})
+
+def ordem_tabela(sort_by):
+    """Converte o sort_by da tabela em pares (coluna do DataFrame, crescente)."""
+    return tuple(
+        (COLUNAS_ORDENACAO.get(item['column_id'], item['column_id']), item.get('direction') == 'asc')
+        for item in (sort_by or []) if item.get('column_id') in COLUNAS_TABELA
+    )
+
+def tabela_completa(versao, tipo_doc, status, fornecedor, agrupamento, mes, ordem=(), filtro=''):
+    """Tabela inteira (colunas, registros e inícios de bloco) de uma combinação de filtros.
+
+    Guardada em cache_tabelas, de modo que trocar de página só recorta a
+    lista já montada. A chave usa a versão do snapshot de fato resolvido e o
+    mês já resolvido, então dados novos (ou a virada do mês) geram uma
+    tabela nova. A lista devolvida é compartilhada e não deve ser alterada.
+    """
+    snapshot = obter_snapshot(versao)
+    df = snapshot.df
+    if df.empty or 'Mes' not in df.columns:
+        return [], [], None
+
+    # Se nenhum mês foi selecionado, usar o mês corrente
+    mes_selecionado = mes if mes and mes != 'todos' else datetime.now().strftime("%Y-%m")
+    chave = (snapshot.versao, 'tabela', tipo_doc, status, fornecedor, agrupamento, mes_selecionado, ordem, filtro)
+    return cache_tabelas.obter(chave, lambda: montar_tabela_completa(
+        snapshot, tipo_doc, status, fornecedor, agrupamento, mes_selecionado, ordem, filtro))
+
+def montar_tabela_completa(snapshot, tipo_doc, status, fornecedor, agrupamento, mes, ordem=(), filtro=''):
+    """Monta a tabela de tabela_completa, sem passar pelo cache."""
+    df_filtrado = aplicar_filtro_tabela(linhas_filtradas(snapshot, tipo_doc, status, fornecedor, mes), filtro)
+
+    nomes, registros = montar_tabela(df_filtrado, agrupamento, list(ordem))
+    blocos = None
+    if agrupamento in ('diario', 'dia_filial'):
+        # Cada bloco começa numa linha de cabeçalho ('Data: ...') e termina nos seus totais
+        blocos = [i for i, registro in enumerate(registros) if str(registro['Data']).startswith('Data: ')]
+        if not blocos or blocos[0] != 0:
+            blocos.insert(0, 0)
+    return nomes, registros, blocos
+
+def paginar_registros(registros, blocos, pagina, tamanho):
+    """Registros da página pedida e o total de páginas.
+
+    Sem blocos, as páginas são fatias fixas de `tamanho` linhas. Nas visões
+    agrupadas as páginas só quebram entre blocos (cabeçalho, lançamentos e
+    subtotais); um bloco maior que a página continua na seguinte com o
+    cabeçalho repetido, e os subtotais ficam sempre ao fim do seu bloco.
+    """
+    tamanho = max(int(tamanho or TAMANHO_PAGINA_TABELA), 2)
+    if blocos is None:
+        total_paginas = max(1, -(-len(registros) // tamanho))
+        pagina = min(max(pagina or 0, 0), total_paginas - 1)
+        return registros[pagina * tamanho:(pagina + 1) * tamanho], total_paginas
+
+    # Cada página é uma lista de trechos (início do bloco, início, fim)
+    paginas, atual, ocupadas = [], [], 0
+    for bloco, fim in zip(blocos, blocos[1:] + [len(registros)]):
+        if ocupadas + (fim - bloco) <= tamanho:
+            atual.append((bloco, bloco, fim))
+            ocupadas += fim - bloco
+            continue
+        if atual:
+            paginas.append(atual)
+            atual, ocupadas = [], 0
+        posicao = bloco
+        while posicao < fim:
+            continuacao = posicao > bloco
+            corte = min(fim, posicao + tamanho - continuacao)
+            if corte == fim:
+                atual, ocupadas = [(bloco, posicao, corte)], corte - posicao + continuacao
+            else:
+                paginas.append([(bloco, posicao, corte)])
+            posicao = corte
+    if atual:
+        paginas.append(atual)
+    if not paginas:
+        return [], 1
+
+    pagina = min(max(pagina or 0, 0), len(paginas) - 1)
+    janela = []
+    for bloco, inicio, fim in paginas[pagina]:
+        if inicio > bloco:
+            cabecalho = registros[bloco]
+            janela.append({**cabecalho, 'Data': f"{cabecalho['Data']} (continuação)"})
+        janela.extend(registros[inicio:fim])
+    return janela, len(paginas)
+
+@app.callback(
+    Output('tabela-contas', 'page_current'),
+    Input('dropdown-tipo-doc', 'value'),
+    Input('dropdown-status', 'value'),
+    Input('dropdown-fornecedor', 'value'),
+    Input('dropdown-agrupamento', 'value'),
+    Input('dropdown-mes', 'value'),
+    Input('tabela-contas', 'sort_by'),
+    Input('tabela-contas', 'filter_query')
+)
+def reiniciar_pagina_tabela(*_):
+    """Volta à primeira página quando os filtros ou a ordenação mudam."""
+    return 0
 
 @app.callback(
-    Output('grafico-vencimentos', 'figure'),
-    Output('grafico-fornecedores', 'figure'),
     Output('tabela-contas', 'columns'),
     Output('tabela-contas', 'data'),
+    Output('tabela-contas', 'page_count'),
+    Output('estado-tabela', 'data'),
     Input('dropdown-tipo-doc', 'value'),
     Input('dropdown-status', 'value'),
     Input('dropdown-fornecedor', 'value'),
     Input('dropdown-agrupamento', 'value'),
     Input('dropdown-mes', 'value'),
-    Input('store-dados', 'data')
+    Input('store-dados', 'data'),
+    Input('tabela-contas', 'page_current'),
+    Input('tabela-contas', 'page_size'),
+    Input('tabela-contas', 'sort_by'),
+    Input('tabela-contas', 'filter_query'),
+    State('estado-tabela', 'data')
 )
-def atualizar_graficos_e_tabela(tipo_doc, status, fornecedor, agrupamento, mes, json_data):
-    df = pd.read_json(io.StringIO(json_data), orient='split') if json_data else pd.DataFrame()
-    
-    # FIX: Converter a coluna de data de string (do JSON) para datetime
-    if 'Prorrogado' in df.columns:
-        df['Prorrogado'] = pd.to_datetime(df['Prorrogado'], errors='coerce')
+def atualizar_tabela(tipo_doc, status, fornecedor, agrupamento, mes, versao,
+                     page_current=0, page_size=TAMANHO_PAGINA_TABELA, sort_by=None, filter_query='', estado=None):
+    """Envia ao navegador só a página visível da tabela, montada a partir do snapshot em cache.
+
+    Quando só a versão dos dados mudou, envia um Patch com as linhas da página que mudaram.
+    """
+    chave = [tipo_doc, status, fornecedor, agrupamento, mes, page_current, page_size, sort_by or [], filter_query or '']
+    novo_estado = {'versao': versao, 'chave': chave}
+    if estado == novo_estado:
+        return no_update, no_update, no_update, no_update
+
+    def pagina_da_versao(versao_dados):
+        nomes, registros, blocos = tabela_completa(
+            versao_dados, tipo_doc, status, fornecedor, agrupamento, mes,
+            ordem_tabela(sort_by), filter_query or ''
+        )
+        if not nomes:
+            return [], [], 1
+        pagina, total_paginas = paginar_registros(registros, blocos, page_current, page_size)
+        return nomes, pagina, total_paginas
+
+    nomes, pagina, total_paginas = pagina_da_versao(versao)
+    if not nomes:
+        return [], [], 1, novo_estado
+
+    if estado and estado['chave'] == chave and cache_dados.retida(estado['versao']):
+        # Atualização dos dados com os mesmos filtros: comparar com a página já exibida
+        nomes_antes, pagina_antes, total_antes = pagina_da_versao(estado['versao'])
+        if nomes_antes == nomes:
+            return (no_update, diferenca_registros(pagina_antes, pagina),
+                    no_update if total_antes == total_paginas else total_paginas, novo_estado)
+
+    return colunas_tabela(nomes), pagina, total_paginas, novo_estado
+
+def diferenca_registros(antes, depois):
+    """Patch que transforma a lista `antes` em `depois` trocando só as linhas diferentes."""
+    patch = Patch()
+    alteracoes = 0
+    for i, (linha_antes, linha_depois) in enumerate(zip(antes, depois)):
+        if linha_antes != linha_depois:
+            patch[i] = linha_depois
+            alteracoes += 1
+    if len(depois) > len(antes):
+        patch.extend(depois[len(antes):])
+        alteracoes += 1
+    for i in range(len(antes) - 1, len(depois) - 1, -1):
+        del patch[i]
+        alteracoes += 1
+    return patch if alteracoes else no_update
+
+def diferenca_figura(figura_antes, figura_depois):
+    """Patch com só os atributos de traço que mudaram entre duas figuras.
+
+    As figuras chegam serializadas (como guardadas em cache_figuras). Se o
+    layout ou a quantidade/estrutura dos traços mudou, devolve a figura nova
+    inteira; se nada mudou, no_update.
+    """
+    antes, depois = json.loads(figura_antes), json.loads(figura_depois)
+    if antes['layout'] != depois['layout'] or len(antes['data']) != len(depois['data']):
+        return depois
+    patch = Patch()
+    alteracoes = 0
+    for i, (traco_antes, traco_novo) in enumerate(zip(antes['data'], depois['data'])):
+        if traco_antes.keys() != traco_novo.keys():
+            return depois
+        for atributo, valor in traco_novo.items():
+            if traco_antes[atributo] != valor:
+                patch['data'][i][atributo] = valor
+                alteracoes += 1
+    return patch if alteracoes else no_update
+
+@app.callback(
+    Output('grafico-vencimentos', 'figure'),
+    Output('grafico-fornecedores', 'figure'),
+    Output('estado-graficos', 'data'),
+    Input('dropdown-tipo-doc', 'value'),
+    Input('dropdown-status', 'value'),
+    Input('dropdown-fornecedor', 'value'),
+    Input('dropdown-mes', 'value'),
+    Input('store-dados', 'data'),
+    State('estado-graficos', 'data')
+)
+def atualizar_graficos(tipo_doc, status, fornecedor, mes, versao, estado=None):
+    """Atualiza os gráficos; numa atualização dos dados com os mesmos filtros envia só os traços alterados."""
+    chave = [tipo_doc, status, fornecedor, mes]
+    novo_estado = {'versao': versao, 'chave': chave}
+    if estado == novo_estado:
+        return no_update, no_update, no_update
+
+    fig_vencimentos, fig_fornecedores = graficos_serializados(obter_snapshot(versao), tipo_doc, status, fornecedor, mes)
+    if estado and estado['chave'] == chave and cache_dados.retida(estado['versao']):
+        antes_vencimentos, antes_fornecedores = graficos_serializados(
+            cache_dados.resolver(estado['versao']), tipo_doc, status, fornecedor, mes)
+        return (diferenca_figura(antes_vencimentos, fig_vencimentos),
+                diferenca_figura(antes_fornecedores, fig_fornecedores), novo_estado)
+    return json.loads(fig_vencimentos), json.loads(fig_fornecedores), novo_estado
+
+def graficos_serializados(snapshot, tipo_doc, status, fornecedor, mes):
+    """Os dois gráficos em JSON, montados uma vez por versão e combinação de filtros (ver cache_figuras)."""
+    # O mês vazio vira o mês corrente, então ele entra na chave já resolvido
+    mes_selecionado = mes if mes and mes != 'todos' else datetime.now().strftime("%Y-%m")
+    chave = (snapshot.versao, 'graficos', tipo_doc, status, fornecedor, mes_selecionado)
+    return cache_figuras.obter(chave, lambda: tuple(
+        figura.to_json() for figura in montar_graficos(snapshot, tipo_doc, status, fornecedor, mes)))
+
+def montar_graficos(snapshot, tipo_doc, status, fornecedor, mes):
+    """Gráficos de top 5 dias e top 10 fornecedores por saldo em aberto."""
+    df = snapshot.df
 
     if df.empty or 'Mes' not in df.columns:
         empty_fig = go.Figure()
-        return empty_fig, empty_fig, empty_fig, [], []
+        return empty_fig, empty_fig
 
     # Se nenhum mês foi selecionado, usar o mês corrente
     mes_selecionado = mes if mes and mes != 'todos' else datetime.now().strftime("%Y-%m")
 
-    df_filtrado = filtrar_dataframe(df, tipo_doc, status, fornecedor, mes_selecionado)
+    df_filtrado = linhas_filtradas(snapshot, tipo_doc, status, fornecedor, mes_selecionado)
 
     # Gráficos
     # Substituir: mostrar os 5 dias do mês selecionado com maior volume de pagamentos (soma de 'Líquido')
@@ -1026,13 +3005,13 @@ def atualizar_graficos_e_tabela(tipo_doc, status, fornecedor, agrupamento, mes,
     if not df_filtrado.empty and 'Prorrogado' in df_filtrado.columns and 'Saldo em Aberto' in df_filtrado.columns:
         df_days = df_filtrado.dropna(subset=['Prorrogado']).copy()
         if not df_days.empty:
-            df_days['Dia'] = df_days['Prorrogado'].dt.strftime('%d/%m/%Y')
-            daily_sum = df_days.groupby('Dia', as_index=False)['Saldo em Aberto'].sum()
+            daily_sum = df_days.rename(columns={'Data_fmt': 'Dia'}).groupby('Dia', as_index=False, observed=True)['Saldo em Aberto_centavos'].sum()
             # top5 dias por saldo em aberto
-            top5 = daily_sum.nlargest(5, 'Saldo em Aberto').sort_values('Saldo em Aberto', ascending=True)
+            top5 = daily_sum.nlargest(5, 'Saldo em Aberto_centavos').sort_values('Saldo em Aberto_centavos', ascending=True)
+            top5['Saldo em Aberto'] = top5['Saldo em Aberto_centavos'] / 100
 
             # preparar texto formatado em moeda brasileira para aparecer dentro das barras
-            top5['Saldo_fmt'] = top5['Saldo em Aberto'].apply(lambda v: format_brl(v))
+            top5['Saldo_fmt'] = top5['Saldo em Aberto_centavos'].apply(lambda v: format_brl(v, centavos=True))
 
             # destacar o maior dia (último da ordenação ascendente)
             colors = ['#636efa'] * len(top5)
@@ -1069,8 +3048,9 @@ def atualizar_graficos_e_tabela(tipo_doc, status, fornecedor, agrupamento, mes,
 
     fig_fornecedores = go.Figure()
     if not df_filtrado.empty and 'Nome Fantasia Agente' in df_filtrado.columns and 'Saldo em Aberto' in df_filtrado.columns:
-        forn_valores = df_filtrado.groupby('Nome Fantasia Agente', as_index=False)['Saldo em Aberto'].sum()
-        forn_valores = forn_valores.nlargest(10, 'Saldo em Aberto')
+        forn_valores = df_filtrado.groupby('Nome Fantasia Agente', as_index=False, observed=True)['Saldo em Aberto_centavos'].sum()
+        forn_valores = forn_valores.nlargest(10, 'Saldo em Aberto_centavos')
+        forn_valores['Saldo em Aberto'] = forn_valores['Saldo em Aberto_centavos'] / 100
         fig_fornecedores = px.bar(
             forn_valores,
             x='Saldo em Aberto',
@@ -1080,218 +3060,30 @@ def atualizar_graficos_e_tabela(tipo_doc, status, fornecedor, agrupamento, mes,
         )
     fig_fornecedores.update_layout(title_x=0.5, yaxis={'categoryorder': 'total ascending'})
 
-    # Tabela - MODIFICAÇÃO AQUI para agrupar por DIA e FILIAL em uma única linha
-    if agrupamento == 'diario' and 'Prorrogado' in df_filtrado.columns:
-        df_aux = df_filtrado.copy()
-        df_aux = df_aux.sort_values(['Prorrogado', 'Líquido'], ascending=[True, False])
-        col_order = ['Data', 'Nome Fantasia Agente', 'Tipo Doc.', 'Número Doc.', 'AP', 'Líquido', 'Saldo em Aberto', 'Complemento']
-        todas_as_linhas = []
-        df_aux['Data_fmt'] = df_aux['Prorrogado'].dt.strftime('%d/%m/%Y')
-
-        for data_str in df_aux['Data_fmt'].dropna().unique():
-            lancamentos_dia = df_aux[df_aux['Data_fmt'] == data_str].copy()
-            linha_data = pd.DataFrame([{
-                'Data': f"Data: {data_str}",
-                'Nome Fantasia Agente': None,
-                'Tipo Doc.': None,
-                'Número Doc.': None,
-                'AP': None,
-                'Líquido': None,
-                'Saldo em Aberto': None,
-                'Complemento': None
-            }])
-
-            lanc = lancamentos_dia[['Data_fmt', 'Nome Fantasia Agente', 'Tipo Doc.', 'Número Doc.', 'AP', 'Líquido', 'Saldo em Aberto', 'Complemento']].copy()
-            lanc = lanc.rename(columns={'Data_fmt': 'Data'})
-
-            total_liq = lancamentos_dia['Líquido'].sum(min_count=1)
-            total_saldo = lancamentos_dia['Saldo em Aberto'].sum(min_count=1)
-            linha_total = pd.DataFrame([{
-                'Data': f"Total do dia {data_str}",
-                'Nome Fantasia Agente': None,
-                'Tipo Doc.': None,
-                'Número Doc.': None,
-                'AP': None,
-                'Líquido': total_liq,
-                'Saldo em Aberto': total_saldo,
-                'Complemento': None
-            }])
-
-            linha_data = linha_data[[c for c in col_order if c in linha_data.columns]]
-            lanc = lanc[[c for c in col_order if c in lanc.columns]]
-            linha_total = linha_total[[c for c in col_order if c in linha_total.columns]]
-
-            todas_as_linhas.append(linha_data)
-            todas_as_linhas.append(lanc)
-            todas_as_linhas.append(linha_total)
-
-        if todas_as_linhas:
-            df_tabela = pd.concat(todas_as_linhas, ignore_index=True, sort=False)
-            final_cols = [c for c in col_order if c in df_tabela.columns]
-            df_tabela = df_tabela[final_cols]
-        else:
-            df_tabela = pd.DataFrame(columns=[c for c in col_order])
-            
-    elif agrupamento == 'dia_filial' and 'Prorrogado' in df_filtrado.columns and 'Nome Fantasia Filial' in df_filtrado.columns:
-        df_aux = df_filtrado.copy()
-        df_aux = df_aux.sort_values(['Prorrogado', 'Nome Fantasia Filial', 'Líquido'], 
-                                   ascending=[True, True, False])
-        col_order = ['Data', 'Nome Fantasia Agente', 'Tipo Doc.', 
-                    'Número Doc.', 'AP', 'Líquido', 'Saldo em Aberto', 'Complemento']
-        todas_as_linhas = []
-        df_aux['Data_fmt'] = df_aux['Prorrogado'].dt.strftime('%d/%m/%Y')
-
-        # Agrupar por DATA e FILIAL juntos
-        for data_str in df_aux['Data_fmt'].dropna().unique():
-            df_data = df_aux[df_aux['Data_fmt'] == data_str]
-            
-            # dicionário simples de abreviações para nomes longos de filial
-            abreviacoes_filial = {
-                'ALTIPLANO ENGENHARIA LTDA': 'ALTIPLANO',
-                'ATP SERVIÇO EM ACESSO POR CORDAS E TREINAMENTOS LTDA': 'ATP'
-            }
-
-            # Agrupar por filial dentro da data
-            for filial in df_data['Nome Fantasia Filial'].dropna().unique():
-                df_filial = df_data[df_data['Nome Fantasia Filial'] == filial]
-                filial_display = abreviacoes_filial.get(filial.strip().upper(), filial)
-
-                # Linha de cabeçalho combinando DATA e FILIAL
-                linha_cabecalho = pd.DataFrame([{
-                    'Data': f"Data: {data_str} - Filial: {filial_display}",
-                    'Nome Fantasia Agente': None,
-                    'Tipo Doc.': None,
-                    'Número Doc.': None,
-                    'AP': None,
-                    'Líquido': None,
-                    'Saldo em Aberto': None,
-                    'Complemento': None
-                }])
-
-                # Lançamentos da filial
-                lanc = df_filial[['Data_fmt', 'Nome Fantasia Agente', 
-                                'Tipo Doc.', 'Número Doc.', 'AP', 'Líquido', 
-                                'Saldo em Aberto', 'Complemento']].copy()
-                lanc = lanc.rename(columns={'Data_fmt': 'Data'})
-
-                # Total da filial
-                total_filial_liq = df_filial['Líquido'].sum(min_count=1)
-                total_filial_saldo = df_filial['Saldo em Aberto'].sum(min_count=1)
-                linha_total_filial = pd.DataFrame([{
-                    'Data': f"Total {data_str} - {filial_display}",
-                    'Nome Fantasia Agente': None,
-                    'Tipo Doc.': None,
-                    'Número Doc.': None,
-                    'AP': None,
-                    'Líquido': total_filial_liq,
-                    'Saldo em Aberto': total_filial_saldo,
-                    'Complemento': None
-                }])
-
-                # Adicionar à lista
-                todas_as_linhas.append(linha_cabecalho)
-                todas_as_linhas.append(lanc)
-                todas_as_linhas.append(linha_total_filial)
-            
-            # Total do dia (todas as filiais)
-            total_dia_liq = df_data['Líquido'].sum(min_count=1)
-            total_dia_saldo = df_data['Saldo em Aberto'].sum(min_count=1)
-            linha_total_dia = pd.DataFrame([{
-                'Data': f"TOTAL DIA: {data_str}",
-                'Nome Fantasia Agente': None,
-                'Tipo Doc.': None,
-                'Número Doc.': None,
-                'AP': None,
-                'Líquido': total_dia_liq,
-                'Saldo em Aberto': total_dia_saldo,
-                'Complemento': None
-            }])
-            
-            todas_as_linhas.append(linha_total_dia)
-        
-        # Combinar todos os dados
-        if todas_as_linhas:
-            df_tabela = pd.concat(todas_as_linhas, ignore_index=True, sort=False)
-            final_cols = [c for c in col_order if c in df_tabela.columns]
-            df_tabela = df_tabela[final_cols]
-        else:
-            df_tabela = pd.DataFrame(columns=[c for c in col_order])
-
-    else:
-        colunas_exibir = ['Prorrogado', 'Nome Fantasia Agente', 'Tipo Doc.', 'Número Doc.', 'AP', 'Líquido', 'Saldo em Aberto', 'Complemento']
-        colunas_disponiveis = [col for col in colunas_exibir if col in df_filtrado.columns]
-        df_tabela = df_filtrado[colunas_disponiveis].copy()
-
-        # Ordenar decrescente pela coluna 'Líquido' se existir
-        if 'Líquido' in df_tabela.columns:
-            df_tabela = df_tabela.sort_values('Líquido', ascending=False)
-
-        if 'Prorrogado' in df_tabela.columns:
-            df_tabela['Prorrogado'] = df_tabela['Prorrogado'].dt.strftime('%d/%m/%Y')
-            cols = df_tabela.columns.tolist()
-            idx = cols.index('Prorrogado')
-            cols[idx] = 'Data'
-            df_tabela.columns = cols
-
-    if 'Tipo Doc.' in df_tabela.columns:
-        df_tabela['Tipo Doc.'] = df_tabela['Tipo Doc.'].astype(str).str.strip()
-
-    # Remover valores None/NaN que aparecem como 'None' na tabela: usar string vazia
-    df_tabela = df_tabela.fillna('')
-    # Alguns valores já foram convertidos para a string 'None' em etapas anteriores;
-    # substituir essas strings indesejadas por string vazia para não aparecerem na UI.
-    df_tabela = df_tabela.replace({
-        'None': '',
-        'nan': '',
-        'NaN': '',
-        'NaT': ''
-    })
-
-    columns = [{"name": i, "id": i} for i in df_tabela.columns]
-
-    money_cols = ['Líquido', 'Saldo em Aberto']
-    for col in columns:
-        if col['id'] in money_cols:
-            col['type'] = 'numeric'
-            col['format'] = Format(
-                scheme=Scheme.fixed,
-                precision=2,
-                group=Group.yes,
-                group_delimiter='.',
-                decimal_delimiter=',',
-                symbol=Symbol.yes,
-                symbol_prefix='R$ '
-            )
-
-    data = df_tabela.to_dict('records')
-
-    return fig_vencimentos, fig_fornecedores, columns, data
+    return fig_vencimentos, fig_fornecedores
 
 
 @app.callback(
     Output('card-gastos-mensais', 'figure'),
-    Input('dropdown-tipo-doc', 'value'),
-    Input('dropdown-status', 'value'),
-    Input('dropdown-fornecedor', 'value'),
-    Input('store-dados', 'data'),
-    Input('dropdown-mes', 'value')
+    Input('store-dados', 'data')
 )
-def atualizar_card_gastos_mensais(tipo_doc, status, fornecedor, json_data, mes):
-    df = pd.read_json(io.StringIO(json_data), orient='split') if json_data else pd.DataFrame()
+def atualizar_card_gastos_mensais(versao):
+    # O gráfico soma todos os lançamentos do ano corrente, sem os filtros da tela: só
+    # muda com os dados, e basta uma figura por versão e ano para todas as sessões
+    snapshot = obter_snapshot(versao)
+    chave = (snapshot.versao, 'gastos_mensais', datetime.now().year)
+    figura, = cache_figuras.obter(chave, lambda: (montar_gastos_mensais(snapshot.df).to_json(),))
+    return json.loads(figura)
+
+def montar_gastos_mensais(df):
+    """Barras de JAN a DEZ do ano corrente com o total líquido por mês e a linha da média."""
     if df.empty or 'Prorrogado' not in df.columns or 'Líquido' not in df.columns:
         return go.Figure()
 
-    # Aplicar filtros semelhantes
-    mes_sel = mes if mes and mes != 'todos' else None
-    df['Mes'] = pd.to_datetime(df['Prorrogado']).dt.to_period('M').astype(str)
-    df_fil = filtrar_dataframe(df, tipo_doc, status, fornecedor, mes_sel) if mes_sel else filtrar_dataframe(df, tipo_doc, status, fornecedor, None)
-
     # Preparar meses fixos JAN..DEZ (PT-BR)
     meses_pt_abrev = ['JAN','FEV','MAR','ABR','MAI','JUN','JUL','AGO','SET','OUT','NOV','DEZ']
-    df['Mes_Period'] = pd.to_datetime(df['Prorrogado']).dt.to_period('M')
-    monthly_all = df.groupby(df['Mes_Period'])['Líquido'].sum().reset_index()
-    # Criar mapa mês->valor
-    monthly_map = {p.strftime('%Y-%m'): v for p, v in zip(monthly_all['Mes_Period'], monthly_all['Líquido'])}
+    # Mapa mês ('YYYY-MM') -> valor, a partir da coluna 'Mes' pré-calculada
+    monthly_map = (df.groupby('Mes', observed=True)['Líquido_centavos'].sum() / 100).to_dict()
 
     # Construir arrays para 12 meses do ano corrente
     ano_atual = datetime.now().year
@@ -1339,6 +3131,13 @@ def atualizar_card_gastos_mensais(tipo_doc, status, fornecedor, json_data, mes):
 
     return fig
 
+# Client-side callback da exportação: o navegador baixa o arquivo do endereço montado em exportar_para_excel
+app.clientside_callback(
+    "function(url){ if(url){ window.location.href = url; } return ''; }",
+    Output('export-excel-output', 'children'),
+    Input('url-exportacao-excel', 'data')
+)
+
 # Client-side callback para impressão: chama window.print() no navegador
 app.clientside_callback(
     "function(n_clicks){ if(n_clicks>0){ window.print(); } return ''; }",
@@ -1383,6 +3182,138 @@ app.clientside_callback(
 # Configuração do servidor para deploy
 server = app.server  # necessário para o Render, ai favor não apagar.
 
+# ----------------------------
+# Métricas dos callbacks e endpoint /metrics
+# ----------------------------
+nomes_callbacks = {}  # saída do callback (como vem na requisição) -> nome da função
+
+def nome_callback(saida):
+    """Nome da função registrada para a saída informada na requisição do Dash.
+
+    Saídas que não estão em app.callback_map (a requisição vem do cliente)
+    viram 'desconhecido' e não são guardadas, para que nem os rótulos das
+    métricas nem nomes_callbacks cresçam sem limite.
+    """
+    if not isinstance(saida, str):
+        return 'desconhecido'
+    nome = nomes_callbacks.get(saida)
+    if nome is None:
+        funcao = app.callback_map.get(saida, {}).get('callback')
+        if funcao is None:
+            return 'desconhecido'
+        nome = nomes_callbacks[saida] = getattr(funcao, '__name__', None) or 'desconhecido'
+    return nome
+
+@server.before_request
+def iniciar_medicao_callback():
+    if request.path.endswith('/_dash-update-component'):
+        g.inicio_callback = time.perf_counter()
+
+@server.after_request
+def registrar_medicao_callback(resposta):
+    inicio = g.pop('inicio_callback', None)
+    if inicio is None:
+        return resposta
+    # O JSON da requisição já foi lido pelo Dash e fica guardado pelo Flask
+    corpo = request.get_json(silent=True) or {}
+    nome = nome_callback(corpo.get('output'))
+    metricas.incrementar('dashboard_callback_chamadas_total', callback=nome)
+    if resposta.status_code >= 500:
+        metricas.incrementar('dashboard_callback_erros_total', callback=nome)
+    metricas.observar('dashboard_callback_duracao_segundos', time.perf_counter() - inicio, callback=nome)
+    metricas.observar('dashboard_callback_requisicao_bytes', request.content_length or 0, callback=nome)
+    tamanho = resposta.content_length
+    if tamanho is None and not resposta.is_streamed:
+        tamanho = len(resposta.get_data())
+    metricas.observar('dashboard_callback_resposta_bytes', tamanho or 0, callback=nome)
+    return resposta
+
+@metricas.coletor
+def metricas_caches():
+    """Contadores e ocupação dos caches, lidos no momento da coleta."""
+    dados = cache_dados.estatisticas()
+    caches = {'figuras': cache_figuras.estatisticas(), 'visoes': cache_visoes.estatisticas(),
+              'tabelas': cache_tabelas.estatisticas()}
+    return [
+        ('dashboard_dados_consultas_total', 'counter', 'Consultas ao snapshot por resultado (hit = dentro do TTL).',
+         [({'resultado': 'hit'}, dados['hits']), ({'resultado': 'miss'}, dados['misses'])]),
+        ('dashboard_dados_atualizacoes_total', 'counter', 'Atualizações dos dados por resultado.',
+         [({'resultado': 'total'}, dados['refreshes']), ({'resultado': 'sem_alteracao'}, dados['sem_alteracao']),
+          ({'resultado': 'falha'}, dados['falhas'])]),
+        ('dashboard_dados_idade_segundos', 'gauge', 'Tempo desde a última verificação da planilha.',
+         [({}, dados['idade_segundos'] if dados['idade_segundos'] is not None else 'NaN')]),
+        ('dashboard_dados_geracao', 'gauge', 'Geração do snapshot compartilhado publicada neste processo.',
+         [({'papel': dados['papel']}, dados['geracao'])]),
+        ('dashboard_cache_consultas_total', 'counter', 'Consultas aos caches LRU por resultado.',
+         [({'cache': nome, 'resultado': resultado}, estatisticas[contador])
+          for nome, estatisticas in caches.items()
+          for resultado, contador in (('hit', 'hits'), ('miss', 'misses'), ('coalescido', 'coalescidos'))]),
+        ('dashboard_cache_remocoes_total', 'counter', 'Entradas removidas dos caches LRU por falta de espaço.',
+         [({'cache': nome}, estatisticas['remocoes']) for nome, estatisticas in caches.items()]),
+        ('dashboard_cache_entradas', 'gauge', 'Entradas guardadas nos caches LRU.',
+         [({'cache': nome}, estatisticas['entradas']) for nome, estatisticas in caches.items()]),
+        ('dashboard_cache_bytes', 'gauge', 'Tamanho ocupado pelos caches LRU.',
+         [({'cache': nome}, estatisticas['bytes']) for nome, estatisticas in caches.items()]),
+    ]
+
+@server.route('/exportar/excel')
+def baixar_excel():
+    """Arquivo Excel pedido por exportar_para_excel, gravado num temporário e enviado em partes.
+
+    O .xlsx não passa pela memória nem por base64 no JSON de um callback: é
+    gravado em disco e o Flask o envia aos pedaços, apagando o temporário ao
+    fim da resposta.
+    """
+    argumentos = request.args
+    try:
+        sort_by = json.loads(argumentos.get('ordem') or '[]')
+    except ValueError:
+        return Response('Ordenação inválida', status=400)
+    exportacao = preparar_exportacao(argumentos.get('tipo_doc'), argumentos.get('status'),
+                                     argumentos.get('fornecedor'), argumentos.get('mes'),
+                                     argumentos.get('agrupamento'), sort_by, argumentos.get('filtro', ''),
+                                     argumentos.get('versao'))
+    if exportacao is None:
+        return Response('Nada a exportar com os filtros atuais', status=404)
+    nomes, registros, agrupado, nome_arquivo = exportacao
+
+    arquivo = tempfile.TemporaryFile()
+    try:
+        escrever_excel(nomes, registros, arquivo, agrupado)
+        arquivo.seek(0)
+    except Exception:
+        arquivo.close()
+        raise
+    return send_file(arquivo, as_attachment=True, download_name=nome_arquivo,
+                     mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+
+def acesso_admin_permitido():
+    """Com TOKEN_ADMIN definido, exige o token; sem ele, aceita só requisições da própria máquina."""
+    if TOKEN_ADMIN:
+        informado = request.headers.get('X-Admin-Token') or request.args.get('token') or ''
+        return hmac.compare_digest(informado, TOKEN_ADMIN)
+    return request.remote_addr in ('127.0.0.1', '::1')
+
+@server.route('/metrics')
+def expor_metricas():
+    """Métricas do processo, com a mesma restrição de /admin (o Prometheus pode mandar o token em `params`)."""
+    if not acesso_admin_permitido():
+        return Response('Acesso negado', status=403)
+    return Response(metricas.texto(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@server.route('/admin/carga')
+def expor_execucoes_carga():
+    """Últimas execuções da carga dos dados, com a duração e os detalhes de cada etapa."""
+    if not acesso_admin_permitido():
+        return Response('Acesso negado', status=403)
+    return jsonify({
+        'processo': os.getpid(),
+        'cache': {chave: str(valor) if isinstance(valor, datetime) else valor
+                  for chave, valor in cache_dados.estatisticas().items()},
+        'execucoes': historico_execucoes(),
+    })
+
 # Rodar o app
 if __name__ == '__main__':
+    iniciar_dados()
     app.run(debug=True)
@@ -0,0 +1,126 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import tempfile
+import time
+from datetime import datetime
+
+import pandas as pd
+
+import app_v2
+from gerar_planilha import gerar_csv
+
+# Mede os caminhos mais usados do dashboard sobre planilhas sintéticas, sem
+# acesso à planilha real: carregamento completo (carregar_dados lendo um
+# arquivo local), filtros, cartões de KPI, tabela por dia e filial e
+# gráficos. Os caches de figuras e de visões são esvaziados antes de cada
+# repetição, para medir o cálculo e não o acerto no cache. Os resultados são
+# gravados em JSON; com --comparar, cada medida é comparada à de uma execução
+# anterior.
+
+TAMANHOS = [1_000, 10_000, 100_000]
+
+
+def medir(funcao, repeticoes):
+    """Tempos (em milissegundos) de cada repetição, com os caches esvaziados antes."""
+    tempos = []
+    for _ in range(repeticoes):
+        app_v2.cache_figuras.limpar()
+        app_v2.cache_visoes.limpar()
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    return {'min_ms': round(min(tempos), 3), 'mediana_ms': round(statistics.median(tempos), 3),
+            'repeticoes': repeticoes}
+
+
+def combinacoes(df):
+    """Combinações de filtros da tela, da mais ampla à mais seletiva."""
+    fornecedor = str(df['Nome Fantasia Agente'].value_counts().index[0])
+    mes = str(df['Mes'].value_counts().index[0])
+    return [('todos', 'todos', 'todos', 'todos'), ('todos', 'todos', None, mes),
+            ('NF', 'aberto', None, mes), ('todos', 'todos', fornecedor, 'todos')]
+
+
+def medir_tamanho(linhas, repeticoes, assimetria, diretorio):
+    conteudo = gerar_csv(linhas, dias=365, assimetria=assimetria)
+    caminho = os.path.join(diretorio, f'planilha_{linhas}.csv')
+    with open(caminho, 'wb') as arquivo:
+        arquivo.write(conteudo)
+    app_v2.sheet_url = 'file://' + caminho
+
+    resultados = {'carregar_dados': medir(app_v2.carregar_dados, repeticoes)}
+    snapshot = app_v2.carregar_dados()
+    df = snapshot.df
+    app_v2.cache_dados = app_v2.CacheDados(lambda anterior: snapshot, segundo_plano=False)
+    app_v2.cache_dados.atualizar()
+    versao = snapshot.versao
+
+    filtros = combinacoes(df)
+    # Os filtros da tela pedem um mês; os gráficos não aceitam 'todos' como mês
+    filtros_mes = [f for f in filtros if f[3] not in (None, 'todos')]
+    resultados.update({
+        'filtrar_dataframe': medir(lambda: [app_v2.filtrar_dataframe(df, *f) for f in filtros], repeticoes),
+        'snapshot_filtrar': medir(lambda: [snapshot.filtrar(*f).df for f in filtros], repeticoes),
+        'atualizar_cards_kpi': medir(lambda: [app_v2.atualizar_cards_kpi(*f, versao) for f in filtros], repeticoes),
+        'atualizar_card_gastos_mensais': medir(
+            lambda: app_v2.atualizar_card_gastos_mensais(versao), repeticoes),
+        'montar_registros_dia_filial': medir(
+            lambda: app_v2.montar_registros_dia_filial(app_v2.filtrar_dataframe(df, *filtros_mes[0])), repeticoes),
+        'montar_graficos': medir(lambda: [app_v2.montar_graficos(snapshot, *f) for f in filtros_mes], repeticoes),
+        'montar_gastos_mensais': medir(lambda: app_v2.montar_gastos_mensais(df), repeticoes),
+        'atualizar_graficos': medir(lambda: [app_v2.atualizar_graficos(*f, versao) for f in filtros_mes], repeticoes),
+    })
+    return {'bytes_csv': len(conteudo), 'linhas_df': len(df), 'medidas': resultados}
+
+
+def comparar(atual, anterior):
+    """Imprime a razão entre as medianas desta execução e as de uma execução anterior."""
+    print(f"\n{'linhas':>8} {'medida':>30} {'antes (ms)':>11} {'agora (ms)':>11} {'razão':>7}")
+    for linhas, resultado in atual['tamanhos'].items():
+        medidas_antes = anterior['tamanhos'].get(linhas, {}).get('medidas', {})
+        for nome, medida in resultado['medidas'].items():
+            if nome in medidas_antes:
+                antes, agora = medidas_antes[nome]['mediana_ms'], medida['mediana_ms']
+                print(f"{linhas:>8} {nome:>30} {antes:>11.2f} {agora:>11.2f} {agora / antes:>6.2f}x")
+
+
+def executar(tamanhos=TAMANHOS, repeticoes=5, assimetria=1.1, saida=None, anterior=None):
+    resultado = {
+        'gerado_em': datetime.now().isoformat(timespec='seconds'),
+        'ambiente': {'python': platform.python_version(), 'pandas': pd.__version__,
+                     'plataforma': platform.platform()},
+        'assimetria': assimetria,
+        'tamanhos': {},
+    }
+    print(f"{'linhas':>8} {'medida':>30} {'mín (ms)':>10} {'mediana (ms)':>13}")
+    with tempfile.TemporaryDirectory() as diretorio:
+        for linhas in tamanhos:
+            medidas = medir_tamanho(linhas, repeticoes if linhas <= 100_000 else 1, assimetria, diretorio)
+            resultado['tamanhos'][str(linhas)] = medidas
+            for nome, medida in medidas['medidas'].items():
+                print(f"{linhas:>8} {nome:>30} {medida['min_ms']:>10.2f} {medida['mediana_ms']:>13.2f}")
+
+    if saida:
+        with open(saida, 'w', encoding='utf-8') as arquivo:
+            json.dump(resultado, arquivo, indent=2, ensure_ascii=False)
+        print(f"\nResultados gravados em {saida}")
+    if anterior:
+        with open(anterior, encoding='utf-8') as arquivo:
+            comparar(resultado, json.load(arquivo))
+    return resultado
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks dos caminhos principais do dashboard")
+    parser.add_argument('tamanhos', nargs='*', type=int, default=TAMANHOS, help="linhas das planilhas sintéticas")
+    parser.add_argument('--repeticoes', type=int, default=5)
+    parser.add_argument('--assimetria', type=float, default=1.1, help="expoente de Zipf dos fornecedores (0 = uniforme)")
+    parser.add_argument('--saida', default=f"benchmark_{datetime.now():%Y%m%d_%H%M%S}.json")
+    parser.add_argument('--comparar', help="JSON de uma execução anterior")
+    argumentos = parser.parse_args()
+    app_v2.logger.setLevel(logging.WARNING)  # as etapas de cada carga poluiriam a tabela
+    executar(argumentos.tamanhos, argumentos.repeticoes, argumentos.assimetria, argumentos.saida, argumentos.comparar)
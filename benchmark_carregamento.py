@@ -0,0 +1,36 @@
+import sys
+import time
+
+import app_v2
+from gerar_planilha import gerar_csv
+
+# Compara o parser C com esquema explícito ao parser tolerante (engine Python)
+# em planilhas sintéticas de tamanhos crescentes.
+
+TAMANHOS = [10_000, 100_000, 1_000_000]
+
+
+def medir(funcao, conteudo, repeticoes):
+    """Menor tempo (em segundos) entre as repetições."""
+    melhor = float('inf')
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao(conteudo)
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return melhor
+
+
+def executar(tamanhos=TAMANHOS):
+    print(f"{'linhas':>10} {'MB':>7} {'tolerante (s)':>14} {'rápido (s)':>11} {'ganho':>7} {'processar_csv (s)':>18}")
+    for linhas in tamanhos:
+        conteudo = gerar_csv(linhas)
+        repeticoes = 3 if linhas <= 100_000 else 1
+        tolerante = medir(app_v2.ler_csv_tolerante, conteudo, repeticoes)
+        rapido = medir(app_v2.ler_csv, conteudo, repeticoes)
+        completo = medir(app_v2.processar_csv, conteudo, repeticoes)
+        print(f"{linhas:>10} {len(conteudo) / 1e6:>7.1f} {tolerante:>14.3f} {rapido:>11.3f} "
+              f"{tolerante / rapido:>6.1f}x {completo:>18.3f}")
+
+
+if __name__ == "__main__":
+    executar([int(n) for n in sys.argv[1:]] or TAMANHOS)
@@ -0,0 +1,87 @@
+import gc
+import multiprocessing
+import resource
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+import app_v2
+from gerar_planilha import gerar_csv
+
+# Compara três formas de exportar a visão "Agrupado por Dia e Filial", do
+# DataFrame filtrado até os bytes do .xlsx: a anterior (todos os registros
+# montados e gravados com to_excel), os registros completos gravados em modo
+# write-only, e a atual, com os registros gerados em blocos por
+# app_v2.registros_exportacao e gravados por app_v2.escrever_excel. Cada
+# exportação roda num processo novo, e o pico de memória é medido pelo
+# ru_maxrss acima do que o processo usava com o DataFrame já carregado (o pico
+# do carregamento é zerado antes, via /proc/self/clear_refs). O arquivo é
+# gravado num temporário em disco, como na rota /exportar/excel.
+
+TAMANHOS = [50_000, 500_000]
+
+
+def exportar_com_to_excel(df, destino):
+    """Implementação anterior."""
+    _, registros = app_v2.montar_tabela(df, 'dia_filial')
+    pd.DataFrame(registros).to_excel(destino, sheet_name='Contas a Pagar', index=False)
+
+
+def exportar_tabela_completa(df, destino):
+    """Registros completos (como em cache_tabelas) gravados em modo write-only."""
+    nomes, registros = app_v2.montar_tabela(df, 'dia_filial')
+    app_v2.escrever_excel(nomes, registros, destino, agrupado=True)
+
+
+def exportar_em_blocos(df, destino):
+    """Implementação atual."""
+    nomes, registros = app_v2.registros_exportacao(df, 'dia_filial')
+    app_v2.escrever_excel(nomes, registros, destino, agrupado=True)
+
+
+def zerar_pico_memoria():
+    """Zera o pico de memória do processo (Linux), para que o carregamento não esconda o da exportação."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as arquivo:
+            arquivo.write('5')
+    except OSError:
+        pass
+
+
+def medir_em_processo(funcao, linhas, fila):
+    df = app_v2.processar_csv(gerar_csv(linhas, dias=60))
+    gc.collect()
+    zerar_pico_memoria()
+    base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    with tempfile.TemporaryFile() as destino:  # como na rota /exportar/excel
+        inicio = time.perf_counter()
+        funcao(df, destino)
+        segundos = time.perf_counter() - inicio
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - base
+        fila.put((segundos, pico / 1024, destino.tell() / 1e6))
+
+
+def medir(funcao, linhas):
+    """(segundos, pico de memória em MB, tamanho do arquivo em MB) da exportação."""
+    contexto = multiprocessing.get_context('spawn')
+    fila = contexto.Queue()
+    processo = contexto.Process(target=medir_em_processo, args=(funcao, linhas, fila))
+    processo.start()
+    resultado = fila.get()
+    processo.join()
+    return resultado
+
+
+def executar(tamanhos=TAMANHOS):
+    print(f"{'linhas':>8} {'método':>20} {'tempo (s)':>10} {'pico (MB)':>10} {'arquivo (MB)':>13}")
+    for linhas in tamanhos:
+        for nome, funcao in (('to_excel', exportar_com_to_excel), ('tabela + write-only', exportar_tabela_completa),
+                             ('blocos + write-only', exportar_em_blocos)):
+            segundos, pico, tamanho = medir(funcao, linhas)
+            print(f"{linhas:>8} {nome:>20} {segundos:>10.1f} {pico:>10.0f} {tamanho:>13.1f}")
+
+
+if __name__ == "__main__":
+    executar([int(n) for n in sys.argv[1:]] or TAMANHOS)
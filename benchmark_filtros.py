@@ -0,0 +1,69 @@
+import itertools
+import sys
+import time
+
+import app_v2
+from gerar_planilha import gerar_csv
+
+# Compara o filtro por máscaras sequenciais (filtrar_dataframe) ao índice
+# invertido do snapshot (Snapshot.filtrar) nas combinações de filtros da tela,
+# e os totais dos cartões somados sobre as linhas aos lidos do cubo de KPIs.
+
+TAMANHOS = [100_000, 1_000_000]
+
+
+def combinacoes(df):
+    """Combinações representativas de filtros, da mais ampla à mais seletiva."""
+    tipos = ['todos', 'NF']
+    status = ['todos', 'aberto']
+    fornecedores = ['todos', str(df['Nome Fantasia Agente'].iloc[0])]
+    meses = ['todos', str(df['Mes'].iloc[0])]
+    return list(itertools.product(tipos, status, fornecedores, meses))
+
+
+def medir(funcao, repeticoes=5):
+    """Menor tempo (em milissegundos) entre as repetições."""
+    melhor = float('inf')
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return melhor * 1000
+
+
+def somar_kpis(df, tipo, status, fornecedor, mes):
+    """Totais dos cartões calculados linha a linha, como antes do cubo."""
+    linhas = app_v2.filtrar_dataframe(df, tipo, status, fornecedor, mes)
+    saldo = linhas['Saldo em Aberto_centavos']
+    return (linhas['Líquido_centavos'].sum(), saldo[saldo > 0].sum(),
+            linhas.loc[saldo == 0, 'Líquido_centavos'].sum(), int((linhas['Vencido'] & (saldo > 0)).sum()))
+
+
+def executar(tamanhos=TAMANHOS):
+    for linhas in tamanhos:
+        df = app_v2.processar_csv(gerar_csv(linhas))
+        inicio = time.perf_counter()
+        snapshot = app_v2.Snapshot(versao='bench', df=df, carregado_em=app_v2.datetime.now())
+        montagem = (time.perf_counter() - inicio) * 1000
+
+        print(f"\n{linhas} linhas (índice e cubo montados em {montagem:.1f} ms; cubo com {len(snapshot.cubo)} células)")
+        print(f"{'tipo':>6} {'status':>8} {'fornecedor':>15} {'mes':>8} {'linhas':>8} "
+              f"{'máscaras (ms)':>14} {'índice (ms)':>12} {'índice+df (ms)':>15} "
+              f"{'KPIs linhas (ms)':>17} {'KPIs cubo (µs)':>15}")
+        for tipo, status, fornecedor, mes in combinacoes(df):
+            esperado = app_v2.filtrar_dataframe(df, tipo, status, fornecedor, mes)
+            obtido = snapshot.filtrar(tipo, status, fornecedor, mes).df
+            assert esperado.index.equals(obtido.index), (tipo, status, fornecedor, mes)
+
+            mascaras = medir(lambda: app_v2.filtrar_dataframe(df, tipo, status, fornecedor, mes))
+            indice = medir(lambda: snapshot.filtrar(tipo, status, fornecedor, mes))
+            completo = medir(lambda: snapshot.filtrar(tipo, status, fornecedor, mes).df)
+            kpis_linhas = medir(lambda: somar_kpis(df, tipo, status, fornecedor, mes))
+            kpis_cubo = medir(lambda: snapshot.cubo.consultar(tipo, status, fornecedor, mes)) * 1000
+            print(f"{tipo:>6} {status:>8} {fornecedor:>15} {mes:>8} {len(esperado):>8} "
+                  f"{mascaras:>14.2f} {indice:>12.3f} {completo:>15.2f} "
+                  f"{kpis_linhas:>17.2f} {kpis_cubo:>15.1f}")
+
+
+if __name__ == "__main__":
+    executar([int(n) for n in sys.argv[1:]] or TAMANHOS)
@@ -0,0 +1,80 @@
+import json
+import sys
+import time
+
+import pandas as pd
+
+import app_v2
+from gerar_planilha import gerar_csv
+
+# Compara a montagem da visão "Agrupado por Dia e Filial" por laços e concatenação
+# de DataFrames (implementação anterior, reproduzida abaixo) à montagem vetorizada
+# de app_v2.montar_registros_dia_filial, com todas as linhas dentro de um mês.
+
+TAMANHOS = [1_000, 10_000, 50_000, 200_000]
+
+
+def montar_tabela_por_lacos(df_filtrado):
+    """Implementação anterior: um DataFrame por cabeçalho, lançamentos e total, concatenados ao final."""
+    df_aux = df_filtrado.copy()
+    df_aux = df_aux.sort_values(['Prorrogado', 'Nome Fantasia Filial', 'Líquido'],
+                                ascending=[True, True, False])
+    col_order = app_v2.COLUNAS_TABELA
+    vazio = dict.fromkeys(col_order)
+    todas_as_linhas = []
+
+    for data_str in df_aux['Data_fmt'].dropna().unique():
+        df_data = df_aux[df_aux['Data_fmt'] == data_str]
+        for filial in df_data['Nome Fantasia Filial'].dropna().unique():
+            df_filial = df_data[df_data['Nome Fantasia Filial'] == filial]
+            filial_display = app_v2.ABREVIACOES_FILIAL.get(filial.strip().upper(), filial)
+
+            lanc = df_filial[['Data_fmt'] + col_order[1:]].copy().rename(columns={'Data_fmt': 'Data'})
+            todas_as_linhas.append(pd.DataFrame([{**vazio, 'Data': f"Data: {data_str} - Filial: {filial_display}"}]))
+            todas_as_linhas.append(lanc)
+            todas_as_linhas.append(pd.DataFrame([{
+                **vazio, 'Data': f"Total {data_str} - {filial_display}",
+                'Líquido': df_filial['Líquido_centavos'].sum() / 100,
+                'Saldo em Aberto': df_filial['Saldo em Aberto_centavos'].sum() / 100,
+            }]))
+
+        todas_as_linhas.append(pd.DataFrame([{
+            **vazio, 'Data': f"TOTAL DIA: {data_str}",
+            'Líquido': df_data['Líquido_centavos'].sum() / 100,
+            'Saldo em Aberto': df_data['Saldo em Aberto_centavos'].sum() / 100,
+        }]))
+
+    if todas_as_linhas:
+        df_tabela = pd.concat(todas_as_linhas, ignore_index=True, sort=False)[col_order]
+    else:
+        df_tabela = pd.DataFrame(columns=col_order)
+    return app_v2.registros_tabela(df_tabela)
+
+
+def medir(funcao, repeticoes):
+    """Menor tempo (em milissegundos) entre as repetições."""
+    melhor = float('inf')
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return melhor * 1000
+
+
+def executar(tamanhos=TAMANHOS):
+    print(f"{'linhas':>8} {'registros':>10} {'laços (ms)':>11} {'vetorizado (ms)':>16} {'ganho':>7}")
+    for linhas in tamanhos:
+        df = app_v2.processar_csv(gerar_csv(linhas, dias=30))
+        repeticoes = 3 if linhas <= 50_000 else 1
+
+        anterior = montar_tabela_por_lacos(df)
+        novo = app_v2.montar_registros_dia_filial(df)
+        assert json.dumps(anterior) == json.dumps(novo), "saída diferente da implementação anterior"
+
+        lacos = medir(lambda: montar_tabela_por_lacos(df), repeticoes)
+        vetorizado = medir(lambda: app_v2.montar_registros_dia_filial(df), repeticoes)
+        print(f"{linhas:>8} {len(novo):>10} {lacos:>11.1f} {vetorizado:>16.1f} {lacos / vetorizado:>6.1f}x")
+
+
+if __name__ == "__main__":
+    executar([int(n) for n in sys.argv[1:]] or TAMANHOS)
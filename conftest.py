@@ -0,0 +1,29 @@
+import pytest
+
+import app_v2
+from gerar_planilha import gerar_csv
+
+
+@pytest.fixture(autouse=True)
+def caches_vazios():
+    """Esvazia os caches compartilhados, cujas chaves (como 'v1' ou 't') se repetem entre os testes."""
+    for cache in (app_v2.cache_figuras, app_v2.cache_visoes, app_v2.cache_tabelas):
+        cache.limpar()
+
+
+@pytest.fixture
+def processar_planilha():
+    """Função que gera uma planilha sintética (ver gerar_csv) e devolve o DataFrame processado."""
+    def processar(linhas, **opcoes):
+        return app_v2.processar_csv(gerar_csv(linhas, **opcoes))
+    return processar
+
+
+@pytest.fixture
+def montar_snapshot(processar_planilha):
+    """Função que monta um Snapshot de uma planilha sintética, ou de um DataFrame já processado."""
+    def montar(linhas=None, versao='t', df=None, **opcoes):
+        if df is None:
+            df = processar_planilha(linhas, **opcoes)
+        return app_v2.Snapshot(versao=versao, df=df, carregado_em=app_v2.datetime.now())
+    return montar
@@ -1,7 +1,8 @@
+import os
 import pandas as pd
 
 # URL da planilha
-sheet_url = "https://docs.google.com/spreadsheets/d/19G1wYQUda-zjrtUMaKnksVhhnIujHr1UezcV5Z9IMAg/export?format=csv&gid=0"
+sheet_url = os.environ.get('SHEET_URL', "https://docs.google.com/spreadsheets/d/19G1wYQUda-zjrtUMaKnksVhhnIujHr1UezcV5Z9IMAg/export?format=csv&gid=0")
 
 def examine_data():
     """Examina os dados para identificar onde aparece 'Total Geral'."""
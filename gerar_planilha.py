@@ -0,0 +1,102 @@
+import csv
+import io
+import itertools
+import random
+import sys
+from datetime import date, timedelta
+
+# Gera planilhas sintéticas no mesmo formato da exportação CSV do Google Sheets,
+# para medir o carregamento sem depender da planilha real. Por padrão, filiais,
+# tipos de documento e fornecedores seguem uma distribuição assimétrica, como
+# na planilha real: poucos fornecedores concentram a maior parte dos lançamentos.
+
+FILIAIS = [
+    'ALTIPLANO ENGENHARIA LTDA',
+    'ATP SERVIÇO EM ACESSO POR CORDAS E TREINAMENTOS LTDA',
+    'FILIAL SUL',
+]
+TIPOS_DOC = ['NF', 'PREV', 'PREVPDC', 'BOL', 'RPA']
+COMPLEMENTOS = ['', '', 'Pagamento parcial', 'Referente a medição', 'Obs: conferir boleto']
+
+# Pesos usados com assimetria (a filial principal e as notas fiscais predominam)
+PESOS_FILIAIS = [0.7, 0.22, 0.08]
+PESOS_TIPOS_DOC = [0.55, 0.2, 0.1, 0.1, 0.05]
+FORNECEDORES = 300
+
+CABECALHO = [
+    'Nome Fantasia Filial', 'Nome Fantasia Agente', 'Prorrogado', 'Tipo Doc.', 'Número Doc.',
+    'AP', 'Retenção IR', 'Líquido', 'Saldo em Aberto', 'Complemento'
+]
+
+
+def formatar_brl(centavos):
+    """Formata centavos como na planilha: 'R$ 1.234,56'."""
+    reais = f"{centavos / 100:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
+    return f"R$ {reais}"
+
+
+def pesos_acumulados(pesos):
+    return list(itertools.accumulate(pesos))
+
+
+def gerar_csv(linhas, semente=0, inicio=date(2025, 1, 1), dias=730, assimetria=1.1):
+    """Gera o conteúdo (bytes UTF-8) de uma planilha com o número de linhas pedido.
+
+    `assimetria` é o expoente da lei de Zipf que sorteia os fornecedores (o
+    k-ésimo mais frequente tem peso 1/k**assimetria); com 0, fornecedores,
+    filiais e tipos de documento são sorteados de maneira uniforme.
+    """
+    rnd = random.Random(semente)
+    if assimetria:
+        fornecedores = pesos_acumulados([1 / k ** assimetria for k in range(1, FORNECEDORES + 1)])
+        filiais = pesos_acumulados(PESOS_FILIAIS)
+        tipos = pesos_acumulados(PESOS_TIPOS_DOC)
+    else:
+        fornecedores = filiais = tipos = None
+    # O ranking de frequência não segue a numeração dos fornecedores
+    nomes_fornecedores = [f'FORNECEDOR {n:03d}' for n in range(1, FORNECEDORES + 1)]
+    rnd.shuffle(nomes_fornecedores)
+    saida = io.StringIO()
+    escritor = csv.writer(saida, lineterminator='\n')
+
+    # Três linhas de preâmbulo, como no relatório exportado
+    escritor.writerow(['Relatório de Contas a Pagar'] + [''] * 9)
+    escritor.writerow([f'Gerado em {inicio:%d/%m/%Y}'] + [''] * 9)
+    escritor.writerow([''] * 10)
+    escritor.writerow(CABECALHO)
+
+    total_liquido = 0
+    total_saldo = 0
+    for i in range(linhas):
+        vencimento = inicio + timedelta(days=rnd.randrange(dias))
+        liquido = rnd.randint(1_000, 5_000_000)
+        saldo = liquido if rnd.random() < 0.35 else 0
+        total_liquido += liquido
+        total_saldo += saldo
+        escritor.writerow([
+            rnd.choices(FILIAIS, cum_weights=filiais)[0],
+            rnd.choices(nomes_fornecedores, cum_weights=fornecedores)[0],
+            vencimento.strftime('%d/%m/%Y'),
+            rnd.choices(TIPOS_DOC, cum_weights=tipos)[0],
+            str(10_000 + i),
+            str(rnd.randint(1, 99_999)),
+            formatar_brl(rnd.randint(0, 50_000)),
+            formatar_brl(liquido),
+            formatar_brl(saldo),
+            rnd.choice(COMPLEMENTOS),
+        ])
+
+    # Bloco final de totais, que o carregamento precisa descartar
+    escritor.writerow(['Total Geral', '', '', '', '', '', '', formatar_brl(total_liquido), formatar_brl(total_saldo), ''])
+    escritor.writerow(['Emitido pelo sistema financeiro'] + [''] * 9)
+    return saida.getvalue().encode('utf-8')
+
+
+if __name__ == "__main__":
+    # Uso: python gerar_planilha.py [linhas] [destino] [assimetria]
+    linhas = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    destino = sys.argv[2] if len(sys.argv) > 2 else 'planilha_sintetica.csv'
+    assimetria = float(sys.argv[3]) if len(sys.argv) > 3 else 1.1
+    with open(destino, 'wb') as arquivo:
+        arquivo.write(gerar_csv(linhas, assimetria=assimetria))
+    print(f"{linhas} linhas gravadas em {destino}")
@@ -0,0 +1,13 @@
+import os
+
+# Configuração do gunicorn, lida na partida (Procfile: gunicorn -c gunicorn.conf.py app_v2:server)
+
+# Os workers dividem o snapshot dos dados: só um busca a planilha e os demais leem o que
+# ele grava em disco (ver CacheDados). Fora do servidor, cada processo tem o seu
+os.environ.setdefault('DADOS_COMPARTILHADOS', '1')
+
+
+def post_worker_init(worker):
+    """Já com o app carregado no worker: serve a cópia local e inicia a atualização dos dados."""
+    import app_v2
+    app_v2.iniciar_dados()
@@ -0,0 +1,247 @@
+import argparse
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from gerar_planilha import gerar_csv
+
+# Servidor HTTP local que imita a exportação CSV do Google Sheets
+# (/spreadsheets/d/<id>/export?format=csv&gid=<gid>), para testar o
+# carregamento, o cache e as respostas condicionais sem acesso à rede.
+#
+# Cada gid é servido a partir de <fixtures>/<gid>.csv. Variantes numeradas
+# (<gid>.1.csv, <gid>.2.csv, ...) entram em rodízio quando há mudanças
+# programadas. Sem arquivo, o gid recebe uma planilha sintética de
+# gerar_planilha, que ganha novos lançamentos a cada mudança. O servidor
+# responde com ETag e Last-Modified e devolve 304 quando nada mudou.
+#
+# Falhas injetadas, sorteadas a cada requisição e ajustáveis com o servidor
+# no ar (POST /controle com um JSON de ConfiguracaoFalhas):
+#   - latência antes da resposta (fixa mais uma variação aleatória);
+#   - erro 5xx;
+#   - corpo truncado (o Content-Length anuncia o arquivo inteiro);
+#   - falha de codificação (o corpo é enviado em latin-1 em vez de UTF-8).
+#
+# Uso: python servidor_planilha.py --porta 8765 --latencia-ms 300 --taxa-erro 0.1
+# e então SHEET_URL=http://127.0.0.1:8765/spreadsheets/d/local/export?format=csv&gid=0
+
+
+class ConfiguracaoFalhas:
+    """Latência e probabilidades das falhas injetadas em cada resposta."""
+
+    CAMPOS = ('latencia_ms', 'variacao_ms', 'taxa_erro', 'taxa_truncado', 'taxa_codificacao',
+              'mudar_a_cada_segundos', 'linhas_por_mudanca')
+
+    def __init__(self, latencia_ms=0.0, variacao_ms=0.0, taxa_erro=0.0, taxa_truncado=0.0, taxa_codificacao=0.0,
+                 mudar_a_cada_segundos=0.0, linhas_por_mudanca=10):
+        self.latencia_ms = latencia_ms
+        self.variacao_ms = variacao_ms
+        self.taxa_erro = taxa_erro
+        self.taxa_truncado = taxa_truncado
+        self.taxa_codificacao = taxa_codificacao
+        self.mudar_a_cada_segundos = mudar_a_cada_segundos  # 0 = conteúdo fixo
+        self.linhas_por_mudanca = linhas_por_mudanca
+
+    def atualizar(self, valores):
+        for campo, valor in valores.items():
+            if campo not in self.CAMPOS:
+                raise ValueError(f"Campo desconhecido: {campo}")
+            setattr(self, campo, type(getattr(self, campo))(valor))
+
+    def como_dict(self):
+        return {campo: getattr(self, campo) for campo in self.CAMPOS}
+
+
+class ServidorPlanilha:
+    """Servidor da planilha local, executado numa thread (ver iniciar/parar)."""
+
+    def __init__(self, fixtures=None, linhas=1_000, configuracao=None, semente=0, host='127.0.0.1', porta=0,
+                 verboso=False):
+        self.fixtures = fixtures
+        self.linhas = linhas
+        self.configuracao = configuracao or ConfiguracaoFalhas()
+        self.inicio = time.time()
+        self.contadores = {'requisicoes': 0, 'respostas_200': 0, 'respostas_304': 0, 'erros': 0,
+                           'truncados': 0, 'codificacao': 0}
+        self._rnd = random.Random(semente)
+        self._lock = threading.Lock()
+        self.verboso = verboso  # registrar cada requisição no terminal
+        self._conteudos = {}  # gid -> (mudança, conteudo, etag, last_modified)
+        self._http = ThreadingHTTPServer((host, porta), self._criar_handler())
+        self._http.daemon_threads = True
+        self._thread = None
+
+    @property
+    def porta(self):
+        return self._http.server_address[1]
+
+    def url(self, gid=0):
+        return f"http://{self._http.server_address[0]}:{self.porta}/spreadsheets/d/local/export?format=csv&gid={gid}"
+
+    def iniciar(self):
+        self._thread = threading.Thread(target=self._http.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def parar(self):
+        self._http.shutdown()
+        self._http.server_close()
+
+    def __enter__(self):
+        return self.iniciar()
+
+    def __exit__(self, *exc):
+        self.parar()
+
+    def mudanca_atual(self):
+        """Quantas mudanças programadas já ocorreram desde o início."""
+        intervalo = self.configuracao.mudar_a_cada_segundos
+        return int((time.time() - self.inicio) // intervalo) if intervalo > 0 else 0
+
+    def conteudo(self, gid):
+        """(conteudo, etag, last_modified) da versão atual do gid."""
+        mudanca = self.mudanca_atual()
+        with self._lock:
+            guardado = self._conteudos.get(gid)
+            if guardado is None or guardado[0] != mudanca:
+                conteudo = self._montar(gid, mudanca)
+                if conteudo is None:
+                    return None
+                etag = f'"{hashlib.sha256(conteudo).hexdigest()[:16]}"'
+                intervalo = self.configuracao.mudar_a_cada_segundos
+                desde = self.inicio + mudanca * intervalo if intervalo > 0 else self.inicio
+                guardado = self._conteudos[gid] = (mudanca, conteudo, etag, formatdate(desde, usegmt=True))
+            return guardado[1:]
+
+    def _montar(self, gid, mudanca):
+        if self.fixtures:
+            variantes = sorted(nome for nome in os.listdir(self.fixtures)
+                               if nome == f'{gid}.csv' or (nome.startswith(f'{gid}.') and nome.endswith('.csv')))
+            if variantes:
+                with open(os.path.join(self.fixtures, variantes[mudanca % len(variantes)]), 'rb') as arquivo:
+                    return arquivo.read()
+        if not gid.isdigit():
+            return None
+        # Mesma semente e mais linhas: as anteriores se mantêm e novos lançamentos entram no fim
+        return gerar_csv(self.linhas + mudanca * self.configuracao.linhas_por_mudanca, semente=int(gid))
+
+    def _sortear(self, taxa):
+        with self._lock:
+            return taxa > 0 and self._rnd.random() < taxa
+
+    def _contar(self, chave):
+        with self._lock:
+            self.contadores[chave] += 1
+
+    def _criar_handler(self):
+        servidor = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                endereco = urlparse(self.path)
+                if endereco.path == '/controle':
+                    return self.responder_json({'configuracao': servidor.configuracao.como_dict(),
+                                                'contadores': servidor.contadores,
+                                                'mudanca': servidor.mudanca_atual()})
+                if not endereco.path.endswith('/export'):
+                    return self.send_error(404)
+                servidor._contar('requisicoes')
+                configuracao = servidor.configuracao
+
+                atraso = configuracao.latencia_ms + random.uniform(0, configuracao.variacao_ms)
+                if atraso > 0:
+                    time.sleep(atraso / 1000)
+                if servidor._sortear(configuracao.taxa_erro):
+                    servidor._contar('erros')
+                    return self.send_error(503, 'Falha injetada')
+
+                gid = parse_qs(endereco.query).get('gid', ['0'])[0]
+                atual = servidor.conteudo(gid)
+                if atual is None:
+                    return self.send_error(404, f'gid {gid} sem fixture')
+                conteudo, etag, last_modified = atual
+                if self.headers.get('If-None-Match') == etag or (
+                        'If-None-Match' not in self.headers and self.headers.get('If-Modified-Since') == last_modified):
+                    servidor._contar('respostas_304')
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.end_headers()
+                    return
+
+                corpo = conteudo
+                if servidor._sortear(configuracao.taxa_codificacao):
+                    servidor._contar('codificacao')
+                    corpo = conteudo.decode('utf-8').encode('latin-1', errors='replace')
+                truncar = servidor._sortear(configuracao.taxa_truncado)
+                servidor._contar('respostas_200')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/csv; charset=utf-8')
+                self.send_header('Content-Length', str(len(corpo)))
+                self.send_header('ETag', etag)
+                self.send_header('Last-Modified', last_modified)
+                self.end_headers()
+                if truncar:
+                    servidor._contar('truncados')
+                    self.wfile.write(corpo[:len(corpo) // 2])
+                    self.close_connection = True
+                    return
+                self.wfile.write(corpo)
+
+            def do_POST(self):
+                if urlparse(self.path).path != '/controle':
+                    return self.send_error(404)
+                try:
+                    valores = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                    servidor.configuracao.atualizar(valores)
+                except (ValueError, TypeError) as e:
+                    return self.send_error(400, str(e))
+                self.responder_json({'configuracao': servidor.configuracao.como_dict()})
+
+            def responder_json(self, dados):
+                corpo = json.dumps(dados).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(corpo)))
+                self.end_headers()
+                self.wfile.write(corpo)
+
+            def log_message(self, formato, *args):
+                if servidor.verboso:
+                    super().log_message(formato, *args)
+
+        return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Imitação local da exportação CSV do Google Sheets")
+    parser.add_argument('--porta', type=int, default=8765)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--fixtures', help="diretório com <gid>.csv (e variantes <gid>.N.csv)")
+    parser.add_argument('--linhas', type=int, default=1_000, help="linhas da planilha sintética dos gids sem fixture")
+    parser.add_argument('--latencia-ms', type=float, default=0)
+    parser.add_argument('--variacao-ms', type=float, default=0)
+    parser.add_argument('--taxa-erro', type=float, default=0.0)
+    parser.add_argument('--taxa-truncado', type=float, default=0.0)
+    parser.add_argument('--taxa-codificacao', type=float, default=0.0)
+    parser.add_argument('--mudar-a-cada', type=float, default=0, help="segundos entre mudanças do conteúdo (0 = fixo)")
+    parser.add_argument('--linhas-por-mudanca', type=int, default=10)
+    parser.add_argument('--semente', type=int, default=0)
+    argumentos = parser.parse_args()
+
+    configuracao = ConfiguracaoFalhas(argumentos.latencia_ms, argumentos.variacao_ms, argumentos.taxa_erro,
+                                      argumentos.taxa_truncado, argumentos.taxa_codificacao,
+                                      argumentos.mudar_a_cada, argumentos.linhas_por_mudanca)
+    servidor = ServidorPlanilha(argumentos.fixtures, argumentos.linhas, configuracao, argumentos.semente,
+                                argumentos.host, argumentos.porta, verboso=True)
+    print(f"Servindo a planilha em {servidor.url()}")
+    print(f"Falhas ajustáveis em http://{argumentos.host}:{servidor.porta}/controle")
+    try:
+        servidor._http.serve_forever()
+    except KeyboardInterrupt:
+        servidor.parar()
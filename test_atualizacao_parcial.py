@@ -0,0 +1,77 @@
+import app_v2
+
+
+def publicar_duas_versoes(monkeypatch, montar_snapshot):
+    """Cache com duas versões retidas que diferem só no saldo de um documento."""
+    df = montar_snapshot(400, dias=10).df
+    alterado = df.copy()
+    linha = alterado['Saldo em Aberto_centavos'].idxmax()
+    alterado.loc[linha, ['Saldo em Aberto', 'Saldo em Aberto_centavos']] = [0.0, 0]
+
+    versoes = iter([montar_snapshot(versao='v1', df=df), montar_snapshot(versao='v2', df=alterado)])
+    cache = app_v2.CacheDados(lambda anterior: next(versoes), segundo_plano=False)
+    cache.atualizar()
+    cache.atualizar()
+    monkeypatch.setattr(app_v2, 'cache_dados', cache)
+    return df.loc[linha, 'Mes']
+
+
+def operacoes(patch):
+    return patch.to_plotly_json()['operations']
+
+
+def test_tabela_envia_so_linhas_alteradas(monkeypatch, montar_snapshot):
+    mes = publicar_duas_versoes(monkeypatch, montar_snapshot)
+    argumentos = (None, 'todos', None, 'nenhum', mes)
+
+    *_, estado = app_v2.atualizar_tabela(*argumentos, 'v1', 0, 500)
+    colunas, dados, total_paginas, novo_estado = app_v2.atualizar_tabela(*argumentos, 'v2', 0, 500, None, '', estado)
+
+    assert colunas is app_v2.no_update and total_paginas is app_v2.no_update
+    assert len(operacoes(dados)) == 1
+    assert novo_estado['versao'] == 'v2'
+    # Mesma versão e mesmos filtros: nada a enviar
+    assert app_v2.atualizar_tabela(*argumentos, 'v2', 0, 500, None, '', novo_estado)[1] is app_v2.no_update
+
+
+def test_graficos_enviam_so_tracos_alterados(monkeypatch, montar_snapshot):
+    """Os gráficos afetados pela mudança seguem como Patch dos traços; os demais ficam em no_update."""
+    mes = publicar_duas_versoes(monkeypatch, montar_snapshot)
+
+    *_, estado = app_v2.atualizar_graficos(None, 'todos', None, mes, 'v1')
+    vencimentos, fornecedores, _ = app_v2.atualizar_graficos(None, 'todos', None, mes, 'v2', estado)
+    # O documento quitado era o de maior saldo: muda o seu dia e o seu fornecedor
+    for figura in (vencimentos, fornecedores):
+        assert isinstance(figura, app_v2.Patch)
+        assert operacoes(figura)
+        assert all(op['location'][0] == 'data' for op in operacoes(figura))
+
+    # Filtrando outro fornecedor, a mudança não aparece em nenhum dos dois
+    df = app_v2.cache_dados.resolver('v1').df
+    quitado = df.loc[df['Saldo em Aberto_centavos'].idxmax(), 'Nome Fantasia Agente']
+    outro = df.loc[(df['Mes'] == mes) & (df['Nome Fantasia Agente'] != quitado), 'Nome Fantasia Agente'].iloc[0]
+    *_, estado = app_v2.atualizar_graficos(None, 'todos', outro, mes, 'v1')
+    vencimentos, fornecedores, _ = app_v2.atualizar_graficos(None, 'todos', outro, mes, 'v2', estado)
+    assert vencimentos is app_v2.no_update and fornecedores is app_v2.no_update
+
+
+def test_alteracoes_entre_versoes(processar_planilha, montar_snapshot):
+    """O atualizador registra pagos, reprogramados, novos e removidos entre versões consecutivas."""
+    df = processar_planilha(300, dias=10)
+    novo = df.copy()
+    aberto = novo.index[novo['Saldo em Aberto_centavos'] > 0]
+    novo.loc[aberto[0], ['Saldo em Aberto', 'Saldo em Aberto_centavos']] = [0.0, 0]  # pago
+    novo.loc[aberto[1], 'Prorrogado'] = novo.loc[aberto[1], 'Prorrogado'] + app_v2.pd.Timedelta(days=7)
+    removido = novo.index[-1]
+    novo = app_v2.pd.concat([novo.drop(index=removido), novo.iloc[[0]]], ignore_index=True)  # chave repetida = novo
+
+    versoes = iter([montar_snapshot(versao='v1', df=df), montar_snapshot(versao='v2', df=novo)])
+    cache = app_v2.CacheDados(lambda anterior: next(versoes), segundo_plano=False, historico=1)
+    cache.atualizar()
+    cache.atualizar()
+
+    alteracoes = cache.alteracoes()
+    assert alteracoes.versao_anterior == 'v1' and alteracoes.versao == 'v2'
+    assert alteracoes.resumo() == {'inseridos': 1, 'atualizados': 2, 'removidos': 1, 'pagos': 1, 'reprogramados': 1}
+    assert alteracoes.removidos['Número Doc.'].tolist() == [df['Número Doc.'].iloc[-1]]
+    assert len(cache.historico_alteracoes()) == 1
@@ -0,0 +1,107 @@
+import app_v2
+
+
+def test_lru_respeita_limites_e_conta_acertos():
+    cache = app_v2.CacheLRU(max_entradas=3, max_bytes=10)
+    for i in range(4):
+        cache.obter(('v1', i), lambda: 'ab')
+    assert len(cache) == 3 and ('v1', 0) not in cache._itens
+
+    assert cache.obter(('v1', 3), lambda: 'outro') == 'ab'
+    cache.obter(('v1', 4), lambda: 'abcdefgh')  # 2 + 2 + 8 > 10: sai a menos usada
+    assert list(cache._itens) == [('v1', 3), ('v1', 4)]
+    cache.obter(('v1', 5), lambda: 'x' * 11)  # maior que o limite: não é guardada
+    assert ('v1', 5) not in cache._itens
+
+    estatisticas = cache.estatisticas()
+    assert (estatisticas['hits'], estatisticas['misses'], estatisticas['bytes']) == (1, 6, 10)
+    assert estatisticas['taxa_acerto'] == 1 / 7
+
+
+def test_versao_nova_descarta_figuras_antigas(monkeypatch, processar_planilha, montar_snapshot):
+    """Figuras idênticas saem do cache; as das versões que deixam de ser retidas são descartadas."""
+    df = processar_planilha(300, dias=10)
+    versoes = iter(montar_snapshot(versao=v, df=df) for v in ('v1', 'v2'))
+    cache = app_v2.CacheDados(lambda anterior: next(versoes), segundo_plano=False, versoes_retidas=1)
+    figuras = app_v2.CacheLRU()
+    cache.ao_publicar(figuras.manter_versoes)
+    monkeypatch.setattr(app_v2, 'cache_dados', cache)
+    monkeypatch.setattr(app_v2, 'cache_figuras', figuras)
+    monkeypatch.setattr(app_v2, 'cache_visoes', app_v2.CacheLRU(tamanho=app_v2.tamanho_dataframe))
+    mes = df['Mes'].iloc[0]
+
+    cache.atualizar()
+    primeira = app_v2.atualizar_graficos(None, 'todos', None, mes, 'v1')
+    assert app_v2.atualizar_graficos(None, 'todos', None, mes, 'v1') == primeira
+    app_v2.atualizar_card_gastos_mensais('v1')
+    app_v2.atualizar_card_gastos_mensais('v1')
+    assert (figuras.hits, figuras.misses) == (2, 2)
+
+    cache.atualizar()
+    assert len(figuras) == 0
+
+
+def test_pedidos_simultaneos_compartilham_um_calculo():
+    """Várias threads pedindo a mesma chave ausente disparam um único cálculo."""
+    cache = app_v2.CacheLRU()
+    liberar = app_v2.threading.Event()
+    calculos = []
+
+    def calcular():
+        calculos.append(1)
+        liberar.wait(5)
+        return ["resultado"]
+
+    resultados = []
+    threads = [app_v2.threading.Thread(target=lambda: resultados.append(cache.obter(('v1', 'x'), calcular)))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    while cache.coalescidos < 7:
+        app_v2.time.sleep(0.01)
+    liberar.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calculos) == 1
+    assert len({id(resultado) for resultado in resultados}) == 1
+    assert cache.estatisticas()['taxa_acerto'] == 7 / 8
+
+
+def test_linhas_filtradas_compartilhadas(monkeypatch, processar_planilha, montar_snapshot):
+    """A mesma combinação de filtros devolve o mesmo DataFrame, até a versão mudar."""
+    df = processar_planilha(300, dias=10)
+    snapshot = montar_snapshot(versao='v1', df=df)
+    monkeypatch.setattr(app_v2, 'cache_visoes', app_v2.CacheLRU(tamanho=app_v2.tamanho_dataframe))
+
+    filtros = ('NF', 'aberto', None, df['Mes'].iloc[0])
+    primeira = app_v2.linhas_filtradas(snapshot, *filtros)
+    assert app_v2.linhas_filtradas(snapshot, *filtros) is primeira
+    assert primeira.index.equals(app_v2.filtrar_dataframe(df, *filtros).index)
+    assert app_v2.linhas_filtradas(snapshot, 'todos', 'todos', 'todos', 'todos') is df
+
+    app_v2.cache_visoes.manter_versoes(('v2',))
+    assert len(app_v2.cache_visoes) == 0
+
+
+def test_tabela_guardada_pela_versao_resolvida(monkeypatch, processar_planilha, montar_snapshot):
+    """A tabela fica sob a versão de fato servida e sai do cache quando ela deixa de ser retida."""
+    df = processar_planilha(300, dias=10)
+    versoes = iter(montar_snapshot(versao=v, df=df) for v in ('v1', 'v2'))
+    cache = app_v2.CacheDados(lambda anterior: next(versoes), segundo_plano=False, versoes_retidas=1)
+    tabelas = app_v2.CacheLRU(tamanho=app_v2.tamanho_tabela)
+    cache.ao_publicar(tabelas.manter_versoes)
+    monkeypatch.setattr(app_v2, 'cache_dados', cache)
+    monkeypatch.setattr(app_v2, 'cache_tabelas', tabelas)
+    monkeypatch.setattr(app_v2, 'cache_visoes', app_v2.CacheLRU(tamanho=app_v2.tamanho_dataframe))
+    mes = df['Mes'].iloc[0]
+
+    cache.atualizar()
+    # Uma versão que não está retida é resolvida para a atual e guardada sob ela
+    primeira = app_v2.tabela_completa('antiga', None, 'todos', None, 'dia_filial', mes)
+    assert app_v2.tabela_completa('v1', None, 'todos', None, 'dia_filial', mes) is primeira
+    assert [chave[0] for chave in tabelas._itens] == ['v1']
+    assert 0 < tabelas.estatisticas()['bytes'] <= tabelas.max_bytes
+
+    cache.atualizar()
+    assert len(tabelas) == 0
@@ -0,0 +1,36 @@
+import logging
+import threading
+
+from werkzeug.serving import make_server
+
+import app_v2
+import teste_carga
+from servidor_planilha import ServidorPlanilha
+
+
+def test_sessoes_simuladas_percorrem_os_callbacks(monkeypatch):
+    """Sessões virtuais abrem a página, disparam os callbacks em cadeia e trocam filtros sem erros."""
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    with ServidorPlanilha(linhas=300) as planilha:
+        monkeypatch.setattr(app_v2, 'sheet_url', planilha.url())
+        monkeypatch.setattr(app_v2, 'cache_dados', app_v2.CacheDados(app_v2.carregar_dados, segundo_plano=False))
+        servidor = make_server('127.0.0.1', 0, app_v2.server, threaded=True)
+        threading.Thread(target=servidor.serve_forever, daemon=True).start()
+        try:
+            relatorio = teste_carga.executar(f'http://127.0.0.1:{servidor.server_port}', sessoes=3, duracao=2,
+                                             rampa=0.3, pensar=0.2, acelerar=100)
+        finally:
+            servidor.shutdown()
+
+    rotulos = relatorio['rotulos']
+    assert relatorio['erros'] == 0
+    assert rotulos['GET /_dash-layout']['requisicoes'] == 3
+    assert rotulos['store-dados.data (+1)']['requisicoes'] > 3  # ticks de intervalo-atualizacao
+    assert rotulos['total-liquidado.children (+8)']['requisicoes'] > 3  # iniciais e trocas de filtro
+    assert all(linha['p50_ms'] <= linha['p95_ms'] <= linha['p99_ms'] for linha in rotulos.values())
+
+
+def test_percentil_pelo_posto_mais_proximo():
+    valores = list(range(1, 101))
+    assert [teste_carga.percentil(valores, p) for p in (50, 95, 99, 100)] == [50, 95, 99, 100]
+    assert teste_carga.percentil([7], 99) == 7
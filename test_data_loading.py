@@ -1,8 +1,9 @@
+import os
 import pandas as pd
 from datetime import datetime
 
 # URL da planilha
-sheet_url = "https://docs.google.com/spreadsheets/d/19G1wYQUda-zjrtUMaKnksVhhnIujHr1UezcV5Z9IMAg/export?format=csv&gid=0"
+sheet_url = os.environ.get('SHEET_URL', "https://docs.google.com/spreadsheets/d/19G1wYQUda-zjrtUMaKnksVhhnIujHr1UezcV5Z9IMAg/export?format=csv&gid=0")
 
 def test_carregar_dados():
     """Testa o carregamento de dados com tratamento de erro robusto."""
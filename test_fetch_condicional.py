@@ -0,0 +1,188 @@
+import os
+import subprocess
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import app_v2
+
+CSV_FIXO = (
+    "Relatório,,,,,,,,,\n"
+    ",,,,,,,,,\n"
+    ",,,,,,,,,\n"
+    "Nome Fantasia Filial,Nome Fantasia Agente,Prorrogado,Tipo Doc.,Número Doc.,AP,"
+    "Retenção IR,Líquido,Saldo em Aberto,Complemento\n"
+    'Filial A,Fornecedor 1,05/09/2025,NF,101,1,"R$ 0,00","R$ 1.234,56","R$ 1.234,56",\n'
+    'Filial A,Fornecedor 2,06/09/2025,PREV,102,2,"R$ 0,00","R$ 100,00","R$ 0,00",obs\n'
+    "Total Geral,,,,,,,,,\n"
+).encode('utf-8')
+
+
+def iniciar_servidor(conteudo, usar_etag=True):
+    """Sobe um servidor HTTP local que imita a exportação CSV do Google Sheets."""
+    estado = {'conteudo': conteudo, 'requisicoes': 0, 'respostas_304': 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            estado['requisicoes'] += 1
+            etag = f'"{hash(estado["conteudo"])}"'
+            if usar_etag and self.headers.get('If-None-Match') == etag:
+                estado['respostas_304'] += 1
+                self.send_response(304)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/csv; charset=utf-8')
+            self.send_header('Content-Length', str(len(estado['conteudo'])))
+            if usar_etag:
+                self.send_header('ETag', etag)
+            self.end_headers()
+            self.wfile.write(estado['conteudo'])
+
+        def log_message(self, *args):
+            pass
+
+    servidor = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{servidor.server_address[1]}/export?format=csv&gid=0"
+    return servidor, url, estado
+
+
+def contar_processamentos(monkeypatch):
+    chamadas = []
+    original = app_v2.processar_csv
+
+    def processar(conteudo):
+        chamadas.append(len(conteudo))
+        return original(conteudo)
+
+    monkeypatch.setattr(app_v2, 'processar_csv', processar)
+    return chamadas
+
+
+def test_etag_evita_novo_download(monkeypatch):
+    """Com ETag, o segundo carregamento recebe 304 e reaproveita o snapshot."""
+    servidor, url, estado = iniciar_servidor(CSV_FIXO)
+    monkeypatch.setattr(app_v2, 'sheet_url', url)
+    chamadas = contar_processamentos(monkeypatch)
+    try:
+        primeiro = app_v2.carregar_dados()
+        segundo = app_v2.carregar_dados(primeiro)
+    finally:
+        servidor.shutdown()
+
+    assert len(primeiro.df) == 2
+    assert estado['respostas_304'] == 1
+    assert len(chamadas) == 1
+    assert segundo.versao == primeiro.versao
+    assert segundo.df is primeiro.df
+
+
+def test_hash_evita_reprocessar_sem_validadores(monkeypatch):
+    """Sem ETag/Last-Modified, o hash do conteúdo detecta o CSV idêntico."""
+    servidor, url, estado = iniciar_servidor(CSV_FIXO, usar_etag=False)
+    monkeypatch.setattr(app_v2, 'sheet_url', url)
+    chamadas = contar_processamentos(monkeypatch)
+    try:
+        primeiro = app_v2.carregar_dados()
+        segundo = app_v2.carregar_dados(primeiro)
+    finally:
+        servidor.shutdown()
+
+    assert estado['requisicoes'] == 2
+    assert len(chamadas) == 1
+    assert segundo.df is primeiro.df
+
+
+def test_conteudo_alterado_gera_nova_versao(monkeypatch):
+    """Quando a planilha muda, os dados são reprocessados com uma nova versão."""
+    servidor, url, estado = iniciar_servidor(CSV_FIXO)
+    monkeypatch.setattr(app_v2, 'sheet_url', url)
+    try:
+        primeiro = app_v2.carregar_dados()
+        estado['conteudo'] = CSV_FIXO.replace(b'R$ 100,00', b'R$ 150,00')
+        segundo = app_v2.carregar_dados(primeiro)
+    finally:
+        servidor.shutdown()
+
+    assert segundo.versao != primeiro.versao
+    assert segundo.df['Líquido'].sum() == primeiro.df['Líquido'].sum() + 50
+
+
+def test_cache_mantem_versao_quando_nada_muda(monkeypatch):
+    """O cache não publica versão nova (nem conta novo snapshot) para dados idênticos."""
+    servidor, url, _ = iniciar_servidor(CSV_FIXO)
+    monkeypatch.setattr(app_v2, 'sheet_url', url)
+    cache = app_v2.CacheDados(app_v2.carregar_dados, segundo_plano=False)
+    try:
+        versao = cache.atualizar().versao
+        assert cache.atualizar().versao == versao
+    finally:
+        servidor.shutdown()
+
+    assert cache.estatisticas()['sem_alteracao'] == 1
+
+
+def test_falha_mantem_ultimo_snapshot_bom(monkeypatch):
+    """Se a planilha fica inacessível, o cache continua servindo os últimos dados bons."""
+    servidor, url, _ = iniciar_servidor(CSV_FIXO)
+    monkeypatch.setattr(app_v2, 'sheet_url', url)
+    cache = app_v2.CacheDados(app_v2.carregar_dados, segundo_plano=False)
+    versao = cache.atualizar().versao
+    servidor.shutdown()
+    servidor.server_close()
+
+    assert cache.atualizar().versao == versao
+    assert cache.estatisticas()['falhas'] == 1
+
+
+def test_obter_nao_espera_pela_rede():
+    """Com dados vencidos, obter devolve o snapshot atual e revalida em segundo plano."""
+    liberar = threading.Event()
+
+    def carregador_lento(anterior):
+        liberar.wait(5)
+        return app_v2.Snapshot(versao='nova', df=app_v2.pd.DataFrame({'x': [1]}),
+                               carregado_em=app_v2.datetime.now())
+
+    cache = app_v2.CacheDados(carregador_lento, ttl=0, segundo_plano=False)
+    assert cache.obter().versao == 'vazio'
+    liberar.set()
+    assert cache.atualizar().versao == 'nova'
+
+
+def test_copia_em_disco_serve_partida_e_falha(monkeypatch, tmp_path):
+    """A cópia em disco é restaurada na partida e continua servida se a planilha estiver fora do ar."""
+    arquivo = str(tmp_path / 'snapshot.arrow')
+    servidor, url, _ = iniciar_servidor(CSV_FIXO)
+    monkeypatch.setattr(app_v2, 'sheet_url', url)
+    cache = app_v2.CacheDados(app_v2.carregar_dados, segundo_plano=False, arquivo=arquivo)
+    original = cache.atualizar()
+    servidor.shutdown()
+    servidor.server_close()
+    assert [p.name for p in tmp_path.iterdir()] == ['snapshot.arrow']
+
+    # Novo processo: a cópia é publicada antes de qualquer download
+    reiniciado = app_v2.CacheDados(app_v2.carregar_dados, segundo_plano=False, arquivo=arquivo)
+    restaurado = reiniciado.restaurar()
+    assert restaurado.origem == 'disco'
+    assert restaurado.versao == original.versao
+    assert restaurado.df.equals(original.df)
+    assert reiniciado.atual() is restaurado
+
+    assert reiniciado.atualizar() is restaurado
+    assert reiniciado.ultima_falha is not None
+
+
+def test_importar_nao_inicia_os_dados(montar_snapshot, tmp_path):
+    """Importar o módulo não lê a cópia em disco nem inicia threads; iniciar_dados() faz as duas coisas."""
+    app_v2.salvar_snapshot(montar_snapshot(50), str(tmp_path / 'snapshot.arrow'))
+    script = ("import threading, app_v2\n"
+              "print(app_v2.cache_dados.atual().versao, app_v2.DADOS_COMPARTILHADOS, threading.active_count())\n"
+              "app_v2.iniciar_dados()\n"
+              "print(app_v2.cache_dados.atual().versao, app_v2.cache_dados._atualizador.name)\n")
+    ambiente = {**os.environ, 'DIRETORIO_CACHE': str(tmp_path), 'SHEET_URL': 'http://127.0.0.1:9/inacessivel'}
+    ambiente.pop('DADOS_COMPARTILHADOS', None)
+    saida = subprocess.run([sys.executable, '-c', script], env=ambiente, capture_output=True, text=True,
+                           cwd=os.path.dirname(os.path.abspath(app_v2.__file__)), check=True).stdout.split('\n')
+    assert saida[:2] == ['vazio False 1', 't atualizador-dados']
@@ -0,0 +1,60 @@
+import itertools
+
+import app_v2
+
+
+def test_indice_equivale_a_filtrar_dataframe(montar_snapshot):
+    """O índice do snapshot seleciona exatamente as mesmas linhas das máscaras."""
+    snapshot = montar_snapshot(2_000)
+    df = snapshot.df
+
+    tipos = ['todos', None, 'NF', 'INEXISTENTE']
+    status = ['todos', 'aberto', 'liquidado']
+    fornecedores = ['todos', 'FORNECEDOR 001']
+    meses = ['todos', df['Mes'].iloc[0], '1999-01']
+    for filtros in itertools.product(tipos, status, fornecedores, meses):
+        esperado = app_v2.filtrar_dataframe(df, *filtros)
+        assert snapshot.filtrar(*filtros).df.index.equals(esperado.index), filtros
+
+
+def test_sem_filtros_nao_copia(montar_snapshot):
+    """Sem filtros, a visão devolve o próprio DataFrame do snapshot."""
+    snapshot = montar_snapshot(100)
+    df = snapshot.df
+
+    assert snapshot.filtrar('todos', 'todos', 'todos', 'todos').df is df
+
+
+def test_cubo_equivale_as_somas_filtradas(montar_snapshot):
+    """Os totais do cubo de KPIs batem com as somas sobre as linhas filtradas."""
+    snapshot = montar_snapshot(2_000)
+    df = snapshot.df
+
+    for filtros in itertools.product(['todos', 'NF', 'INEXISTENTE'], ['todos', 'aberto', 'liquidado'],
+                                     ['todos', 'FORNECEDOR 001'], [None, df['Mes'].iloc[0], '1999-01']):
+        linhas = app_v2.filtrar_dataframe(df, *filtros)
+        saldo = linhas['Saldo em Aberto_centavos']
+        assert snapshot.cubo.consultar(*filtros) == {
+            'liquido': linhas['Líquido_centavos'].sum(),
+            'aberto': saldo[saldo > 0].sum(),
+            'liquidado': linhas.loc[saldo == 0, 'Líquido_centavos'].sum(),
+            'documentos': len(linhas),
+            'vencidos': int((linhas['Vencido'] & (saldo > 0)).sum()),
+        }, filtros
+
+    abertos = df[(df['Prorrogado'] < '2025-07-01') & (df['Saldo em Aberto'] > 0)]
+    assert snapshot.cubo.meses_em_aberto_antes('2025-07') == (sorted(abertos['Mes'].unique()), len(abertos))
+
+
+def test_colunas_categoricas_reduzem_memoria(processar_planilha):
+    """Compactar as dimensões de baixa cardinalidade reduz a memória de cada uma delas."""
+    df = processar_planilha(2_000).astype({col: object for col in app_v2.COLUNAS_CATEGORICAS})
+    antes = app_v2.relatorio_memoria(df).set_index('coluna')
+
+    app_v2.compactar_dataframe(df)
+    depois = app_v2.relatorio_memoria(df).set_index('coluna')
+
+    assert list(depois['bytes']) == sorted(depois['bytes'], reverse=True)
+    for coluna in app_v2.COLUNAS_CATEGORICAS:
+        assert depois.loc[coluna, 'tipo'] == 'category'
+        assert depois.loc[coluna, 'bytes'] < antes.loc[coluna, 'bytes'] / 2, coluna
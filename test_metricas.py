@@ -0,0 +1,71 @@
+import pytest
+
+import app_v2
+
+
+def test_histograma_no_formato_prometheus():
+    metricas = app_v2.Metricas()
+    metricas.declarar('teste_segundos', 'histogram', 'Teste.', (0.1, 1))
+    for valor in (0.05, 0.1, 0.5, 3):
+        metricas.observar('teste_segundos', valor, etapa='a"b')
+
+    linhas = metricas.texto().splitlines()
+    assert linhas[:2] == ['# HELP teste_segundos Teste.', '# TYPE teste_segundos histogram']
+    assert linhas[2:] == [
+        'teste_segundos_bucket{etapa="a\\"b",le="0.1"} 2',
+        'teste_segundos_bucket{etapa="a\\"b",le="1"} 3',
+        'teste_segundos_bucket{etapa="a\\"b",le="+Inf"} 4',
+        'teste_segundos_sum{etapa="a\\"b"} 3.65',
+        'teste_segundos_count{etapa="a\\"b"} 4',
+    ]
+
+
+def test_medir_etapa_conta_falhas():
+    antes = app_v2.metricas.valor('dashboard_etapa_erros_total', etapa='teste')
+    with pytest.raises(ValueError):
+        with app_v2.medir_etapa('teste'):
+            raise ValueError
+    assert app_v2.metricas.valor('dashboard_etapa_erros_total', etapa='teste') == antes + 1
+    assert sum(app_v2.metricas.valor('dashboard_etapa_duracao_segundos', etapa='teste')[:-1]) >= 1
+
+
+def test_endpoint_metrics_registra_callbacks():
+    """Cada chamada de callback é contada pelo nome da função e aparece em /metrics."""
+    cliente = app_v2.server.test_client()
+    antes = app_v2.metricas.valor('dashboard_callback_chamadas_total', callback='atualizar_dados_de')
+    resposta = cliente.post('/_dash-update-component', json={
+        'output': 'dados-de.children',
+        'outputs': {'id': 'dados-de', 'property': 'children'},
+        'inputs': [{'id': 'store-dados', 'property': 'data', 'value': None},
+                   {'id': 'intervalo-atualizacao', 'property': 'n_intervals', 'value': 0}],
+        'changedPropIds': ['store-dados.data'],
+    })
+    assert resposta.status_code == 200
+
+    texto = cliente.get('/metrics').data.decode('utf-8')
+    assert f'dashboard_callback_chamadas_total{{callback="atualizar_dados_de"}} {antes + 1}' in texto
+    assert 'dashboard_callback_duracao_segundos_bucket{callback="atualizar_dados_de",le="+Inf"}' in texto
+    assert 'dashboard_callback_resposta_bytes_count{callback="atualizar_dados_de"}' in texto
+    assert 'dashboard_cache_entradas{cache="figuras"}' in texto
+
+
+def test_saidas_desconhecidas_nao_criam_rotulos():
+    """Saídas inventadas pelo cliente caem num único rótulo e não são guardadas."""
+    cliente = app_v2.server.test_client()
+    antes = app_v2.metricas.valor('dashboard_callback_chamadas_total', callback='desconhecido')
+    for saida in ('inexistente-1.children', 'inexistente-2.children', ['lista']):
+        cliente.post('/_dash-update-component', json={'output': saida, 'inputs': [], 'changedPropIds': []})
+
+    assert app_v2.metricas.valor('dashboard_callback_chamadas_total', callback='desconhecido') == antes + 3
+    assert not {'inexistente-1.children', 'inexistente-2.children'} & set(app_v2.nomes_callbacks)
+    assert 'inexistente' not in app_v2.metricas.texto()
+
+
+def test_endpoint_metrics_exige_token(monkeypatch):
+    """/metrics segue a regra de /admin: só a própria máquina ou quem tem o token."""
+    cliente = app_v2.server.test_client()
+    assert cliente.get('/metrics', environ_base={'REMOTE_ADDR': '10.0.0.5'}).status_code == 403
+
+    monkeypatch.setattr(app_v2, 'TOKEN_ADMIN', 'segredo')
+    assert cliente.get('/metrics').status_code == 403
+    assert cliente.get('/metrics', query_string={'token': 'segredo'}).status_code == 200
@@ -0,0 +1,54 @@
+import app_v2
+from gerar_planilha import gerar_csv
+
+
+def test_execucao_registra_as_etapas_do_processamento(monkeypatch):
+    """Uma atualização guarda as etapas medidas, com linhas e bytes, e o resultado."""
+    monkeypatch.setattr(app_v2, 'execucoes_carga', app_v2.deque(maxlen=2))
+    conteudo = gerar_csv(300, dias=10)
+    carregador = lambda anterior: app_v2.Snapshot(versao='v1', df=app_v2.processar_csv(conteudo),
+                                                  carregado_em=app_v2.datetime.now())
+    cache = app_v2.CacheDados(carregador, segundo_plano=False)
+    cache.atualizar()
+
+    [execucao] = app_v2.historico_execucoes()
+    assert (execucao['origem'], execucao['resultado'], execucao['versao']) == ('planilha', 'nova_versao', 'v1')
+    etapas = {etapa['etapa']: etapa for etapa in execucao['etapas']}
+    assert list(etapas) == ['leitura_csv', 'corte_total_geral', 'conversao', 'derivacao']
+    assert etapas['leitura_csv']['bytes'] == len(conteudo)
+    assert etapas['corte_total_geral']['linhas'] == 300
+    assert etapas['derivacao']['bytes'] < etapas['derivacao']['bytes_antes']
+    assert etapas['derivacao']['maiores_colunas'].count(':') == 3
+    assert all(etapa['erro'] is None and etapa['duracao_ms'] >= 0 for etapa in execucao['etapas'])
+
+    # Sem etapas medidas (nada a buscar), a execução não ocupa o histórico
+    app_v2.CacheDados(lambda anterior: None, segundo_plano=False).atualizar()
+    assert len(app_v2.historico_execucoes()) == 1
+
+
+def test_rota_admin_exige_token(monkeypatch):
+    cliente = app_v2.server.test_client()
+    assert cliente.get('/admin/carga').status_code == 200
+    assert cliente.get('/admin/carga', environ_base={'REMOTE_ADDR': '10.0.0.5'}).status_code == 403
+
+    monkeypatch.setattr(app_v2, 'TOKEN_ADMIN', 'segredo')
+    assert cliente.get('/admin/carga').status_code == 403
+    resposta = cliente.get('/admin/carga', headers={'X-Admin-Token': 'segredo'})
+    assert resposta.status_code == 200
+    assert {'processo', 'cache', 'execucoes'} <= set(resposta.get_json())
+
+
+def test_linha_com_colunas_a_mais_e_descartada_e_contada(monkeypatch, processar_planilha):
+    """Uma linha inválida no meio do CSV tira só ela dos dados, e o descarte aparece na etapa e na métrica."""
+    monkeypatch.setattr(app_v2, 'execucoes_carga', app_v2.deque(maxlen=2))
+    linhas = gerar_csv(300, dias=10).split(b'\n')
+    ruim = linhas[10] + b',coluna,a mais'
+    conteudo = b'\n'.join(linhas[:10] + [ruim] + linhas[10:])
+    antes = app_v2.metricas.valor('dashboard_csv_linhas_descartadas_total')
+
+    with app_v2.execucao_carga('teste') as execucao:
+        df = app_v2.processar_csv(conteudo)
+
+    assert df.equals(processar_planilha(300, dias=10))
+    assert execucao['etapas'][0]['descartadas'] == 1
+    assert app_v2.metricas.valor('dashboard_csv_linhas_descartadas_total') == antes + 1
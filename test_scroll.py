@@ -1,10 +1,11 @@
+import os
 import pandas as pd
 from datetime import datetime
 
 def test_table_structure():
     try:
         # URL do Google Sheets
-        sheet_url = "https://docs.google.com/spreadsheets/d/19G1wYQUda-zjrtUMaKnksVhhnIujHr1UezcV5Z9IMAg/export?format=csv&gid=0"
+        sheet_url = os.environ.get('SHEET_URL', "https://docs.google.com/spreadsheets/d/19G1wYQUda-zjrtUMaKnksVhhnIujHr1UezcV5Z9IMAg/export?format=csv&gid=0")
         
         print("Carregando dados...")
         df = pd.read_csv(sheet_url)
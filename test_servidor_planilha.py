@@ -0,0 +1,36 @@
+import urllib.request
+
+import app_v2
+from servidor_planilha import ConfiguracaoFalhas, ServidorPlanilha
+
+
+def test_carregamento_segue_as_mudancas_da_planilha_local(monkeypatch):
+    """304 enquanto nada muda; com uma mudança, a nova versão traz os lançamentos novos."""
+    with ServidorPlanilha(linhas=200) as servidor:
+        monkeypatch.setattr(app_v2, 'sheet_url', servidor.url())
+        primeiro = app_v2.carregar_dados()
+        segundo = app_v2.carregar_dados(primeiro)
+        servidor.configuracao.mudar_a_cada_segundos = 3600
+        servidor.inicio -= 3600  # como se uma hora tivesse passado: uma mudança
+        terceiro = app_v2.carregar_dados(segundo)
+
+    assert len(primeiro.df) == 200
+    assert segundo.df is primeiro.df and servidor.contadores['respostas_304'] == 1
+    assert terceiro.versao != primeiro.versao and len(terceiro.df) == 210
+
+
+def test_falhas_injetadas_mantem_o_ultimo_snapshot(monkeypatch):
+    """Erro 5xx, corpo truncado e codificação errada não substituem os dados bons."""
+    with ServidorPlanilha(linhas=200) as servidor:
+        monkeypatch.setattr(app_v2, 'sheet_url', servidor.url())
+        cache = app_v2.CacheDados(lambda anterior: app_v2.carregar_dados(None), segundo_plano=False)
+        bom = cache.atualizar()
+        for falha in ('taxa_erro', 'taxa_truncado', 'taxa_codificacao'):
+            servidor.configuracao = ConfiguracaoFalhas(**{falha: 1.0})
+            assert cache.atualizar() is bom, falha
+        requisicao = urllib.request.Request(servidor.url().split('/spreadsheets')[0] + '/controle')
+        with urllib.request.urlopen(requisicao) as resposta:
+            contadores = app_v2.json.load(resposta)['contadores']
+
+    assert cache.falhas == 3
+    assert (contadores['erros'], contadores['truncados'], contadores['codificacao']) == (1, 1, 1)
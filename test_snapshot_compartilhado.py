@@ -0,0 +1,83 @@
+import multiprocessing
+import os
+
+import app_v2
+
+
+def carregador_proibido(anterior):
+    raise AssertionError("só o processo atualizador deveria buscar a planilha")
+
+
+def mapeado_do_arquivo(array, caminho):
+    """Indica se o array aponta para uma região do processo mapeada a partir do arquivo."""
+    endereco = array.__array_interface__['data'][0]
+    with open('/proc/self/maps') as maps:
+        for linha in maps:
+            campos = linha.split()
+            if len(campos) >= 6 and campos[5] == caminho:
+                inicio, fim = (int(x, 16) for x in campos[0].split('-'))
+                if inicio <= endereco < fim:
+                    return True
+    return False
+
+
+def ler_como_worker(arquivo, fila, liberar):
+    """Processo leitor: acompanha o snapshot publicado pelo atualizador."""
+    cache = app_v2.CacheDados(carregador_proibido, segundo_plano=False, arquivo=arquivo, compartilhado=True)
+    for _ in range(2):
+        snapshot = cache.atualizar()
+        liquido = snapshot.df['Líquido_centavos'].to_numpy()
+        fila.put((os.getpid(), cache.estatisticas()['papel'], snapshot.versao, snapshot.geracao,
+                  int(liquido.sum()), mapeado_do_arquivo(liquido, arquivo)))
+        liberar.wait(60)
+
+
+def test_workers_leem_o_snapshot_do_atualizador(tmp_path, montar_snapshot):
+    """Um processo busca e grava o snapshot; os demais o mapeiam sem cópia e seguem a geração."""
+    versoes = iter([montar_snapshot(500, versao='v1'), montar_snapshot(500, versao='v2', semente=1)])
+    arquivo = os.path.realpath(tmp_path / 'snapshot.arrow')
+    atualizador = app_v2.CacheDados(lambda anterior: next(versoes), segundo_plano=False,
+                                    arquivo=arquivo, compartilhado=True)
+    primeiro = atualizador.atualizar()
+    assert atualizador.estatisticas()['papel'] == 'atualizador'
+
+    contexto = multiprocessing.get_context('spawn')
+    fila, liberar = contexto.Queue(), contexto.Event()
+    processos = [contexto.Process(target=ler_como_worker, args=(arquivo, fila, liberar)) for _ in range(3)]
+    for processo in processos:
+        processo.start()
+    try:
+        relatos = [fila.get(timeout=120) for _ in processos]
+        soma = int(primeiro.df['Líquido_centavos'].sum())
+        assert len({pid for pid, *_ in relatos}) == 3
+        assert all(relato[1:] == ('leitor', 'v1', 1, soma, True) for relato in relatos), relatos
+
+        segundo = atualizador.atualizar()
+        liberar.set()
+        relatos = [fila.get(timeout=120) for _ in processos]
+        soma = int(segundo.df['Líquido_centavos'].sum())
+        assert all(relato[1:] == ('leitor', 'v2', 2, soma, True) for relato in relatos), relatos
+    finally:
+        liberar.set()
+        for processo in processos:
+            processo.join(30)
+        atualizador.parar()
+
+    assert all(processo.exitcode == 0 for processo in processos)
+
+
+def test_outro_processo_assume_quando_o_atualizador_para(tmp_path):
+    """Liberada a trava, o próximo processo a atualizar passa a buscar a planilha."""
+    arquivo = str(tmp_path / 'snapshot.arrow')
+    vazio = lambda anterior: app_v2.Snapshot(versao='vazio', df=app_v2.pd.DataFrame(),
+                                             carregado_em=app_v2.datetime.now())
+    primeiro = app_v2.CacheDados(vazio, segundo_plano=False, arquivo=arquivo, compartilhado=True)
+    segundo = app_v2.CacheDados(vazio, segundo_plano=False, arquivo=arquivo, compartilhado=True)
+
+    primeiro.atualizar()
+    segundo.atualizar()
+    assert (primeiro.estatisticas()['papel'], segundo.estatisticas()['papel']) == ('atualizador', 'leitor')
+
+    primeiro.parar()
+    segundo.atualizar()
+    assert segundo.estatisticas()['papel'] == 'atualizador'
@@ -0,0 +1,125 @@
+import io
+import json
+
+import numpy as np
+from openpyxl import load_workbook
+
+import app_v2
+from benchmark_tabela import montar_tabela_por_lacos
+
+
+def test_registros_identicos_a_implementacao_por_lacos(processar_planilha):
+    """A montagem vetorizada gera exatamente os mesmos registros, inclusive com filial ausente."""
+    df = processar_planilha(600, dias=10)
+    df.loc[df.index[::37], 'Nome Fantasia Filial'] = np.nan
+    df['Complemento'] = df['Complemento'].cat.add_categories(['None'])
+    df.loc[df.index[::53], 'Complemento'] = 'None'
+
+    registros = app_v2.montar_registros_dia_filial(df)
+    assert json.dumps(registros) == json.dumps(montar_tabela_por_lacos(df))
+    assert registros[-1]['Data'].startswith('TOTAL DIA: ')
+
+
+def test_sem_linhas(processar_planilha):
+    df = processar_planilha(50)
+    assert app_v2.montar_registros_dia_filial(df.iloc[:0]) == []
+
+
+def test_paginas_agrupadas_mantem_blocos(monkeypatch, montar_snapshot):
+    """Nas visões agrupadas nenhuma página começa no meio de um bloco sem repetir o cabeçalho."""
+    snapshot = montar_snapshot(800, dias=10)
+    monkeypatch.setattr(app_v2, 'obter_snapshot', lambda versao: snapshot)
+    mes = snapshot.df['Mes'].iloc[0]
+    _, registros, blocos = app_v2.tabela_completa('t', None, 'todos', None, 'dia_filial', mes)
+
+    total_paginas = app_v2.atualizar_tabela(None, 'todos', None, 'dia_filial', mes, 't', 0, 25)[2]
+    remontados = []
+    for pagina in range(total_paginas):
+        janela = app_v2.atualizar_tabela(None, 'todos', None, 'dia_filial', mes, 't', pagina, 25)[1]
+        assert 0 < len(janela) <= 25
+        assert janela[0]['Data'].startswith('Data: ')
+        remontados.extend(r for r in janela if not r['Data'].endswith('(continuação)'))
+    assert remontados == registros
+
+
+def test_filtro_e_ordenacao_no_servidor(monkeypatch, montar_snapshot):
+    snapshot = montar_snapshot(300, dias=10)
+    monkeypatch.setattr(app_v2, 'obter_snapshot', lambda versao: snapshot)
+    mes = snapshot.df['Mes'].iloc[0]
+
+    _, janela, total_paginas, _ = app_v2.atualizar_tabela(
+        None, 'todos', None, 'nenhum', mes, 't', 0, 10,
+        [{'column_id': 'Líquido', 'direction': 'asc'}], '{Tipo Doc.} s= NF && {Líquido} > 100')
+    assert len(janela) == 10
+    assert all(r['Tipo Doc.'] == 'NF' and r['Líquido'] > 100 for r in janela)
+    assert [r['Líquido'] for r in janela] == sorted(r['Líquido'] for r in janela)
+    assert total_paginas > 1
+
+
+def test_exportacao_excel_tipada(monkeypatch, montar_snapshot):
+    """O Excel sai do servidor com todas as linhas, datas e valores tipados e subtotais em negrito."""
+    snapshot = montar_snapshot(300, dias=10)
+    monkeypatch.setattr(app_v2, 'obter_snapshot', lambda versao: snapshot)
+    mes = snapshot.df['Mes'].iloc[0]
+    _, registros, _ = app_v2.tabela_completa('t', None, 'todos', None, 'dia_filial', mes)
+
+    url = app_v2.exportar_para_excel(1, None, 'todos', None, mes, 'dia_filial', [], '', 't')
+    resposta = app_v2.server.test_client().get(url)
+    assert resposta.status_code == 200 and resposta.headers['Content-Disposition'].startswith('attachment')
+    planilha = load_workbook(io.BytesIO(resposta.data))['Contas a Pagar']
+    linhas = list(planilha.iter_rows(min_row=2))
+    assert len(linhas) == len(registros)
+
+    for linha, registro in zip(linhas, registros):
+        data, liquido = linha[0], linha[5]
+        if registro['Número Doc.'] == '':
+            assert data.value == registro['Data'] and data.font.bold
+            assert liquido.value == (registro['Líquido'] if registro['Líquido'] != '' else None)
+        else:
+            assert data.value.strftime('%d/%m/%Y') == registro['Data'] and data.is_date
+            assert liquido.value == registro['Líquido'] and liquido.number_format == app_v2.FORMATO_MOEDA_EXCEL
+            assert linha[3].value == registro['Número Doc.']
+
+
+def test_registros_exportados_em_blocos_iguais_a_tabela(montar_snapshot):
+    """Gerados em blocos pequenos, os registros exportados são os mesmos da tabela completa."""
+    df = montar_snapshot(600, dias=10).df
+    for agrupamento in ('dia_filial', 'diario', 'nenhum'):
+        for ordem in (None, [('Tipo Doc.', True), ('AP', False)]):
+            nomes, esperados = app_v2.montar_tabela(df, agrupamento, ordem)
+            obtidos_nomes, obtidos = app_v2.registros_exportacao(df, agrupamento, ordem, linhas_por_bloco=37)
+            assert obtidos_nomes == nomes
+            assert json.dumps(list(obtidos)) == json.dumps(esperados), (agrupamento, ordem)
+
+
+def test_exportacao_sem_agrupamento_nao_destaca_linhas(monkeypatch, montar_snapshot):
+    """Na visão simples, um lançamento sem data é gravado como lançamento, sem negrito."""
+    snapshot = montar_snapshot(300, dias=10)
+    snapshot.df.loc[snapshot.df.index[0], 'Data_fmt'] = None
+    monkeypatch.setattr(app_v2, 'obter_snapshot', lambda versao: snapshot)
+    mes = snapshot.df['Mes'].iloc[0]
+
+    url = app_v2.exportar_para_excel(1, None, 'todos', None, mes, 'nenhum', [], '', 't')
+    planilha = load_workbook(io.BytesIO(app_v2.server.test_client().get(url).data))['Contas a Pagar']
+    linhas = list(planilha.iter_rows(min_row=2))
+    assert any(linha[0].value is None for linha in linhas)
+    assert not any(celula.font.bold for linha in linhas for celula in linha)
+
+
+def test_visao_diaria_blocos_e_totais(processar_planilha):
+    """Cada dia traz o cabeçalho, os lançamentos daquele dia e o total deles; lançamentos sem data ficam de fora."""
+    df = processar_planilha(600, dias=10)
+    df.loc[df.index[::41], 'Data_fmt'] = None
+    nomes, registros = app_v2.montar_tabela(df, 'diario')
+    assert nomes == app_v2.COLUNAS_TABELA
+
+    lancamentos = 0
+    while registros:
+        cabecalho, *resto = registros
+        fim = next(i for i, r in enumerate(resto) if r['Data'].startswith('Total do dia '))
+        dia, total, registros = resto[:fim], resto[fim], resto[fim + 1:]
+        data = cabecalho['Data'].removeprefix('Data: ')
+        assert total['Data'] == f'Total do dia {data}' and all(r['Data'] == data for r in dia)
+        assert total['Líquido'] == round(sum(r['Líquido'] for r in dia), 2)
+        lancamentos += len(dia)
+    assert lancamentos == df['Data_fmt'].notna().sum()
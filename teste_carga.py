@@ -0,0 +1,319 @@
+import argparse
+import contextlib
+import http.client
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlparse
+
+# Gerador de carga: simula sessões do dashboard fazendo as mesmas requisições
+# do navegador (página, /_dash-layout, /_dash-dependencies e as chamadas de
+# /_dash-update-component) e mede a vazão e os percentis por callback.
+#
+# Cada sessão guarda o valor das propriedades dos componentes, como o
+# renderer do Dash: dispara os callbacks iniciais, aplica as respostas e
+# encadeia os callbacks cujas entradas mudaram. Depois alterna entre trocas
+# aleatórias nos dropdowns (com um tempo de reflexão exponencial) e os ticks
+# de intervalo-atualizacao, no intervalo que o próprio servidor define
+# (dividido por --acelerar).
+#
+# Sem --url, sobe localmente a planilha (servidor_planilha.py) e o
+# app.server num servidor werkzeug com threads, tudo sem rede; o gerador
+# divide o processo (e o GIL) com o app. Para medir um gunicorn, suba-o com
+# SHEET_URL apontando para `python servidor_planilha.py` e use --url.
+
+DROPDOWNS = ('dropdown-tipo-doc', 'dropdown-status', 'dropdown-fornecedor', 'dropdown-mes', 'dropdown-agrupamento')
+
+
+def percentil(valores, p):
+    """Percentil pelo método do posto mais próximo (valores já ordenados)."""
+    if not valores:
+        return None
+    return valores[min(len(valores) - 1, max(0, int(round(p / 100 * len(valores))) - 1))]
+
+
+class Medicoes:
+    """Latências e erros por rótulo (callback ou recurso), compartilhados entre as sessões."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencias = defaultdict(list)
+        self.erros = defaultdict(int)
+
+    def registrar(self, rotulo, segundos, erro=False):
+        with self._lock:
+            self.latencias[rotulo].append(segundos * 1000)
+            if erro:
+                self.erros[rotulo] += 1
+
+    def relatorio(self, duracao):
+        linhas = {}
+        for rotulo, tempos in sorted(self.latencias.items()):
+            tempos = sorted(tempos)
+            linhas[rotulo] = {
+                'requisicoes': len(tempos), 'erros': self.erros[rotulo],
+                'por_segundo': round(len(tempos) / duracao, 2),
+                'p50_ms': round(percentil(tempos, 50), 2), 'p95_ms': round(percentil(tempos, 95), 2),
+                'p99_ms': round(percentil(tempos, 99), 2), 'max_ms': round(tempos[-1], 2),
+            }
+        total = sum(len(tempos) for tempos in self.latencias.values())
+        return {'duracao_s': round(duracao, 2), 'requisicoes': total, 'por_segundo': round(total / duracao, 2),
+                'erros': sum(self.erros.values()), 'rotulos': linhas}
+
+
+def componentes(layout):
+    """Propriedades de cada componente com id no layout serializado, por (id, propriedade)."""
+    propriedades = {}
+    pendentes = [layout]
+    while pendentes:
+        no = pendentes.pop()
+        if isinstance(no, list):
+            pendentes.extend(no)
+        elif isinstance(no, dict) and 'props' in no:
+            props = no['props']
+            if isinstance(props.get('id'), str):
+                for nome, valor in props.items():
+                    if nome != 'children' or not isinstance(valor, (dict, list)):
+                        propriedades[(props['id'], nome)] = valor
+            pendentes.extend(v for v in props.values() if isinstance(v, (dict, list)))
+    return propriedades
+
+
+def rotulo_callback(dependencia):
+    """Rótulo curto do callback: a primeira saída e quantas mais ele atualiza."""
+    saidas = dependencia['output'].strip('.').split('...')
+    return saidas[0] + (f' (+{len(saidas) - 1})' if len(saidas) > 1 else '')
+
+
+def saidas_callback(dependencia):
+    saidas = []
+    for saida in dependencia['output'].strip('.').split('...'):
+        componente, propriedade = saida.rsplit('.', 1)
+        saidas.append((componente, propriedade))
+    return saidas
+
+
+class Sessao:
+    """Uma sessão virtual do dashboard, com a própria conexão HTTP e o estado dos componentes."""
+
+    def __init__(self, url, medicoes, rnd, pensar, acelerar, max_cadeia=10):
+        endereco = urlparse(url)
+        self._host, self._porta = endereco.hostname, endereco.port or 80
+        self._prefixo = endereco.path.rstrip('/')
+        self._conexao = None
+        self.medicoes = medicoes
+        self.rnd = rnd
+        self.pensar = pensar
+        self.acelerar = acelerar
+        self.max_cadeia = max_cadeia
+        self.estado = {}
+        self.callbacks = []
+
+    def requisitar(self, metodo, caminho, rotulo, corpo=None):
+        """(status, corpo) de uma requisição, com a latência registrada sob `rotulo`."""
+        dados = json.dumps(corpo).encode('utf-8') if corpo is not None else None
+        cabecalhos = {'Content-Type': 'application/json'} if dados is not None else {}
+        inicio = time.perf_counter()
+        try:
+            if self._conexao is None:
+                self._conexao = http.client.HTTPConnection(self._host, self._porta, timeout=120)
+            self._conexao.request(metodo, self._prefixo + caminho, body=dados, headers=cabecalhos)
+            resposta = self._conexao.getresponse()
+            conteudo = resposta.read()
+            status = resposta.status
+        except (OSError, http.client.HTTPException):
+            self._conexao = None  # reconectar na próxima requisição
+            self.medicoes.registrar(rotulo, time.perf_counter() - inicio, erro=True)
+            return None, None
+        self.medicoes.registrar(rotulo, time.perf_counter() - inicio, erro=status >= 400)
+        return status, conteudo
+
+    def abrir(self):
+        """Carrega a página como o navegador e dispara os callbacks iniciais."""
+        self.requisitar('GET', '/', 'GET /')
+        _, layout = self.requisitar('GET', '/_dash-layout', 'GET /_dash-layout')
+        _, dependencias = self.requisitar('GET', '/_dash-dependencies', 'GET /_dash-dependencies')
+        if layout is None or dependencias is None:
+            return False
+        self.estado = componentes(json.loads(layout))
+        # Callbacks do navegador (clientside) não passam pelo servidor
+        self.callbacks = [d for d in json.loads(dependencias) if not d.get('clientside_function')]
+        self.disparar([d for d in self.callbacks if not d.get('prevent_initial_call')], set())
+        return True
+
+    def chamar(self, dependencia, alteradas):
+        """Chama um callback com os valores atuais; devolve as propriedades que mudaram."""
+        def valores(lista):
+            return [{'id': e['id'], 'property': e['property'], 'value': self.estado.get((e['id'], e['property']))}
+                    for e in lista]
+        saidas = saidas_callback(dependencia)
+        corpo = {
+            'output': dependencia['output'],
+            'outputs': [{'id': c, 'property': p} for c, p in saidas] if len(saidas) > 1
+                       else {'id': saidas[0][0], 'property': saidas[0][1]},
+            'inputs': valores(dependencia['inputs']),
+            'state': valores(dependencia['state']),
+            'changedPropIds': [f"{e['id']}.{e['property']}" for e in dependencia['inputs']
+                               if (e['id'], e['property']) in alteradas],
+        }
+        status, conteudo = self.requisitar('POST', '/_dash-update-component', rotulo_callback(dependencia), corpo)
+        if status != 200:
+            return set()  # 204: PreventUpdate; erros já registrados
+        mudaram = set()
+        for componente, props in json.loads(conteudo).get('response', {}).items():
+            for propriedade, valor in props.items():
+                if self.estado.get((componente, propriedade)) != valor:
+                    self.estado[(componente, propriedade)] = valor
+                    mudaram.add((componente, propriedade))
+        return mudaram
+
+    def disparar(self, pendentes, alteradas):
+        """Chama os callbacks pendentes e, em cadeia, os que dependem do que mudou.
+
+        Como no renderer, um callback espera os que ainda vão atualizar alguma
+        das suas entradas; a saída de um callback não o dispara de novo.
+        """
+        pendentes = list(pendentes)
+        for _ in range(self.max_cadeia):
+            if not pendentes:
+                return
+            produzidas = {(d['output'], s) for d in pendentes for s in saidas_callback(d)}
+            prontos = [d for d in pendentes
+                       if not any((e['id'], e['property']) == s and saida != d['output']
+                                  for e in d['inputs'] for saida, s in produzidas)] or pendentes[:1]
+            mudaram = set()
+            for dependencia in prontos:
+                mudaram |= self.chamar(dependencia, alteradas)
+            alteradas = alteradas | mudaram
+            restantes = [d for d in pendentes if d not in prontos]
+            novos = [d for d in self.callbacks
+                     if d not in restantes and any((e['id'], e['property']) in mudaram
+                                                   and (e['id'], e['property']) not in saidas_callback(d)
+                                                   for e in d['inputs'])]
+            pendentes = restantes + novos
+
+    def alterar(self, propriedades):
+        """Aplica alterações feitas pelo usuário (ou por um timer) e dispara os callbacks afetados."""
+        self.estado.update(propriedades)
+        alteradas = set(propriedades)
+        self.disparar([d for d in self.callbacks
+                       if any((e['id'], e['property']) in alteradas for e in d['inputs'])], alteradas)
+
+    def trocar_filtro(self):
+        """Escolhe um dropdown e um valor aleatórios entre as opções atuais."""
+        dropdown = self.rnd.choice([d for d in DROPDOWNS if (d, 'options') in self.estado] or [None])
+        if dropdown is None:
+            return
+        opcoes = [o['value'] if isinstance(o, dict) else o for o in self.estado[(dropdown, 'options')] or []]
+        if opcoes:
+            self.alterar({(dropdown, 'value'): self.rnd.choice(opcoes)})
+
+    def executar(self, ate):
+        """Usa o dashboard até o instante `ate` (time.monotonic)."""
+        if not self.abrir():
+            return
+        proximo_tick = time.monotonic() + self.intervalo()
+        while True:
+            agora = time.monotonic()
+            proxima_troca = agora + self.rnd.expovariate(1 / self.pensar)
+            if min(proxima_troca, proximo_tick) >= ate:
+                return
+            if proximo_tick <= proxima_troca:
+                time.sleep(max(0, proximo_tick - agora))
+                n = (self.estado.get(('intervalo-atualizacao', 'n_intervals')) or 0) + 1
+                self.alterar({('intervalo-atualizacao', 'n_intervals'): n})
+                proximo_tick = time.monotonic() + self.intervalo()
+            else:
+                time.sleep(proxima_troca - agora)
+                self.trocar_filtro()
+
+    def intervalo(self):
+        """Segundos até o próximo tick de intervalo-atualizacao."""
+        return (self.estado.get(('intervalo-atualizacao', 'interval')) or 60_000) / 1000 / self.acelerar
+
+
+def executar(url, sessoes=10, duracao=60.0, rampa=5.0, pensar=5.0, acelerar=1.0, semente=0):
+    """Roda `sessoes` sessões virtuais contra `url` por `duracao` segundos; devolve o relatório."""
+    medicoes = Medicoes()
+    inicio = time.monotonic()
+    ate = inicio + rampa + duracao
+    threads = []
+    for i in range(sessoes):
+        sessao = Sessao(url, medicoes, random.Random(semente + i), pensar, acelerar)
+        # As sessões entram aos poucos ao longo da rampa
+        atraso = rampa * i / sessoes
+        thread = threading.Thread(target=lambda s=sessao, a=atraso: (time.sleep(a), s.executar(ate)),
+                                  name=f'sessao-{i}', daemon=True)
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+    relatorio = medicoes.relatorio(time.monotonic() - inicio)
+    relatorio['parametros'] = {'url': url, 'sessoes': sessoes, 'duracao_s': duracao, 'rampa_s': rampa,
+                               'pensar_s': pensar, 'acelerar': acelerar}
+    return relatorio
+
+
+@contextlib.contextmanager
+def servir_localmente(linhas=5_000, latencia_ms=0.0):
+    """Sobe a planilha local e o app.server (werkzeug com threads); devolve a URL do dashboard."""
+    from werkzeug.serving import make_server
+
+    from servidor_planilha import ConfiguracaoFalhas, ServidorPlanilha
+
+    with tempfile.TemporaryDirectory() as diretorio, \
+            ServidorPlanilha(linhas=linhas, configuracao=ConfiguracaoFalhas(latencia_ms=latencia_ms)) as planilha:
+        # Antes de importar o app, que lê a configuração ao ser carregado
+        os.environ['SHEET_URL'] = planilha.url()
+        os.environ.setdefault('DIRETORIO_CACHE', diretorio)
+        import app_v2
+
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)  # uma linha por requisição atrapalharia o relatório
+        servidor = make_server('127.0.0.1', 0, app_v2.server, threaded=True)
+        threading.Thread(target=servidor.serve_forever, daemon=True).start()
+        app_v2.iniciar_dados()
+        try:
+            while app_v2.cache_dados.obter().df.empty:  # esperar a primeira carga
+                time.sleep(0.1)
+            yield f'http://127.0.0.1:{servidor.server_port}'
+        finally:
+            servidor.shutdown()
+            app_v2.cache_dados.parar()
+
+
+def imprimir(relatorio):
+    print(f"\n{relatorio['requisicoes']} requisições em {relatorio['duracao_s']:.1f} s "
+          f"({relatorio['por_segundo']:.1f}/s, {relatorio['erros']} erros)")
+    print(f"{'rótulo':>40} {'req':>6} {'req/s':>7} {'erros':>6} {'p50 (ms)':>9} {'p95 (ms)':>9} {'p99 (ms)':>9}")
+    for rotulo, linha in relatorio['rotulos'].items():
+        print(f"{rotulo[:40]:>40} {linha['requisicoes']:>6} {linha['por_segundo']:>7.2f} {linha['erros']:>6} "
+              f"{linha['p50_ms']:>9.1f} {linha['p95_ms']:>9.1f} {linha['p99_ms']:>9.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Teste de carga com sessões simuladas do dashboard")
+    parser.add_argument('--url', help="dashboard já no ar (sem isso, sobe a planilha e o app localmente)")
+    parser.add_argument('--sessoes', type=int, default=10)
+    parser.add_argument('--duracao', type=float, default=60, help="segundos de carga após a rampa")
+    parser.add_argument('--rampa', type=float, default=5, help="segundos para todas as sessões entrarem")
+    parser.add_argument('--pensar', type=float, default=5, help="média de segundos entre trocas de filtro")
+    parser.add_argument('--acelerar', type=float, default=1, help="divide o intervalo de atualização do store")
+    parser.add_argument('--linhas', type=int, default=5_000, help="linhas da planilha local")
+    parser.add_argument('--latencia-ms', type=float, default=0, help="latência da planilha local")
+    parser.add_argument('--semente', type=int, default=0)
+    parser.add_argument('--saida', help="arquivo JSON para o relatório")
+    argumentos = parser.parse_args()
+
+    with contextlib.ExitStack() as pilha:
+        url = argumentos.url or pilha.enter_context(servir_localmente(argumentos.linhas, argumentos.latencia_ms))
+        relatorio = executar(url, argumentos.sessoes, argumentos.duracao, argumentos.rampa, argumentos.pensar,
+                             argumentos.acelerar, argumentos.semente)
+    imprimir(relatorio)
+    if argumentos.saida:
+        with open(argumentos.saida, 'w', encoding='utf-8') as arquivo:
+            json.dump(relatorio, arquivo, indent=2, ensure_ascii=False)